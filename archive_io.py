@@ -0,0 +1,150 @@
+import os
+import io
+import json
+import time
+import tarfile
+import zipfile
+import threading
+from collections import namedtuple
+
+# ==========================================
+# Archive I/O (อ่าน input จาก tar/zip และเขียน output ลง tar shard)
+# ==========================================
+# dataset ที่มาเป็น tar/zip ของรูปเล็กๆ หลายล้านรูป: อ่านทีละ member ตามลำดับใน archive แล้ว decode จาก memory
+# (ไม่แตกไฟล์ลง disk) ส่วน output เขียนต่อท้ายลง tar ก้อนใหญ่ (shard) แทนการสร้างไฟล์เล็กทีละไฟล์
+# ชื่อของรูปใน archive / crop ใน shard เขียนเป็น "<archive>::<ชื่อ member>" (ใช้ใน log / ผลลัพธ์)
+
+ARCHIVE_EXTS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip')
+MEMBER_SEP = "::"
+
+DEFAULT_SHARD_MB = 1024
+
+# path = "<archive>::<member>", data = bytes ของไฟล์, error = ข้อความถ้าอ่าน archive ไม่ได้ (data เป็น None)
+ArchiveMember = namedtuple("ArchiveMember", ["path", "data", "error"], defaults=(None,))
+
+
+def is_archive(path):
+    return isinstance(path, str) and path.lower().endswith(ARCHIVE_EXTS)
+
+
+def is_member(path):
+    return MEMBER_SEP in path
+
+
+def member_path(archive, name):
+    return f"{archive}{MEMBER_SEP}{name}"
+
+
+def source_name(source):
+    """ชื่อของ input (path ของไฟล์ หรือ "<archive>::<member>")"""
+    return source.path if isinstance(source, ArchiveMember) else source
+
+
+def archive_path(path):
+    """ไฟล์จริงของ input: "<archive>::<member>" -> <archive> (path อื่นคืนตามเดิม)"""
+    return path.split(MEMBER_SEP, 1)[0]
+
+
+def iter_members(path, exts, skip=None):
+    """
+    generator ของ ArchiveMember ของไฟล์ที่นามสกุลอยู่ใน exts ตามลำดับใน archive
+    tar อ่านแบบ stream (ไม่ seek ไม่ต้องอ่าน index ทั้งไฟล์ก่อน) อ่าน archive ไม่ได้ -> yield ตัวที่มี error 1 ตัว
+    skip(member_path) = True -> ข้าม member นั้น (ไม่อ่าน bytes ออกมา) เช่นตัวที่ manifest บอกว่าทำแล้ว
+    """
+    try:
+        if path.lower().endswith('.zip'):
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(exts):
+                        name = member_path(path, info.filename)
+                        if skip is None or not skip(name):
+                            yield ArchiveMember(name, zf.read(info))
+        else:
+            with tarfile.open(path, "r|*") as tf:
+                for m in tf:
+                    if m.isfile() and m.name.lower().endswith(exts):
+                        name = member_path(path, m.name)
+                        if skip is None or not skip(name):
+                            yield ArchiveMember(name, tf.extractfile(m).read())
+    except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile) as e:
+        yield ArchiveMember(path, None, f"Cannot read archive: {e}")
+
+
+def iter_sources(paths, exts, skip=None):
+    """แตก archive ใน paths ออกเป็น ArchiveMember ทีละตัว (path / ArchiveMember อื่นส่งต่อตามเดิม)"""
+    for path in paths:
+        if is_archive(path):
+            yield from iter_members(path, exts, skip)
+        else:
+            yield path
+
+
+class ShardWriter:
+    """
+    เขียน crop ต่อท้ายลง tar ใน output_dir: <prefix>-000000.tar, <prefix>-000001.tar, ...
+    ขึ้น shard ใหม่เมื่อขนาดถึง max_bytes  แต่ละ crop มี 2 member ชื่อเดียวกัน (แบบ WebDataset):
+    <key><นามสกุลรูป> + <key>.json (กรอบ crop / ที่มา) key = path ของ output เทียบกับ output_dir (ไม่มีนามสกุล)
+    เรียก add() จากหลาย thread ได้ (เขียนทีละ crop ตามลำดับที่เข้ามา)
+    """
+
+    def __init__(self, output_dir, prefix="crops", max_bytes=DEFAULT_SHARD_MB * 1024 * 1024):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_bytes = max(1, int(max_bytes))
+        self._lock = threading.Lock()
+        self._tar = None
+        self._path = None
+        self._index = self._next_index()
+        self.shards = []
+        self.count = 0
+
+    def _next_index(self):
+        """ต่อเลขจาก shard ที่มีอยู่แล้ว (รันซ้ำใน output เดิมไม่เขียนทับ)"""
+        start = f"{self.prefix}-"
+        indexes = []
+        if os.path.isdir(self.output_dir):
+            for name in os.listdir(self.output_dir):
+                number = name[len(start):-len(".tar")]
+                if name.startswith(start) and name.endswith(".tar") and number.isdigit():
+                    indexes.append(int(number))
+        return max(indexes) + 1 if indexes else 0
+
+    def _open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._path = os.path.join(self.output_dir, f"{self.prefix}-{self._index:06d}.tar")
+        self._index += 1
+        self._tar = tarfile.open(self._path, "w")
+        self.shards.append(self._path)
+
+    def _add_bytes(self, name, data, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = mtime
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def add(self, save_path, data, meta=None):
+        """
+        เพิ่ม crop 1 รูป (save_path = path ที่จะได้ถ้าเขียนเป็นไฟล์ ใช้ตั้งชื่อ key)
+        คืนค่า "<shard>::<member>" ของรูป
+        """
+        rel = os.path.relpath(save_path, self.output_dir).replace(os.sep, "/")
+        key, ext = os.path.splitext(rel)
+        sidecar = json.dumps(meta or {}, ensure_ascii=False).encode("utf-8")
+        now = time.time()
+        with self._lock:
+            if self._tar is None or self._tar.fileobj.tell() >= self.max_bytes:
+                self.close_shard()
+                self._open()
+            self._add_bytes(key + ext, data, now)
+            self._add_bytes(key + ".json", sidecar, now)
+            self.count += 1
+            return member_path(self._path, key + ext)
+
+    def close_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+
+    def close(self):
+        with self._lock:
+            self.close_shard()
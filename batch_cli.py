@@ -0,0 +1,515 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import multiprocessing as mp
+
+# ==========================================
+# Headless batch runner (ไม่ต้องเปิด GUI)
+# ==========================================
+# ตัวอย่าง:
+#   python batch_cli.py D:/photos -o D:/out --model "General(yolov8n)" --class-id 0 --ratio 4:5 --workers 4
+#   python -m crop_logic D:/photos -o D:/out --ratio "9:16 (Story/TikTok)"
+#   python batch_cli.py D:/shards/*.tar -o D:/out --shards     (อ่านจาก tar/zip, เขียนลง tar shard)
+#
+# แบ่งไฟล์เป็น chunk แล้วกระจายให้ process pool, แต่ละ process โหลด AICropper ครั้งเดียว
+# tar/zip ถูกอ่านแบบ stream ที่ process หลัก แล้วแจกรูปข้างใน (bytes) เป็น chunk ให้ทุก worker
+# และจำกัดจำนวน thread ของ torch / onnxruntime (--threads) เพื่อไม่ให้ N process แย่ง core กันเอง
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_JSON = os.path.join(BASE_DIR, 'config', 'models_list.json')
+
+# ตัวแปรประจำ worker process (ถูกสร้างใน _init_worker)
+_worker = {}
+
+
+def load_models(json_path=MODELS_JSON):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def resolve_path(path):
+    """path ใน config เป็น relative กับโฟลเดอร์โปรแกรม (ถ้าหาจาก cwd ไม่เจอ)"""
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+    return os.path.join(BASE_DIR, path)
+
+
+def resolve_model(value):
+    """
+    รับชื่อโมเดลใน models_list.json หรือ path ของไฟล์ .pt / .onnx ตรงๆ
+    คืนค่า (path, backend) backend มาจากช่อง "backend" ใน models_list.json
+    """
+    from detectors import DEFAULT_BACKEND
+
+    models = load_models()
+    if value is None:
+        if not models:
+            raise ValueError("models_list.json is empty")
+        return resolve_path(models[0]['path']), models[0].get('backend', DEFAULT_BACKEND)
+    for m in models:
+        if value in (m['name'], m['path']):
+            return resolve_path(m['path']), m.get('backend', DEFAULT_BACKEND)
+    if os.path.exists(value):
+        return value, ("onnx" if value.lower().endswith(".onnx") else DEFAULT_BACKEND)
+    names = ", ".join(m['name'] for m in models)
+    raise ValueError(f"Unknown model '{value}' (available: {names})")
+
+
+def parse_ratio(value):
+    """รับได้ทั้งชื่อใน RATIO_MAP, รูปแบบ 'w:h', ตัวเลขทศนิยม หรือ 'free'"""
+    from crop_logic import RATIO_MAP
+
+    if value is None or value.lower() in ('free', 'none'):
+        return None
+    if value in RATIO_MAP:
+        return RATIO_MAP[value]
+    for key, ratio in RATIO_MAP.items():
+        if key.split(' ')[0] == value:
+            return ratio
+    if ':' in value:
+        w, h = value.split(':', 1)
+        return float(w) / float(h)
+    return float(value)
+
+
+def parse_variant(value):
+    """
+    --variant "RATIO[,PADDING[,SUBFOLDER[,SUFFIX]]]" เช่น "4:5,15" / "9:16,10,story" / "1:1,20,,_sq"
+    ถ้าไม่ระบุ padding ใช้ค่าจาก --padding (คืน None ไว้ก่อน)
+    """
+    parts = [p.strip() for p in value.split(',')]
+    ratio_text = parts[0]
+    padding = int(parts[1]) if len(parts) > 1 and parts[1] else None
+    subfolder = parts[2] if len(parts) > 2 else None
+    suffix = parts[3] if len(parts) > 3 else ""
+    return ratio_text, padding, subfolder, suffix
+
+
+def build_specs(args):
+    """สร้าง list ของ CropSpec จาก --variant (หรือ --ratio/--padding ถ้าไม่ได้ระบุ --variant)"""
+    from crop_logic import CropSpec, ratio_folder_name
+
+    if not args.variant:
+        return [CropSpec(parse_ratio(args.ratio), args.padding)]
+
+    specs = []
+    for value in args.variant:
+        ratio_text, padding, subfolder, suffix = parse_variant(value)
+        if padding is None:
+            padding = args.padding
+        if subfolder is None:
+            # หลาย variant แยกโฟลเดอร์ตามสัดส่วนให้อัตโนมัติ (ถ้าไม่ได้ตั้ง suffix ไว้)
+            subfolder = "" if suffix or len(args.variant) == 1 else ratio_folder_name(ratio_text)
+        specs.append(CropSpec(parse_ratio(ratio_text), padding, suffix, subfolder))
+    return specs
+
+
+def parse_class_ids(text):
+    """'0' -> 0, '0,16' -> [0, 16]"""
+    try:
+        ids = [int(part) for part in str(text).split(",") if part.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid class id list '{text}'")
+    if not ids:
+        raise ValueError("No class id given")
+    return ids[0] if len(ids) == 1 else ids
+
+
+def collect_inputs(inputs, recursive=False, videos=False, archives=False):
+    from archive_io import ARCHIVE_EXTS
+    from crop_logic import IMAGE_EXTS, VIDEO_EXTS
+
+    exts = IMAGE_EXTS + VIDEO_EXTS if videos else IMAGE_EXTS
+    if archives:
+        exts += ARCHIVE_EXTS
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            if recursive:
+                for root, _, names in os.walk(path):
+                    files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(exts))
+            else:
+                files.extend(os.path.join(path, n) for n in sorted(os.listdir(path)) if n.lower().endswith(exts))
+        elif path.lower().endswith(exts):
+            files.append(path)
+    return files
+
+
+def iter_chunks(files, chunk_size, skip=None):
+    """
+    generator ของ chunk ละ chunk_size รายการ archive ถูกแตกเป็น ArchiveMember (มี bytes แล้ว) ตรงนี้
+    archive ก้อนเดียวจึงกระจายได้ทุก worker  skip(member_path) = True -> ข้ามรูปนั้น (ไม่อ่าน bytes)
+    """
+    from archive_io import iter_sources
+    from crop_logic import IMAGE_EXTS
+
+    chunk = []
+    for source in iter_sources(files, IMAGE_EXTS, skip):
+        chunk.append(source)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(model_path, device, threads, batch_size, settings, cache_opts, reduced_decode, backend):
+    # ต้องตั้งก่อน torch สร้าง thread pool ของตัวเอง
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+
+    import cv2
+    from crop_logic import AICropper
+    from detect_cache import DetectionCache
+
+    cv2.setNumThreads(1)
+
+    # จำนวน thread ตั้งที่ตัว detector: torch ถูก import เฉพาะ backend torch (onnx ไม่ต้องมี torch ใน worker)
+    cache = DetectionCache(**cache_opts) if cache_opts is not None else None
+    _worker['cropper'] = AICropper(model_path, batch_size=batch_size, device=device, cache=cache,
+                                   reduced_decode=reduced_decode, backend=backend, threads=threads)
+    _worker['cropper'].configure(cache=cache, reduced_decode=reduced_decode, tiling=settings.get('tiling'),
+                                 predict_args=settings['predict_args'], cascade=settings['cascade'],
+                                 dedup_threshold=settings['dedup'])
+    _worker['settings'] = settings
+    _worker['sink'] = None
+    if settings['shard_mb']:
+        from multiprocessing.util import Finalize
+        from archive_io import ShardWriter
+
+        # shard แยกต่อ process (ไม่เขียน tar เดียวกันพร้อมกัน) ปิดตอน worker จบ (main ต้อง close/join pool)
+        sink = ShardWriter(settings['output_dir'], f"crops-{os.getpid()}", settings['shard_mb'] * 1024 * 1024)
+        Finalize(sink, sink.close, exitpriority=10)
+        _worker['sink'] = sink
+
+
+def _run_chunk(file_paths):
+    from pipeline import CropPipeline
+    from metrics import StageMetrics
+    from encoder import Encoder
+    from archive_io import source_name
+    from manifest import RecordCollector
+    from video import VideoCropper, is_video
+
+    s = _worker['settings']
+    cache = _worker['cropper'].cache
+    # metrics แยกต่อ chunk แล้วส่ง state กลับไปรวมที่ process หลัก
+    metrics = StageMetrics() if s.get('metrics') else None
+    _worker['cropper'].metrics = metrics
+    results = []
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    stats_before = dict(_worker['cropper'].stats)
+
+    # record ของ manifest (stat + sha1) ทำใน worker: process หลักแค่เขียนต่อท้ายไฟล์ ไม่ต้องอ่าน input ซ้ำ
+    records = RecordCollector() if s['resume'] else None
+
+    def on_result(file_path, outputs):
+        results.append((file_path, outputs))
+
+    specs = s['specs']
+    images = [f for f in file_paths if not is_video(source_name(f))]
+    videos = [f for f in file_paths if is_video(source_name(f))]
+    if images:
+        pipeline = CropPipeline(_worker['cropper'], s['output_dir'], specs[0].ratio, specs[0].padding, s['class_id'],
+                                decode_workers=1, write_workers=1, specs=specs, encoder=Encoder(s['encode']),
+                                instances=s['instances'], sink=_worker['sink'], manifest=records)
+        pipeline.run(images, on_result=on_result)
+    if videos:
+        video_cropper = VideoCropper(_worker['cropper'], specs, s['class_id'], s['video_stride'], s['smoothing'])
+        for file_path in videos:
+            outputs = video_cropper.process(file_path, s['output_dir'])
+            if metrics is not None:
+                metrics.record_outputs(outputs)
+            if records is not None:
+                records.record(file_path, outputs)
+            on_result(file_path, outputs)
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    stats = {k: v - stats_before[k] for k, v in _worker['cropper'].stats.items()}
+    return (os.getpid(), results, hits, misses, (metrics.state() if metrics else None), stats,
+            records.take() if records is not None else [])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AI Smart Crop - headless batch mode")
+    parser.add_argument("inputs", nargs="+", help="Image/video files or folders")
+    parser.add_argument("-o", "--output", default=os.path.join(os.getcwd(), "output"), help="Output folder")
+    parser.add_argument("--model", default=None, help="Model name from config/models_list.json or a .pt path (default: first entry)")
+    parser.add_argument("--class-id", default="0",
+                        help="Target class id, or a comma list like 0,16 (default: 0). Other classes are dropped "
+                             "inside the detector")
+    parser.add_argument("--conf", type=float, default=None, help="Minimum detection confidence (default: model default 0.25)")
+    parser.add_argument("--max-det", type=int, default=None, help="Max detections per image (default: 300)")
+    parser.add_argument("--all-instances", action="store_true",
+                        help="Write every matching instance as <name>_<class>_<idx> instead of only the largest one")
+    parser.add_argument("--top-k", type=int, default=0, help="With --all-instances: keep only the first K (default: all)")
+    parser.add_argument("--rank", choices=("area", "conf"), default="area",
+                        help="With --all-instances: order instances by box area or confidence (default: area)")
+    parser.add_argument("--ratio", default="3:4", help="Ratio name from RATIO_MAP, 'w:h', a number, or 'free' (default: 3:4)")
+    parser.add_argument("--padding", type=int, default=15, help="Padding percent (default: 15)")
+    parser.add_argument("--variant", action="append", default=None, metavar="RATIO[,PAD[,SUBFOLDER[,SUFFIX]]]",
+                        help="Extra output format, repeatable. One detection pass writes every variant "
+                             "(overrides --ratio)")
+    parser.add_argument("--format", choices=("keep", "jpeg", "png", "webp"), default="keep",
+                        help="Output format (default: keep the input's format)")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG/WebP quality 1-100 (default: 95)")
+    parser.add_argument("--png-compression", type=int, default=1, help="PNG compression 0-9 (default: 1, fast)")
+    parser.add_argument("--max-dim", type=int, default=0, help="Downscale crops whose long side exceeds this (default: off)")
+    parser.add_argument("--no-copy", action="store_true",
+                        help="Always re-encode, even when the crop covers the whole image")
+    parser.add_argument("--video-stride", type=int, default=5,
+                        help="Videos: run detection every N frames and interpolate in between (default: 5)")
+    parser.add_argument("--smoothing", type=float, default=0.8,
+                        help="Videos: crop window smoothing 0 (follow instantly) - 0.95 (default: 0.8)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Scan input folders recursively")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count / threads)")
+    parser.add_argument("--threads", type=int, default=None, help="Torch / ONNX Runtime intra-op threads per worker (default: CPU count / workers)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Images per predict call")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Files handed to a worker at a time")
+    parser.add_argument("--device", default=None, help="cpu, cuda, cuda:1 ... (default: auto)")
+    parser.add_argument("--backend", choices=("torch", "onnx"), default=None,
+                        help="Detector backend (default: the model's \"backend\" in models_list.json, else torch)")
+    parser.add_argument("--reduced-decode", action="store_true",
+                        help="Detect on a reduced-size JPEG decode, crop from full-resolution pixels")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Detect at a small input size first and re-run at full size only when the target is "
+                             "missing or below --cascade-conf")
+    parser.add_argument("--cascade-imgsz", type=int, default=320, help="Input size of the cheap pass (default: 320)")
+    parser.add_argument("--cascade-conf", type=float, default=0.5,
+                        help="Min confidence for the cheap pass to be accepted (default: 0.5)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Reuse the detection of an already-processed near-identical image (perceptual hash) "
+                             "instead of running the model again")
+    parser.add_argument("--dedup-threshold", type=int, default=5,
+                        help="Max hash distance (of 64 bits) to count as a duplicate (default: 5)")
+    parser.add_argument("--shards", action="store_true",
+                        help="Append crops (plus a .json sidecar with the box) to size-rotated tar shards in the "
+                             "output folder instead of writing one file per crop")
+    parser.add_argument("--shard-size-mb", type=int, default=1024, help="Start a new shard after this size (default: 1024)")
+    parser.add_argument("--tile", action="store_true",
+                        help="Detect very large images in overlapping tiles and crop from the file without a full decode "
+                             "where possible (uncompressed BMP is memory-mapped)")
+    parser.add_argument("--tile-size", type=int, default=1024, help="Tile side in pixels (default: 1024)")
+    parser.add_argument("--tile-overlap", type=float, default=0.2, help="Overlap between tiles, 0-0.5 (default: 0.2)")
+    parser.add_argument("--tile-min-mp", type=float, default=50, help="Only tile images of at least this many megapixels (default: 50)")
+    parser.add_argument("--memory-limit-mb", type=int, default=2048,
+                        help="Max decoded pixels held at once per worker when tiling (default: 2048)")
+    parser.add_argument("--cache-dir", default=None, help="Detection cache folder (default: ./cache next to the program)")
+    parser.add_argument("--cache-size-mb", type=int, default=64, help="Max detection cache size in MB (default: 64)")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the model, do not read/write the detection cache")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Process every input even if the output folder manifest says it is already done")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-process inputs that failed in a previous run")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Write per-stage timings and outcome counters here while running "
+                             "(.prom/.txt = Prometheus text format, otherwise JSON)")
+    return parser
+
+
+def plan_workers(workers, threads, cpu_count):
+    """แบ่ง core ให้ process/threads โดยที่ workers * threads ไม่เกินจำนวน core"""
+    if workers is None and threads is None:
+        threads = 1 if cpu_count >= 4 else cpu_count
+    if workers is None:
+        workers = max(1, cpu_count // threads)
+    if threads is None:
+        threads = max(1, cpu_count // workers)
+    return max(1, workers), max(1, threads)
+
+
+def main(argv=None):
+    from crop_logic import (DEFAULT_BATCH_SIZE, DEFAULT_IMGSZ, CascadeOptions, InstanceOptions, detect_settings,
+                            RUN_STATS, format_cascade, format_dedup, predict_settings)
+    from detect_cache import DEFAULT_CACHE_DIR
+    from detectors import detector_signature
+    from manifest import RunManifest, settings_key
+    from encoder import EncodeOptions
+    from tiling import TileOptions
+    from archive_io import is_archive
+
+    args = build_parser().parse_args(argv)
+
+    try:
+        model_path, backend = resolve_model(args.model)
+        backend = args.backend or backend
+        specs = build_specs(args)
+        class_id = parse_class_ids(args.class_id)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+
+    files = collect_inputs(args.inputs, args.recursive, videos=True, archives=True)
+    if not files:
+        print("No images or videos found.")
+        return 1
+
+    cpu_count = os.cpu_count() or 1
+    workers, threads = plan_workers(args.workers, args.threads, cpu_count)
+    batch_size = args.batch_size or DEFAULT_BATCH_SIZE
+    chunk_size = max(1, args.chunk_size)
+    os.makedirs(args.output, exist_ok=True)
+
+    predict_args = predict_settings(class_id, args.conf, args.max_det)
+    instances = InstanceOptions(max(0, args.top_k), args.rank) if args.all_instances else None
+    cascade = CascadeOptions(args.cascade_imgsz, args.cascade_conf) if args.cascade else None
+    encode_options = EncodeOptions(args.format, args.quality, args.png_compression, args.max_dim, not args.no_copy)
+    settings = {
+        "output_dir": args.output,
+        "specs": specs,
+        "class_id": class_id,
+        "predict_args": predict_args,
+        "instances": instances,
+        "cascade": cascade,
+        "dedup": max(0, args.dedup_threshold) if args.dedup else None,
+        "metrics": args.metrics_file is not None,
+        "encode": encode_options,
+        "tiling": TileOptions(args.tile_size, min(max(args.tile_overlap, 0.0), 0.5), int(args.tile_min_mp * 1_000_000),
+                              args.memory_limit_mb) if args.tile else None,
+        "video_stride": args.video_stride,
+        "smoothing": args.smoothing,
+        "shard_mb": max(1, args.shard_size_mb) if args.shards else None,
+        "resume": not args.no_resume,
+    }
+    cache_opts = None
+    if not args.no_cache:
+        cache_opts = {"cache_dir": args.cache_dir or DEFAULT_CACHE_DIR,
+                      "max_bytes": args.cache_size_mb * 1024 * 1024}
+
+    # manifest อยู่ที่ process หลักเท่านั้น: กรองไฟล์ก่อนแบ่ง chunk และเขียน record ที่ worker สร้างส่งกลับมา
+    manifest = None
+    skipped = 0
+    if not args.no_resume:
+        # ต้องตรงกับ AICropper.cache_settings() ให้ key เท่ากับฝั่ง GUI
+        key = settings_key(detector_signature(model_path, backend),
+                           detect_settings(predict_args, args.reduced_decode, cascade),
+                           specs, class_id, encode_options, instances)
+        manifest = RunManifest(args.output, key, retry_failed=args.retry_failed)
+        files, done_files = manifest.filter(files)
+        skipped = len(done_files)
+
+    if backend == "onnx":
+        from detectors import export_onnx
+        # export ครั้งเดียวที่ process หลัก ไม่ให้ worker หลายตัว export ทับกัน
+        export_onnx(model_path)
+
+    print(f"Model: {model_path} ({backend})")
+    if len(specs) > 1:
+        print(f"Variants: {len(specs)} per image")
+    if skipped:
+        print(f"Skipped: {skipped} (already done, use --no-resume to redo)")
+    if not files:
+        print("Nothing to do.")
+        manifest.close()
+        return 0
+    has_archives = any(is_archive(f) for f in files)
+    print(f"Files: {len(files)}{' (archives are split by image)' if has_archives else ''} | "
+          f"Workers: {workers} x {threads} thread(s) | Batch: {batch_size} | Chunk: {chunk_size}")
+
+    # รูปใน archive ที่ทำแล้ว: ข้ามตอนอ่าน (archive ต้องอ่านผ่านทั้งก้อนอยู่ดี แต่ไม่ต้องส่ง bytes ให้ worker)
+    member_skipped = 0
+
+    def skip_member(path):
+        nonlocal member_skipped
+        if manifest is not None and manifest.is_done(path):
+            member_skipped += 1
+            return True
+        return False
+
+    # imap อ่าน iterable ล่วงหน้าไม่จำกัด: กั้นจำนวน chunk ที่ค้างอยู่ (bytes ของ archive) ไม่ให้กิน memory หมด
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def chunks():
+        for chunk in iter_chunks(files, chunk_size, skip_member):
+            slots.acquire()
+            yield chunk
+
+    metrics = None
+    if args.metrics_file:
+        from metrics import StageMetrics
+        metrics = StageMetrics()
+
+    ok, failed, written = 0, 0, 0
+    reasons = {}
+    per_worker = {}
+    cache_hits, cache_misses = 0, 0
+    run_stats = dict.fromkeys(RUN_STATS, 0)
+    # รูปใน archive รู้จำนวนตอนอ่านเท่านั้น
+    total = "?" if has_archives else len(files)
+    start = time.perf_counter()
+
+    # ใช้ spawn เสมอ: fork หลังจาก import torch/CUDA แล้วไม่ปลอดภัย
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(workers, initializer=_init_worker,
+                  initargs=(model_path, args.device, threads, batch_size, settings, cache_opts, args.reduced_decode, backend)) as pool:
+        for pid, results, hits, misses, chunk_metrics, chunk_stats, records in pool.imap_unordered(_run_chunk, chunks()):
+            slots.release()
+            cache_hits += hits
+            cache_misses += misses
+            for k, v in chunk_stats.items():
+                run_stats[k] += v
+            if metrics is not None:
+                metrics.merge(chunk_metrics)
+                metrics.write(args.metrics_file)
+            if manifest is not None:
+                for rec in records:
+                    manifest.add(rec)
+            for file_path, outputs in results:
+                statuses = [status for _, status in outputs]
+                written += statuses.count("OK")
+                if all(status == "OK" for status in statuses):
+                    ok += 1
+                    continue
+                failed += 1
+                for status in set(statuses) - {"OK"}:
+                    reasons[status] = reasons.get(status, 0) + 1
+            per_worker[pid] = per_worker.get(pid, 0) + len(results)
+
+            done = ok + failed
+            rate = done / max(time.perf_counter() - start, 1e-9)
+            print(f"\r[{done}/{total}] {rate:.1f} img/s", end="", flush=True)
+        # ปิด pool แบบรอ worker จบเอง (ไม่ terminate) ให้ Finalize ปิด tar shard ได้ครบ
+        pool.close()
+        pool.join()
+
+    if manifest is not None:
+        manifest.close()
+    skipped += member_skipped
+
+    elapsed = time.perf_counter() - start
+    done = ok + failed
+    print()
+    print("=" * 40)
+    print(f"Processed : {done} images in {elapsed:.1f}s")
+    print(f"Throughput: {done / max(elapsed, 1e-9):.2f} img/s ({workers} worker(s))")
+    print(f"OK        : {ok}")
+    print(f"Failed    : {failed}")
+    if skipped:
+        print(f"Skipped   : {skipped}")
+    if len(specs) > 1 or instances is not None:
+        print(f"Outputs   : {written} file(s) across {len(specs)} variant(s)")
+    for status, count in sorted(reasons.items(), key=lambda kv: -kv[1]):
+        print(f"  - {status}: {count}")
+    if cache_opts is not None:
+        looked_up = cache_hits + cache_misses
+        rate = (cache_hits / looked_up * 100) if looked_up else 0.0
+        print(f"Detection cache: {cache_hits} hit(s), {cache_misses} miss(es) ({rate:.0f}% hit)")
+    if cascade is not None:
+        print(format_cascade(run_stats["cascade_cheap"], run_stats["cascade_full"], cascade.imgsz, DEFAULT_IMGSZ))
+    if settings["dedup"] is not None:
+        print(format_dedup(run_stats["dedup_saved"], settings["dedup"]))
+    if metrics is not None:
+        metrics.write(args.metrics_file)
+        print("Stage timings:")
+        for line in metrics.summary_lines():
+            print(f"  {line}")
+        print(f"Metrics   : {args.metrics_file}")
+    for pid, count in sorted(per_worker.items()):
+        print(f"  worker {pid}: {count} images")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
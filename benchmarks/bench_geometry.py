@@ -0,0 +1,149 @@
+"""
+Microbenchmark: crop geometry แบบ loop ต่อกรอบ (ของเดิม) เทียบกับ crop_geometry (NumPy)
+
+    python benchmarks/bench_geometry.py
+    python benchmarks/bench_geometry.py --images 20000 --boxes 300 --specs 4
+
+ตรวจด้วยว่าผลลัพธ์ (กรอบ crop + status) ตรงกับ loop เดิมทุกรูปทุก spec (ทั้ง NumPy 1.x และ 2)
+ถ้าไม่ตรงแม้แต่กรอบเดียว จะจบด้วย exit code 1
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crop_geometry  # noqa: E402
+
+
+def reference_crop(boxes, classes, w_img, h_img, target_ratio, padding_percent, target_class_id):
+    """loop เดิมจาก AICropper.crop_image (คืนกรอบแทนรูป) ใช้เป็นคำตอบอ้างอิง"""
+    pad_factor = padding_percent / 100.0
+    if len(boxes) == 0:
+        return None, crop_geometry.STATUS_NO_DETECTION
+
+    target_boxes = []
+    for box, cls in zip(boxes, classes):
+        if int(cls) == int(target_class_id):
+            target_boxes.append(box)
+    if not target_boxes:
+        return None, crop_geometry.STATUS_CLASS_NOT_FOUND
+
+    best_box = None
+    max_area = 0
+    for box in target_boxes:
+        x1, y1, x2, y2 = box
+        area = (x2 - x1) * (y2 - y1)
+        if area > max_area:
+            max_area = area
+            best_box = box
+    if best_box is None:
+        return None, crop_geometry.STATUS_DETECTION_FAILED
+
+    min_x, min_y, max_x, max_y = best_box
+    box_w = max_x - min_x
+    box_h = max_y - min_y
+    pad_x = box_w * pad_factor
+    pad_y = box_h * pad_factor
+
+    base_x1 = max(0, min_x - pad_x)
+    base_y1 = max(0, min_y - pad_y)
+    base_x2 = min(w_img, max_x + pad_x)
+    base_y2 = min(h_img, max_y + pad_y)
+
+    if target_ratio is None:
+        crop_x1, crop_y1, crop_x2, crop_y2 = base_x1, base_y1, base_x2, base_y2
+    else:
+        current_w = base_x2 - base_x1
+        current_h = base_y2 - base_y1
+        current_ratio = current_w / current_h
+        center_x = base_x1 + (current_w / 2)
+        center_y = base_y1 + (current_h / 2)
+        if current_ratio > target_ratio:
+            new_w = current_w
+            new_h = current_w / target_ratio
+        else:
+            new_h = current_h
+            new_w = current_h * target_ratio
+        crop_x1 = center_x - (new_w / 2)
+        crop_y1 = center_y - (new_h / 2)
+        crop_x2 = center_x + (new_w / 2)
+        crop_y2 = center_y + (new_h / 2)
+
+    final = (int(max(0, crop_x1)), int(max(0, crop_y1)), int(min(w_img, crop_x2)), int(min(h_img, crop_y2)))
+    if final[2] <= final[0] or final[3] <= final[1]:
+        return None, crop_geometry.STATUS_TOO_SMALL
+    return final, crop_geometry.STATUS_OK
+
+
+def make_batch(rng, n_images, max_boxes, n_classes):
+    sizes = np.stack([rng.integers(480, 6000, n_images), rng.integers(480, 6000, n_images)], axis=1)
+    counts = rng.integers(0, max_boxes + 1, n_images)
+    image_index = np.repeat(np.arange(n_images), counts)
+    n = image_index.size
+    h = sizes[image_index, 0]
+    w = sizes[image_index, 1]
+    x1 = rng.random(n) * w
+    y1 = rng.random(n) * h
+    bw = rng.random(n) * (w - x1)
+    bh = rng.random(n) * (h - y1)
+    boxes = np.stack([x1, y1, x1 + bw, y1 + bh], axis=1).astype(np.float32)
+    classes = rng.integers(0, n_classes, n).astype(np.float32)
+    return boxes, classes, image_index, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crop geometry microbenchmark")
+    parser.add_argument("--images", type=int, default=5000)
+    parser.add_argument("--boxes", type=int, default=50, help="Max boxes per image (crowd scenes: 300+)")
+    parser.add_argument("--specs", type=int, default=4, help="Ratio/padding specs per image")
+    parser.add_argument("--classes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-reference", action="store_true", help="Only time the vectorized engine")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    boxes, classes, image_index, sizes = make_batch(rng, args.images, args.boxes, args.classes)
+    all_ratios = [None, 1.0, 4 / 5, 9 / 16, 16 / 9, 3 / 4, 2 / 3, 21 / 9]
+    ratios = [all_ratios[i % len(all_ratios)] for i in range(args.specs)]
+    paddings = [(15 + 5 * i) % 50 for i in range(args.specs)]
+    target = 0
+
+    print(f"Images: {args.images} | Boxes: {boxes.shape[0]} (max {args.boxes}/image) | Specs: {args.specs}")
+
+    t0 = time.perf_counter()
+    rects, status = crop_geometry.batch_crop_rects(
+        boxes, classes, image_index, sizes, target, crop_geometry.ratios_array(ratios), paddings)
+    t_vec = time.perf_counter() - t0
+    print(f"Vectorized : {t_vec * 1000:9.1f} ms  ({args.images * args.specs / max(t_vec, 1e-9):,.0f} crops/s)")
+
+    if args.skip_reference:
+        return 0
+
+    # แบ่ง boxes ตามรูปไว้ก่อน (ไม่นับเวลาส่วนนี้)
+    starts = np.r_[0, np.cumsum(np.bincount(image_index, minlength=args.images))]
+    per_image = [(boxes[starts[i]:starts[i + 1]], classes[starts[i]:starts[i + 1]]) for i in range(args.images)]
+
+    t0 = time.perf_counter()
+    mismatches = 0
+    for i, (b, c) in enumerate(per_image):
+        h_img, w_img = int(sizes[i, 0]), int(sizes[i, 1])
+        for j, (ratio, pad) in enumerate(zip(ratios, paddings)):
+            rect, code = reference_crop(b, c, w_img, h_img, ratio, pad, target)
+            if code != status[i, j] or (rect is not None and tuple(rects[i, j].tolist()) != rect):
+                mismatches += 1
+    t_ref = time.perf_counter() - t0
+    print(f"Loop (old) : {t_ref * 1000:9.1f} ms  ({args.images * args.specs / max(t_ref, 1e-9):,.0f} crops/s)")
+    print(f"Speed-up   : {t_ref / max(t_vec, 1e-9):.1f}x")
+    print(f"Mismatches : {mismatches} / {args.images * args.specs}")
+    if mismatches:
+        print("FAILED: vectorized crop rects differ from the loop")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Benchmark: decode -> detect -> crop -> write ครบทั้งเส้นทาง (เหมือนที่ WorkerThread / batch_cli ใช้)
+
+    python benchmarks/bench_pipeline.py                                  # stub detector, ไม่ต้องมีไฟล์โมเดล
+    python benchmarks/bench_pipeline.py --sizes 640x480,4000x3000 --count 200 --stub-delay-ms 15
+    python benchmarks/bench_pipeline.py --model models/yolov8n.pt        # ใช้โมเดลจริง
+    python benchmarks/bench_pipeline.py --mode sequential                # ทีละรูป (เทียบกับ pipeline)
+
+รูปทดสอบสร้างจาก seed (ได้รูปเดิมทุกครั้ง) เก็บไว้ใน benchmarks/.data แล้วใช้ซ้ำ + cat.jpg เป็นรูปจริง
+ผลลัพธ์เขียนเป็น JSON ใน benchmarks/results/ (มี commit hash) ไว้เทียบข้าม commit
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from crop_logic import AICropper, CropSpec  # noqa: E402
+from pipeline import CropPipeline, output_path  # noqa: E402
+
+DATA_DIR = os.path.join(ROOT, "benchmarks", ".data")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SAMPLE = os.path.join(ROOT, "cat.jpg")
+
+
+# ------------------------------------------
+# Synthetic images
+# ------------------------------------------
+def parse_sizes(text):
+    sizes = []
+    for part in text.split(','):
+        w, h = part.lower().split('x')
+        sizes.append((int(w), int(h)))
+    return sizes
+
+
+def make_image(rng, w, h):
+    """พื้นไล่สี + สี่เหลี่ยมสุ่ม + noise เล็กน้อย (ขนาดไฟล์ JPEG ใกล้เคียงรูปถ่ายมากกว่า noise ล้วน)"""
+    gx = np.linspace(0, 255, w, dtype=np.float32)[None, :]
+    gy = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = rng.random(3) * 0.5 + 0.25
+    img = np.empty((h, w, 3), dtype=np.float32)
+    for c in range(3):
+        img[..., c] = gx * base[c] + gy * (1 - base[c])
+    for _ in range(6):
+        x1, y1 = int(rng.integers(0, w - 1)), int(rng.integers(0, h - 1))
+        x2, y2 = int(rng.integers(x1 + 1, w + 1)), int(rng.integers(y1 + 1, h + 1))
+        img[y1:y2, x1:x2] = rng.random(3) * 255
+    img += rng.normal(0, 6, (h, w, 1)).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def prepare_images(sizes, count, seed, with_sample=True):
+    """สร้างรูป (ถ้ายังไม่มี) คืน list ของ path เรียงตามลำดับ"""
+    tag = hashlib.sha1(f"{sizes}|{count}|{seed}".encode()).hexdigest()[:10]
+    folder = os.path.join(DATA_DIR, tag)
+    paths = [os.path.join(folder, f"img_{i:05d}_{w}x{h}.jpg")
+             for i, (w, h) in enumerate(sizes[i % len(sizes)] for i in range(count))]
+    if not all(os.path.exists(p) for p in paths):
+        os.makedirs(folder, exist_ok=True)
+        rng = np.random.default_rng(seed)
+        for i, path in enumerate(paths):
+            w, h = sizes[i % len(sizes)]
+            cv2.imwrite(path, make_image(rng, w, h), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if with_sample and os.path.exists(SAMPLE):
+        paths.append(SAMPLE)
+    return paths
+
+
+# ------------------------------------------
+# Measurement
+# ------------------------------------------
+def peak_rss_mb():
+    """peak RSS ของ process นี้ (MB) / None ถ้าวัดไม่ได้"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux เป็น KB, macOS เป็น bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def percentiles(values_s):
+    if not values_s:
+        return {"count": 0}
+    ms = np.asarray(values_s) * 1000.0
+    return {
+        "count": int(ms.size),
+        "total_s": round(float(ms.sum()) / 1000.0, 4),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+class StageTimer:
+    """เก็บเวลาต่อครั้งของแต่ละ stage (thread-safe) โดยหุ้ม method ของ instance ไว้"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, n=1):
+        with self._lock:
+            # stage ที่ทำทั้ง batch (detect) เฉลี่ยเวลาให้ทุกรูปใน batch
+            self.samples.setdefault(stage, []).extend([seconds / max(n, 1)] * max(n, 1))
+
+    def wrap(self, obj, name, stage, batch_arg=False):
+        func = getattr(obj, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start, len(args[0]) if batch_arg else 1)
+
+        setattr(obj, name, timed)
+
+    def report(self):
+        return {stage: percentiles(values) for stage, values in self.samples.items()}
+
+
+# ------------------------------------------
+# Runners
+# ------------------------------------------
+def run_pipeline(cropper, paths, out_dir, specs, class_id, args, timer):
+    pipeline = CropPipeline(cropper, out_dir, specs[0].ratio, specs[0].padding, class_id,
+                            decode_workers=args.decode_workers, write_workers=args.write_workers, specs=specs)
+    timer.wrap(cropper, "load_source", "decode")
+    timer.wrap(cropper, "detect_batch_safe", "detect", batch_arg=True)
+    timer.wrap(cropper, "crop_rects", "crop")
+    timer.wrap(pipeline, "_write", "write")
+
+    # latency ต่อรูป = ตั้งแต่เริ่ม decode จนผลออก (รวมเวลารอคิว)
+    started, latencies = {}, []
+    load_source = cropper.load_source
+
+    def load_and_mark(path):
+        started.setdefault(path, time.perf_counter())
+        return load_source(path)
+
+    cropper.load_source = load_and_mark
+
+    def on_result(file_path, outputs):
+        latencies.append(time.perf_counter() - started.get(file_path, time.perf_counter()))
+
+    stats = pipeline.run(paths, on_result=on_result)
+    return stats, latencies
+
+
+def run_sequential(cropper, paths, out_dir, specs, class_id, args, timer):
+    """อ่าน -> detect -> crop -> เขียน ทีละรูป (แบบ loop เดิมก่อนมี pipeline)"""
+    stats = {"total": len(paths), "ok": 0, "failed": 0}
+    latencies = []
+    for spec in specs:
+        os.makedirs(os.path.join(out_dir, spec.subfolder), exist_ok=True)
+    for path in paths:
+        start = time.perf_counter()
+        loaded = cropper.load_source(path)
+        t1 = time.perf_counter()
+        timer.add("decode", t1 - start)
+        if loaded.det_img is None:
+            stats["failed"] += 1
+            continue
+        det, error = cropper.detect_batch_safe([loaded.det_img], [loaded.key])[0]
+        t2 = time.perf_counter()
+        timer.add("detect", t2 - t1)
+        ok = det is not None
+        if ok:
+            variants = cropper.crop_variants(loaded.full(), det, specs, class_id)
+            t3 = time.perf_counter()
+            timer.add("crop", t3 - t2)
+            for spec, (cropped, _) in zip(specs, variants):
+                if cropped is None or not cv2.imwrite(output_path(out_dir, path, spec), cropped):
+                    ok = False
+            timer.add("write", time.perf_counter() - t3)
+        stats["ok" if ok else "failed"] += 1
+        latencies.append(time.perf_counter() - start)
+    return stats, latencies
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end crop pipeline benchmark")
+    parser.add_argument("--sizes", default="1280x960,4000x3000", help="Comma-separated WxH list (default: 1280x960,4000x3000)")
+    parser.add_argument("--count", type=int, default=100, help="Synthetic images to generate (default: 100)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-sample", action="store_true", help="Do not include cat.jpg")
+    parser.add_argument("--mode", choices=("pipeline", "sequential"), default="pipeline")
+    parser.add_argument("--model", default=None, help="Real model (.pt/.onnx). Default: offline stub detector")
+    parser.add_argument("--backend", default=None, help="torch / onnx (default: torch for --model, stub otherwise)")
+    parser.add_argument("--stub-delay-ms", type=float, default=0.0, help="Simulated inference time per image for the stub")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--decode-workers", type=int, default=2)
+    parser.add_argument("--write-workers", type=int, default=2)
+    parser.add_argument("--ratios", default="4:5,9:16", help="Comma-separated w:h list, 'free' allowed (default: 4:5,9:16)")
+    parser.add_argument("--padding", type=int, default=15)
+    parser.add_argument("--reduced-decode", action="store_true")
+    parser.add_argument("--output", default=None, help="Result JSON path (default: benchmarks/results/<time>_<commit>.json)")
+    args = parser.parse_args()
+
+    from batch_cli import parse_ratio
+
+    backend = args.backend or ("torch" if args.model else "stub")
+    paths = prepare_images(parse_sizes(args.sizes), args.count, args.seed, not args.no_sample)
+    ratio_texts = args.ratios.split(',')
+    specs = [CropSpec(parse_ratio(r), args.padding, "", f"v{i}") for i, r in enumerate(ratio_texts)]
+
+    cropper = AICropper(args.model or "stub", batch_size=args.batch_size, device=args.device,
+                        reduced_decode=args.reduced_decode, backend=backend)
+    if backend == "stub":
+        cropper.detector.delay_ms = args.stub_delay_ms
+    cropper.warmup()
+
+    out_dir = tempfile.mkdtemp(prefix="smartcrop_bench_")
+    timer = StageTimer()
+    runner = run_pipeline if args.mode == "pipeline" else run_sequential
+    try:
+        start = time.perf_counter()
+        stats, latencies = runner(cropper, paths, out_dir, specs, 0, args, timer)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    lat = percentiles(latencies)
+    rss = peak_rss_mb()
+    result = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpu_count": os.cpu_count()},
+        "config": {"mode": args.mode, "backend": backend, "model": args.model, "sizes": args.sizes,
+                   "images": len(paths), "seed": args.seed, "batch_size": args.batch_size,
+                   "decode_workers": args.decode_workers, "write_workers": args.write_workers,
+                   "ratios": ratio_texts, "padding": args.padding, "reduced_decode": args.reduced_decode,
+                   "stub_delay_ms": args.stub_delay_ms if backend == "stub" else None},
+        "stats": stats,
+        "elapsed_s": round(elapsed, 4),
+        "images_per_sec": round(len(paths) / max(elapsed, 1e-9), 3),
+        "latency": lat,
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+        "stages": timer.report(),
+    }
+
+    print(f"Images    : {len(paths)} ({args.mode}, {backend})")
+    print(f"Throughput: {result['images_per_sec']:.2f} img/s ({elapsed:.2f}s)")
+    if lat["count"]:
+        print(f"Latency   : p50 {lat['p50_ms']:.1f} ms | p95 {lat['p95_ms']:.1f} ms | p99 {lat['p99_ms']:.1f} ms")
+    print(f"Peak RSS  : {result['peak_rss_mb']} MB")
+    for stage, s in result["stages"].items():
+        print(f"  {stage:7}: mean {s['mean_ms']:8.2f} ms | p95 {s['p95_ms']:8.2f} ms | total {s['total_s']:.2f}s")
+
+    path = args.output
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{result['commit'] or 'nogit'}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved     : {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Benchmark: เวลาเปิด GUI จนหน้าต่างขึ้น (cold start) ไว้จับ regression เช่นมีคน import torch ตอนเริ่มโปรแกรม
+
+    python benchmarks/bench_startup.py                # 5 รอบ (Qt แบบ offscreen ไม่ต้องมีจอ)
+    python benchmarks/bench_startup.py --runs 10 --max-first-paint 1.5
+
+แต่ละรอบรัน gui_app.py --startup-exit ใน process ใหม่ (ปิดเองหลัง first paint) แล้วอ่านเวลาที่ print ออกมา
+fail (exit 1) ถ้า torch ถูก import ก่อน first paint หรือ first paint ช้ากว่า --max-first-paint
+ผลลัพธ์เขียนเป็น JSON ใน benchmarks/results/ (มี commit hash) เหมือน bench_pipeline.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import RESULTS_DIR, git_commit  # noqa: E402
+
+KEYS = ("imports", "window", "first_paint")
+
+
+def run_once(timeout):
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, "gui_app.py"), "--startup-exit"], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=timeout)
+    wall = time.perf_counter() - start
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            result = json.loads(line[len("STARTUP "):])
+            result["process_wall"] = wall
+            return result
+    raise RuntimeError(f"gui_app.py did not report startup times (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds per run")
+    parser.add_argument("--max-first-paint", type=float, default=None,
+                        help="Fail if the median time to first paint is above this (seconds)")
+    parser.add_argument("--output", default=None, help="Result JSON path (default: benchmarks/results/<time>_<commit>_startup.json)")
+    args = parser.parse_args()
+
+    runs = [run_once(args.timeout) for _ in range(max(1, args.runs))]
+    median = {key: round(statistics.median(r[key] for r in runs), 4) for key in KEYS + ("process_wall",)}
+    torch_loaded = any(r.get("torch_loaded") for r in runs)
+
+    print(f"Runs       : {len(runs)}")
+    for key in KEYS + ("process_wall",):
+        print(f"{key:11}: median {median[key]:.3f}s | min {min(r[key] for r in runs):.3f}s | "
+              f"max {max(r[key] for r in runs):.3f}s")
+    print(f"torch      : {'imported before first paint' if torch_loaded else 'not imported'}")
+
+    result = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpu_count": os.cpu_count()},
+        "median_s": median,
+        "torch_loaded": torch_loaded,
+        "runs": runs,
+    }
+    path = args.output
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{result['commit'] or 'nogit'}_startup.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved      : {path}")
+
+    if torch_loaded:
+        print("FAIL: torch is imported before the window is shown")
+        return 1
+    if args.max_first_paint is not None and median["first_paint"] > args.max_first_paint:
+        print(f"FAIL: first paint {median['first_paint']:.3f}s > {args.max_first_paint:.3f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+เทียบผล crop ของ backend torch กับ onnx บนรูปชุดเดียวกัน (และจับเวลา detect ของแต่ละตัว)
+
+    python benchmarks/compare_backends.py D:/photos --model models/yolov8n.pt --class-id 0
+    python benchmarks/compare_backends.py cat.jpg --tolerance 0.01
+
+กรอบ crop ถือว่าตรงกันถ้าทุกด้านต่างกันไม่เกิน tolerance x ด้านยาวของรูป
+(letterbox ของ onnx เป็นสี่เหลี่ยมจัตุรัสเต็ม ส่วน ultralytics pad แค่ให้หาร 32 ลงตัว กรอบจึงต่างกันเล็กน้อยได้)
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crop_geometry  # noqa: E402
+from batch_cli import collect_inputs, parse_ratio  # noqa: E402
+from crop_logic import AICropper  # noqa: E402
+from image_io import read_image  # noqa: E402
+
+
+def crop_rects(dets, imgs, class_id, ratios, paddings):
+    rects, status = [], []
+    for det, img in zip(dets, imgs):
+        boxes = np.asarray(det.boxes).reshape(-1, 4)
+        r, s = crop_geometry.batch_crop_rects(
+            boxes, det.classes, np.zeros(len(boxes), dtype=np.int64), [img.shape[:2]], class_id,
+            crop_geometry.ratios_array(ratios), paddings)
+        rects.append(r[0])
+        status.append(s[0])
+    return rects, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare torch and onnx detector backends")
+    parser.add_argument("inputs", nargs="+", help="Image files or folders")
+    parser.add_argument("--model", default="models/yolov8n.pt")
+    parser.add_argument("--class-id", type=int, default=0)
+    parser.add_argument("--ratio", action="append", default=None, help="Repeatable (default: free, 1:1, 4:5, 9:16)")
+    parser.add_argument("--padding", type=int, default=15)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Max edge difference as a fraction of the long side")
+    args = parser.parse_args()
+
+    files = collect_inputs(args.inputs)
+    imgs = [img for img in (read_image(f).det_img for f in files) if img is not None]
+    if not imgs:
+        print("No images found.")
+        return 1
+    ratios = [parse_ratio(r) for r in (args.ratio or ["free", "1:1", "4:5", "9:16"])]
+    paddings = [args.padding] * len(ratios)
+
+    results = {}
+    for backend in ("torch", "onnx"):
+        cropper = AICropper(args.model, batch_size=args.batch_size, device="cpu", backend=backend)
+        cropper.warmup()
+        start = time.perf_counter()
+        dets = []
+        for i in range(0, len(imgs), args.batch_size):
+            dets.extend(cropper.detect_batch(imgs[i:i + args.batch_size]))
+        elapsed = time.perf_counter() - start
+        print(f"{backend:5}: {elapsed * 1000:8.1f} ms ({len(imgs) / max(elapsed, 1e-9):.1f} img/s) "
+              f"| {cropper.timing_text()}")
+        results[backend] = crop_rects(dets, imgs, args.class_id, ratios, paddings)
+
+    (t_rects, t_status), (o_rects, o_status) = results["torch"], results["onnx"]
+    compared, status_diff, worst = 0, 0, 0.0
+    for img, tr, ts, orr, os_ in zip(imgs, t_rects, t_status, o_rects, o_status):
+        long_side = max(img.shape[:2])
+        for j in range(len(ratios)):
+            if ts[j] != os_[j]:
+                status_diff += 1
+                continue
+            if ts[j] == crop_geometry.STATUS_OK:
+                compared += 1
+                worst = max(worst, float(np.abs(tr[j] - orr[j]).max()) / long_side)
+
+    print(f"Crops compared : {compared}")
+    print(f"Status mismatch: {status_diff}")
+    print(f"Worst edge diff: {worst * 100:.2f}% of long side (tolerance {args.tolerance * 100:.2f}%)")
+    return 0 if status_diff == 0 and worst <= args.tolerance else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
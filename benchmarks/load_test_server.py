@@ -0,0 +1,187 @@
+"""
+Load test ของ crop_server: ยิง request พร้อมกันหลาย client แล้วเทียบ micro-batching กับ predict ทีละ request
+
+    python benchmarks/load_test_server.py                                   # stub detector, ไม่ต้องมีไฟล์โมเดล
+    python benchmarks/load_test_server.py --clients 16 --requests 400 --max-batch 16 --max-wait-ms 5
+    python benchmarks/load_test_server.py --model models/yolov8n.pt          # ใช้โมเดลจริง
+    python benchmarks/load_test_server.py --url http://127.0.0.1:8765        # ยิง server ที่รันอยู่แล้ว (รอบเดียว)
+
+เปิด server ในตัว 2 รอบ (max_batch=1 = predict ต่อ request แบบเดิม แล้วตามด้วย --max-batch) ด้วยโหลดเดียวกัน
+stub detector หน่วงเวลาต่อการเรียก (--stub-call-ms) + ต่อรูป (--stub-delay-ms) เพื่อจำลอง overhead คงที่ของ predict
+ผลลัพธ์เขียนเป็น JSON ใน benchmarks/results/ (มี commit hash) เหมือน bench_pipeline.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import http.client
+from urllib.parse import urlparse, urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import RESULTS_DIR, git_commit, parse_sizes, percentiles, prepare_images  # noqa: E402
+from crop_server import CropServer, serve  # noqa: E402
+
+
+def run_clients(url, bodies, clients, total, query):
+    """client ละ 1 connection (keep-alive) ยิงจนครบ total request คืนค่า (elapsed, latencies, errors)"""
+    target = urlparse(url)
+    path = "/crop?" + urlencode(query)
+    counter = {"next": 0}
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def client():
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=120)
+        try:
+            while True:
+                with lock:
+                    i = counter["next"]
+                    if i >= total:
+                        return
+                    counter["next"] += 1
+                body = bodies[i % len(bodies)]
+                start = time.perf_counter()
+                conn.request("POST", path, body, {"Content-Type": "application/octet-stream"})
+                resp = conn.getresponse()
+                resp.read()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if resp.status not in (200, 422):
+                        errors.append(resp.status)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies, errors
+
+
+def fetch_stats(url):
+    target = urlparse(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+    try:
+        conn.request("GET", "/metrics?format=json")
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def run_round(args, bodies, query, max_batch):
+    """เปิด server ในตัว (port ว่างอะไรก็ได้) ยิงโหลด แล้วปิด"""
+    backend = args.backend or ("torch" if args.model else "stub")
+    app = CropServer(args.model or "stub", backend, args.device, max_batch, args.max_wait_ms)
+    batcher = app.batcher()
+    if backend == "stub":
+        batcher.cropper.detector.delay_ms = args.stub_delay_ms
+        batcher.cropper.detector.call_delay_ms = args.stub_call_ms
+    httpd = serve(app, "127.0.0.1", 0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        elapsed, latencies, errors = run_clients(url, bodies, args.clients, args.requests, query)
+        stats = fetch_stats(url)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        app.close()
+    return summarize(f"max_batch={max_batch}", elapsed, latencies, errors, stats)
+
+
+def summarize(label, elapsed, latencies, errors, stats):
+    models = stats.get("models", {})
+    model = next(iter(models.values()), {})
+    return {
+        "label": label,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "elapsed_s": round(elapsed, 4),
+        "requests_per_sec": round(len(latencies) / max(elapsed, 1e-9), 3),
+        "latency": percentiles(latencies),
+        "mean_batch_size": model.get("mean_batch_size"),
+        "max_queue_depth": model.get("max_queue_depth"),
+        "batch_sizes": model.get("batch_sizes"),
+    }
+
+
+def print_round(r):
+    lat = r["latency"]
+    print(f"{r['label']:>14}: {r['requests_per_sec']:8.2f} req/s | p50 {lat.get('p50_ms', 0):7.1f} ms | "
+          f"p95 {lat.get('p95_ms', 0):7.1f} ms | mean batch {r['mean_batch_size']} | "
+          f"max queue {r['max_queue_depth']} | errors {r['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for crop_server micro-batching")
+    parser.add_argument("--url", default=None, help="Test a running server instead of starting one (single round)")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients (default: 8)")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests per round (default: 200)")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--sizes", default="1280x960", help="Comma-separated WxH list (default: 1280x960)")
+    parser.add_argument("--count", type=int, default=32, help="Distinct synthetic images (default: 32)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ratio", default="4:5")
+    parser.add_argument("--padding", type=int, default=15)
+    parser.add_argument("--output-mode", choices=("image", "box"), default="image")
+    parser.add_argument("--model", default=None, help="Real model (.pt/.onnx). Default: offline stub detector")
+    parser.add_argument("--backend", default=None, help="torch / onnx (default: torch for --model, stub otherwise)")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--stub-call-ms", type=float, default=20.0, help="Simulated fixed cost per predict call")
+    parser.add_argument("--stub-delay-ms", type=float, default=2.0, help="Simulated cost per image")
+    parser.add_argument("--output", default=None, help="Result JSON path (default: benchmarks/results/<time>_<commit>_server.json)")
+    args = parser.parse_args()
+
+    paths = prepare_images(parse_sizes(args.sizes), args.count, args.seed)
+    bodies = []
+    for path in paths:
+        with open(path, "rb") as f:
+            bodies.append(f.read())
+    query = {"ratio": args.ratio, "padding": args.padding, "class_id": 0, "output": args.output_mode}
+
+    print(f"Load      : {args.requests} request(s) from {args.clients} client(s), {len(bodies)} distinct image(s)")
+    if args.url:
+        elapsed, latencies, errors = run_clients(args.url, bodies, args.clients, args.requests, query)
+        rounds = [summarize(args.url, elapsed, latencies, errors, fetch_stats(args.url))]
+        print_round(rounds[0])
+    else:
+        rounds = []
+        for max_batch in (1, args.max_batch):
+            rounds.append(run_round(args, bodies, query, max_batch))
+            print_round(rounds[-1])
+        gain = rounds[1]["requests_per_sec"] / max(rounds[0]["requests_per_sec"], 1e-9)
+        print(f"Gain      : {gain:.2f}x throughput with micro-batching")
+
+    result = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpu_count": os.cpu_count()},
+        "config": {"url": args.url, "model": args.model, "backend": args.backend, "clients": args.clients,
+                   "requests": args.requests, "max_batch": args.max_batch, "max_wait_ms": args.max_wait_ms,
+                   "sizes": args.sizes, "images": len(bodies), "output": args.output_mode,
+                   "stub_call_ms": args.stub_call_ms, "stub_delay_ms": args.stub_delay_ms},
+        "rounds": rounds,
+    }
+    path = args.output
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{result['commit'] or 'nogit'}_server.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved     : {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import numpy as np
+
+# ==========================================
+# Crop Geometry (NumPy ล้วน ไม่มี loop ต่อกรอบ)
+# ==========================================
+# ทำงานทีละ batch: กรอบทั้งหมดของทุกรูปรวมเป็น array เดียว (N กรอบ) + image_index บอกว่ากรอบไหนเป็นของรูปไหน
+# แล้วคำนวณกรอบ crop ของทุกรูป x ทุก spec (M แบบ) ในการเรียกครั้งเดียว
+# ตรรกะเหมือน loop เดิมใน crop_image ทุกขั้น: กรอง class -> เลือกกรอบใหญ่สุด -> padding -> ratio -> clamp
+
+STATUS_OK = 0
+STATUS_NO_DETECTION = 1
+STATUS_CLASS_NOT_FOUND = 2
+STATUS_DETECTION_FAILED = 3
+STATUS_TOO_SMALL = 4
+
+# เรียง instance ตาม: พื้นที่กรอบ / ความมั่นใจ (มาก->น้อย)
+RANK_BY = ("area", "conf")
+
+
+def class_ids(target_class_id):
+    """class เป้าหมายเป็น list ของ int (รับได้ทั้ง int เดียว หรือ list / set ของ int)"""
+    if isinstance(target_class_id, (int, np.integer)):
+        return [int(target_class_id)]
+    return sorted({int(c) for c in target_class_id})
+
+
+def format_class_ids(target_class_id):
+    return ", ".join(str(c) for c in class_ids(target_class_id))
+
+
+def status_message(code, target_class_id):
+    """ข้อความเดียวกับที่ crop_image คืนมาแต่เดิม"""
+    if code == STATUS_OK:
+        return "Success"
+    if code == STATUS_NO_DETECTION:
+        return "No object detected"
+    if code == STATUS_CLASS_NOT_FOUND:
+        return f"Target class {format_class_ids(target_class_id)} not found"
+    if code == STATUS_DETECTION_FAILED:
+        return "Detection failed"
+    return "Crop area too small"
+
+
+def stack_detections(dets):
+    """รวม list ของ Detections เป็น (boxes, classes, confs, image_index) ก้อนเดียว"""
+    counts = [len(d.boxes) for d in dets]
+    total = sum(counts)
+    if total == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return np.zeros((0, 4), dtype=np.float32), empty, empty, np.zeros(0, dtype=np.int64)
+    boxes = np.concatenate([np.asarray(d.boxes).reshape(-1, 4) for d in dets])
+    classes = np.concatenate([np.asarray(d.classes).reshape(-1) for d in dets])
+    confs = np.concatenate([np.asarray(d.confs).reshape(-1) for d in dets])
+    image_index = np.repeat(np.arange(len(dets), dtype=np.int64), counts)
+    return boxes, classes, confs, image_index
+
+
+def select_best_boxes(boxes, classes, image_index, n_images, target_class_id):
+    """
+    เลือกกรอบ class ที่ต้องการที่ใหญ่ที่สุดของแต่ละรูป
+    คืนค่า (best, status): best = index ของกรอบใน boxes (-1 ถ้าไม่มี), status = STATUS_* ต่อรูป
+    ถ้าพื้นที่เท่ากัน เลือกกรอบที่มาก่อน (เหมือน loop เดิมที่ใช้ '>')
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    classes = np.asarray(classes).reshape(-1)
+    image_index = np.asarray(image_index, dtype=np.int64).reshape(-1)
+
+    best = np.full(n_images, -1, dtype=np.int64)
+    status = np.full(n_images, STATUS_NO_DETECTION, dtype=np.int8)
+    if boxes.shape[0] == 0:
+        return best, status
+
+    # int(cls) ของเดิม = ตัดทศนิยมทิ้ง -> astype(int64) ให้ผลเหมือนกัน
+    match = np.isin(classes.astype(np.int64), class_ids(target_class_id))
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    has_any = np.bincount(image_index, minlength=n_images) > 0
+    has_cls = np.bincount(image_index[match], minlength=n_images) > 0
+    status[has_any] = STATUS_CLASS_NOT_FOUND
+    status[has_cls] = STATUS_DETECTION_FAILED
+
+    cand = np.flatnonzero(match & (area > 0))
+    if cand.size:
+        # เรียงตาม (รูป, พื้นที่มาก->น้อย, ลำดับเดิม) แล้วหยิบตัวแรกของแต่ละรูป
+        order = np.lexsort((cand, -area[cand], image_index[cand]))
+        ranked = cand[order]
+        imgs = image_index[ranked]
+        first = np.ones(ranked.size, dtype=bool)
+        first[1:] = imgs[1:] != imgs[:-1]
+        best[imgs[first]] = ranked[first]
+        status[imgs[first]] = STATUS_OK
+    return best, status
+
+
+def _loop_dtype(dtype):
+    """
+    dtype ที่ loop เดิมใช้คิดเลข: scalar ของกรอบ (float32 จาก YOLO) ทำเลขกับ float ของ Python
+    NumPy 1.x ได้ float64 / NumPy 2 (NEP 50) ได้ float32
+    """
+    return np.asarray(np.dtype(dtype).type(0) * 1.0).dtype
+
+
+def compute_crop_rects(best_boxes, sizes, ratios, paddings):
+    """
+    best_boxes : (N, 4) กรอบที่เลือกแล้วของแต่ละรูป (x1, y1, x2, y2)
+    sizes      : (N, 2) ขนาดรูป (h, w)
+    ratios     : (M,) สัดส่วน w/h ต่อ spec (NaN = Free ไม่บังคับสัดส่วน)
+    paddings   : (M,) padding เป็น % ต่อ spec
+    คืนค่า (rects, ok): rects = (N, M, 4) int64 [x1, y1, x2, y2], ok = (N, M) bool
+    """
+    # ให้ได้ผลตรงกับ loop เดิมทุก pixel: คิดใน dtype เดียวกับ loop (work)
+    # ยกเว้นค่าที่ loop เดิมได้เป็น int/float ของ Python (ถูก clamp เป็น 0 / ขอบรูป ทั้งสองด้าน) ซึ่งคิดเป็น float64
+    # ค่าทุกตัวเก็บเป็น float64 (แปลงจาก work ได้ตรงเป๊ะ) ส่วน *_py บอกว่าใน loop เดิมค่านั้นเป็นของ Python
+    raw = np.asarray(best_boxes).reshape(-1, 1, 4)
+    work = _loop_dtype(raw.dtype)
+    b = raw.astype(work)
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    h_img = sizes[:, 0:1]
+    w_img = sizes[:, 1:2]
+    ratio64 = np.asarray(ratios, dtype=np.float64).reshape(1, -1)
+    ratio = ratio64.astype(work)
+    pad = (np.asarray(paddings, dtype=np.float64).reshape(1, -1) / 100.0).astype(work)
+
+    # ความกว้าง/สูงของกรอบคิดใน dtype เดิมของกรอบ เหมือน loop เดิม
+    pad_x = (raw[..., 2] - raw[..., 0]).astype(work) * pad
+    pad_y = (raw[..., 3] - raw[..., 1]).astype(work) * pad
+
+    # max(0, v) / min(limit, v) ของเดิมคืน 0 / limit (int ของ Python) เมื่อถูก clamp
+    lo_x = b[..., 0] - pad_x
+    lo_y = b[..., 1] - pad_y
+    hi_x = b[..., 2] + pad_x
+    hi_y = b[..., 3] + pad_y
+    lo_x_py = ~(lo_x > 0)
+    lo_y_py = ~(lo_y > 0)
+    base_x1 = np.where(lo_x_py, 0.0, lo_x)
+    base_y1 = np.where(lo_y_py, 0.0, lo_y)
+    base_x2 = np.where(hi_x < w_img, hi_x, w_img)
+    base_y2 = np.where(hi_y < h_img, hi_y, h_img)
+    w_py = lo_x_py & ~(hi_x < w_img)
+    h_py = lo_y_py & ~(hi_y < h_img)
+
+    # int ของ Python ลบกัน / ค่าใน work ลบกัน ได้ค่าเดียวกันเมื่อคิดใน work (ขนาดรูป < 2^24)
+    current_w = (base_x2.astype(work) - base_x1.astype(work)).astype(np.float64)
+    current_h = (base_y2.astype(work) - base_y1.astype(work)).astype(np.float64)
+    center_x = (base_x1.astype(work) + current_w.astype(work) / 2).astype(np.float64)
+    center_y = (base_y1.astype(work) + current_h.astype(work) / 2).astype(np.float64)
+    center_x_py = lo_x_py & w_py
+    center_y_py = lo_y_py & h_py
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        both_py = w_py & h_py
+        wider = np.where(both_py, (current_w / current_h) > ratio64,
+                         (current_w.astype(work) / current_h.astype(work)) > ratio)
+        div = np.where(w_py, current_w / ratio64, (current_w.astype(work) / ratio).astype(np.float64))
+        mul = np.where(h_py, current_h * ratio64, (current_h.astype(work) * ratio).astype(np.float64))
+        new_w = np.where(wider, current_w, mul)
+        new_h = np.where(wider, div, current_h)
+        new_py = np.where(wider, w_py, h_py)
+
+        crop_x1, crop_x2 = _around(center_x, new_w, center_x_py & new_py, work)
+        crop_y1, crop_y2 = _around(center_y, new_h, center_y_py & new_py, work)
+
+    free = np.isnan(ratio64)
+    crop_x1 = np.where(free, base_x1, crop_x1)
+    crop_y1 = np.where(free, base_y1, crop_y1)
+    crop_x2 = np.where(free, base_x2, crop_x2)
+    crop_y2 = np.where(free, base_y2, crop_y2)
+
+    # int() ของเดิม = ปัดเศษเข้าหา 0 -> np.trunc
+    rects = np.empty(crop_x1.shape + (4,), dtype=np.int64)
+    rects[..., 0] = np.trunc(np.maximum(0, crop_x1))
+    rects[..., 1] = np.trunc(np.maximum(0, crop_y1))
+    rects[..., 2] = np.trunc(np.minimum(w_img, crop_x2))
+    rects[..., 3] = np.trunc(np.minimum(h_img, crop_y2))
+
+    ok = (rects[..., 2] > rects[..., 0]) & (rects[..., 3] > rects[..., 1])
+    return rects, ok
+
+
+def _around(center, size, py, work):
+    """center -/+ size / 2: คิดเป็น float64 ถ้าทั้งสองค่าเป็นของ Python ใน loop เดิม ไม่งั้นคิดใน work"""
+    half = size / 2
+    c, h = center.astype(work), half.astype(work)
+    low = np.where(py, center - half, (c - h).astype(np.float64))
+    high = np.where(py, center + half, (c + h).astype(np.float64))
+    return low, high
+
+
+def batch_crop_rects(boxes, classes, image_index, sizes, target_class_id, ratios, paddings):
+    """
+    รวมทุกขั้นในการเรียกครั้งเดียว: กรอบทั้ง batch (N กรอบ จาก n รูป) x M spec
+    คืนค่า (rects, status): rects = (n, M, 4) int64, status = (n, M) int8 (STATUS_*)
+    """
+    sizes = np.asarray(sizes).reshape(-1, 2)
+    n_images = sizes.shape[0]
+    ratios = np.asarray(ratios, dtype=np.float64).reshape(-1)
+
+    best, img_status = select_best_boxes(boxes, classes, image_index, n_images, target_class_id)
+    status = np.repeat(img_status[:, None], ratios.size, axis=1)
+    rects = np.zeros((n_images, ratios.size, 4), dtype=np.int64)
+
+    found = np.flatnonzero(best >= 0)
+    if found.size:
+        chosen = np.asarray(boxes).reshape(-1, 4)[best[found]]
+        r, ok = compute_crop_rects(chosen, sizes[found], ratios, paddings)
+        rects[found] = r
+        status[found] = np.where(ok, STATUS_OK, STATUS_TOO_SMALL)
+    return rects, status
+
+
+def select_instances(boxes, classes, confs, target_class_id, top_k=0, rank="area"):
+    """
+    ทุกกรอบของ class เป้าหมายในรูปเดียว เรียงตาม rank (area / conf) มาก->น้อย ตัดเหลือ top_k (0 = ทั้งหมด)
+    คืนค่า (index ของกรอบใน boxes, status ของรูป)
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    classes = np.asarray(classes).reshape(-1)
+    if boxes.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64), STATUS_NO_DETECTION
+
+    match = np.isin(classes.astype(np.int64), class_ids(target_class_id))
+    if not match.any():
+        return np.zeros(0, dtype=np.int64), STATUS_CLASS_NOT_FOUND
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    cand = np.flatnonzero(match & (area > 0))
+    if not cand.size:
+        return cand, STATUS_DETECTION_FAILED
+
+    key = np.asarray(confs).reshape(-1)[cand] if rank == "conf" else area[cand]
+    ranked = cand[np.argsort(-key, kind="stable")]
+    if top_k:
+        ranked = ranked[:int(top_k)]
+    return ranked, STATUS_OK
+
+
+def instance_crop_rects(boxes, classes, confs, size, target_class_id, ratios, paddings, top_k=0, rank="area"):
+    """
+    กรอบ crop ของทุก instance (K ตัว) x ทุก spec (M แบบ) ในรูปขนาด size = (h, w)
+    คืนค่า (labels, rects, status, image_status)
+      labels = list ของ (class, ลำดับของ instance ภายใน class นั้น) ตามลำดับ rank
+      rects = (K, M, 4) int64, status = (K, M) int8
+    """
+    ratios = np.asarray(ratios, dtype=np.float64).reshape(-1)
+    chosen, image_status = select_instances(boxes, classes, confs, target_class_id, top_k, rank)
+    if not chosen.size:
+        return [], np.zeros((0, ratios.size, 4), dtype=np.int64), np.zeros((0, ratios.size), dtype=np.int8), image_status
+
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    cls = np.asarray(classes).reshape(-1)[chosen].astype(np.int64)
+    labels, seen = [], {}
+    for c in cls.tolist():
+        labels.append((c, seen.get(c, 0)))
+        seen[c] = seen.get(c, 0) + 1
+
+    rects, ok = compute_crop_rects(boxes[chosen], np.repeat([size], chosen.size, axis=0), ratios, paddings)
+    status = np.where(ok, STATUS_OK, STATUS_TOO_SMALL).astype(np.int8)
+    return labels, rects, status, image_status
+
+
+def ratios_array(ratios):
+    """แปลง list ของ ratio (None = Free) เป็น float64 array ที่ใช้ NaN แทน None"""
+    return np.array([np.nan if r is None else r for r in ratios], dtype=np.float64)
@@ -1,113 +1,604 @@
 import cv2
 import numpy as np
-import torch
-from ultralytics import YOLO
 import json
+import time
+import threading
+from collections import namedtuple
 
-# แก้ปัญหา PyTorch 2.4+
-try:
-    from ultralytics.nn.tasks import DetectionModel
-    torch.serialization.add_safe_globals([DetectionModel])
-except ImportError:
-    pass
+import crop_geometry
+from detectors import DEFAULT_BACKEND, create_detector, detector_signature
+from archive_io import ArchiveMember
+from image_io import LoadedImage, decode_bytes, read_image
+from metrics import timed
+from dedup import DedupIndex, dhash, hamming, same_aspect
+from tiling import MemoryBudget, detect_tiled, open_large, read_region
+
+# torch / ultralytics ไม่ถูก import ที่นี่ (โหลดตอนสร้าง detector ดู detectors.import_torch)
+
+# ผลการ detect ของรูปหนึ่งรูป (เป็น numpy array ทั้งหมด)
+# shape = (h, w) ของรูปที่ใช้ detect -> ถ้า crop จากรูปขนาดอื่น จะ scale กรอบให้เอง
+Detections = namedtuple("Detections", ["boxes", "classes", "confs", "shape"], defaults=(None,))
+
+# ขนาด input ของ YOLO (ค่า default ของ ultralytics)
+DEFAULT_IMGSZ = 640
+
+DEFAULT_BATCH_SIZE = 8
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+VIDEO_EXTS = ('.mp4', '.mov', '.avi', '.mkv', '.m4v', '.webm')
+
+# Dictionary เก็บค่าสัดส่วน (ใช้ร่วมกันทั้ง GUI และ CLI)
+RATIO_MAP = {
+    "Free (No Ratio)": None,
+    "1:1 (Square)": 1 / 1,
+    "4:5 (IG Portrait)": 4 / 5,
+    "3:4 (Portrait)": 3 / 4,
+    "2:3 (Classic 35mm)": 2 / 3,
+    "3:2 (Landscape)": 3 / 2,
+    "4:3 (Monitor)": 4 / 3,
+    "5:4 (Monitor)": 5 / 4,
+    "7:5": 7 / 5,
+    "9:16 (Story/TikTok)": 9 / 16,
+    "16:9 (Youtube)": 16 / 9,
+    "21:9 (Cinema)": 21 / 9,
+    "2:1": 2 / 1,
+}
+
+# 1 รูปแบบของ output: สัดส่วน, padding (%) และชื่อต่อท้ายไฟล์ / โฟลเดอร์ย่อย
+CropSpec = namedtuple("CropSpec", ["ratio", "padding", "suffix", "subfolder"], defaults=("", ""))
+
+# crop ทุก instance ของ class เป้าหมาย (แทนที่จะเอาแค่กรอบใหญ่สุด) ไฟล์ละ 1 instance: <ชื่อ>_<class>_<ลำดับ>
+# top_k = เก็บแค่ K ตัวแรก (0 = ทั้งหมด), rank = เรียงตาม "area" หรือ "conf"
+InstanceOptions = namedtuple("InstanceOptions", ["top_k", "rank"], defaults=(0, "area"))
+
+
+# ตัวนับต่อรอบใน AICropper.stats (batch_cli รวมข้าม worker process)
+# cascade_cheap / cascade_full = รูปที่จบที่รอบถูก / ต้องรันขนาดเต็ม, dedup_saved = รูปที่ใช้ผล detect ของรูปซ้ำ
+RUN_STATS = ("cascade_cheap", "cascade_full", "dedup_saved")
+
+
+# Cascade: detect ด้วย input เล็ก (imgsz) ก่อน ถ้าไม่เจอ class เป้าหมาย หรือ conf สูงสุดต่ำกว่า min_conf
+# ค่อยรันใหม่ด้วยขนาดเต็ม (รูปส่วนใหญ่มี subject ใหญ่ชัดเจน -> จบที่รอบถูก)
+CascadeOptions = namedtuple("CascadeOptions", ["imgsz", "min_conf"], defaults=(320, 0.5))
+
+
+def detect_settings(predict_args, reduced_decode=False, cascade=None):
+    """ค่าที่มีผลกับผล detect (ใช้ประกอบ key ของ cache / manifest ทั้ง GUI และ CLI)"""
+    settings = dict(predict_args)
+    settings["reduced_decode"] = bool(reduced_decode)
+    if cascade is not None:
+        settings["cascade"] = list(cascade)
+    return settings
+
+
+def predict_settings(target_class_id=None, conf=None, max_det=None):
+    """
+    ค่าที่ส่งให้ detector.predict: classes = กรอง class ในโมเดลเลย (class อื่นถูกทิ้งก่อน NMS)
+    conf / max_det = None ใช้ค่า default ของ backend
+    """
+    args = {}
+    if target_class_id is not None:
+        args["classes"] = crop_geometry.class_ids(target_class_id)
+    if conf is not None:
+        args["conf"] = float(conf)
+    if max_det is not None:
+        args["max_det"] = int(max_det)
+    return args
+
+def ratio_folder_name(ratio_text):
+    """ชื่อโฟลเดอร์จากชื่อใน RATIO_MAP เช่น '4:5 (IG Portrait)' -> '4x5', 'Free (No Ratio)' -> 'free'"""
+    name = ratio_text.split(' ')[0].replace(':', 'x')
+    return name.lower()
+
+def scale_detections(det, h_img, w_img):
+    """แปลงกรอบจากพิกัดของรูปที่ใช้ detect ไปเป็นพิกัดของรูปขนาด (h_img, w_img)"""
+    if det.shape is None or tuple(det.shape) == (h_img, w_img) or len(det.boxes) == 0:
+        return det
+    h_det, w_det = det.shape
+    scale = np.array([w_img / w_det, h_img / h_det, w_img / w_det, h_img / h_det], dtype=np.float32)
+    return Detections(det.boxes * scale, det.classes, det.confs, (h_img, w_img))
+
+def format_dedup(saved, threshold):
+    return f"Dedup: {saved} inference(s) saved on near-duplicate images (threshold {threshold})"
+
+def format_cascade(cheap, full, low_imgsz, full_imgsz):
+    total = cheap + full
+    rate = cheap / total * 100 if total else 0.0
+    return (f"Cascade: {cheap}/{total} image(s) on the {low_imgsz}px pass ({rate:.0f}%), "
+            f"{full} re-run at {full_imgsz}px")
 
 class AICropper:
     # รับ model_path มาจากข้างนอก (GUI ส่งมา)
-    def __init__(self, model_path): 
-        print(f"Loading Model: {model_path}")
-        self.model = YOLO(model_path) 
-        
-        if torch.cuda.is_available():
-            self.model.to('cuda')
-            print(f"✅ Using GPU: {torch.cuda.get_device_name(0)}")
+    # device=None คือเลือกเองอัตโนมัติ (มี GPU ใช้ GPU) หรือระบุ 'cpu' / 'cuda' / 'cuda:1' ได้
+    # cache = DetectionCache (ถ้าส่งมา จะเก็บ/อ่านผล detect จาก disk แทนการรัน YOLO ซ้ำ)
+    # reduced_decode=True : JPEG ใหญ่ๆ จะ decode แบบย่อไว้ detect แล้วค่อย crop จากรูปเต็ม (ประหยัด memory/เวลา)
+    # backend = ตัวรันโมเดล 'torch' (ultralytics, default) หรือ 'onnx' (onnxruntime CPU) ดู detectors.py
+    # tiling = TileOptions (ตั้งผ่าน configure) รูปใหญ่มากจะ detect แบบ tile และ crop จาก memmap ดู tiling.py
+    # threads = จำนวน thread ของ torch / onnxruntime ใน process นี้ (None = ค่า default ของ backend)
+    def __init__(self, model_path, batch_size=DEFAULT_BATCH_SIZE, device=None, cache=None, reduced_decode=False,
+                 backend=DEFAULT_BACKEND, threads=None):
+        print(f"Loading Model: {model_path} ({backend})")
+        start = time.perf_counter()
+        self.detector = create_detector(backend, model_path, device, threads)
+        self.backend = self.detector.name
+        self.model_path = model_path
+        self.batch_size = max(1, int(batch_size))
+        self.cache = cache
+        self.model_sig = detector_signature(model_path, self.backend)
+        # ค่าที่ส่งต่อให้ model.predict (เป็นส่วนหนึ่งของ key ใน cache ด้วย)
+        self.predict_args = {}
+        self.reduced_decode = reduced_decode
+        # StageMetrics (ถ้าตั้งไว้ จะจับเวลา decode / detect / crop) None = ปิด
+        self.metrics = None
+        self.tiling = None
+        self.memory_budget = None
+        # CascadeOptions (None = ปิด) / DedupIndex ของรูปที่เกือบซ้ำกัน (None = ปิด)
+        self.cascade = None
+        self.dedup = None
+        # ตัวนับของรอบนี้ (ดู RUN_STATS)
+        self.stats = dict.fromkeys(RUN_STATS, 0)
+        self._stats_lock = threading.Lock()
+
+        self.device = self.detector.device
+
+        # เวลาโหลด / warm-up (วินาที) ไว้แสดงผล
+        self.load_time = time.perf_counter() - start
+        self.warmup_time = None
+
+    def configure(self, batch_size=None, cache=None, reduced_decode=False, metrics=None, tiling=None,
+                  predict_args=None, cascade=None, dedup_threshold=None):
+        """
+        ตั้งค่าต่อรอบการทำงาน (ใช้กับ cropper ที่ยืมมาจาก ModelPool ไม่ต้องโหลดโมเดลใหม่)
+        predict_args = ผลจาก predict_settings() (None = ค่า default ของโมเดล)
+        dedup_threshold = hamming distance สูงสุดที่ถือว่ารูปซ้ำกัน (None = ปิด dedup)
+        """
+        self.predict_args = dict(predict_args or {})
+        self.cascade = cascade
+        self.dedup = DedupIndex(dedup_threshold) if dedup_threshold is not None else None
+        self.stats = dict.fromkeys(RUN_STATS, 0)
+        if batch_size is not None:
+            self.batch_size = max(1, int(batch_size))
+        self.cache = cache
+        self.reduced_decode = reduced_decode
+        self.metrics = metrics
+        self.tiling = tiling
+        self.memory_budget = MemoryBudget(tiling.memory_mb) if tiling is not None else None
+        return self
+
+    def warmup(self):
+        """
+        รัน predict กับรูปดำ 1 ครั้ง: ให้ torch/cuDNN เลือก kernel และจอง memory ไว้ก่อน
+        รูปจริงรูปแรกจะได้ความเร็วเท่ารอบปกติ
+        """
+        imgsz = self.predict_args.get('imgsz', DEFAULT_IMGSZ)
+        dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        self.detector.predict([dummy], **self.predict_args)
+        self.warmup_time = time.perf_counter() - start
+        return self.warmup_time
+
+    def timing_text(self):
+        text = f"Model load {self.load_time:.2f}s"
+        if self.warmup_time is not None:
+            text += f", warm-up {self.warmup_time:.2f}s"
+        return text
+
+    @staticmethod
+    def load_image(source):
+        """รับได้ทั้ง path และ numpy array (BGR) คืนค่าเป็น array หรือ None ถ้าอ่านไม่ได้"""
+        if isinstance(source, np.ndarray):
+            return source
+        return cv2.imread(source)
+
+    def load_source(self, source):
+        """
+        อ่านรูปสำหรับ detect คืนค่า LoadedImage
+        - เปิด cache: คืน hash ของเนื้อไฟล์มาด้วย (ใช้เป็น key)
+        - เปิด reduced_decode: det_img เป็นรูปย่อ ส่วนรูปเต็มได้จาก .full() ตอน crop
+        - เปิด tiling: รูปที่ใหญ่ถึงเกณฑ์จะคืนเป็น raster (det_img = None) ให้ detect ด้วย detect_tiled
+        - เปิด dedup: คำนวณ perceptual hash ของ det_img มาด้วย (ใน thread ของ decode)
+        - ArchiveMember (รูปใน tar/zip): decode จาก bytes ที่อ่านมาแล้ว (ไม่ผ่าน tiling)
+        """
+        if isinstance(source, np.ndarray):
+            return LoadedImage(source, source, None, None)
+        reduce_to = self.predict_args.get('imgsz', DEFAULT_IMGSZ) if self.reduced_decode else None
+        with timed(self.metrics, "decode"):
+            if isinstance(source, ArchiveMember):
+                if source.error:
+                    raise OSError(source.error)
+                loaded = decode_bytes(source.data, with_digest=self.cache is not None, reduce_to=reduce_to)
+            else:
+                if self.tiling is not None:
+                    raster = open_large(source, self.tiling, self.memory_budget)
+                    if raster is not None:
+                        return LoadedImage(None, None, None, None, raster)
+                loaded = read_image(source, with_digest=self.cache is not None, reduce_to=reduce_to)
+            if self.dedup is not None and loaded.det_img is not None:
+                loaded = loaded._replace(phash=dhash(loaded.det_img))
+            return loaded
+
+    def cache_settings(self):
+        """ค่าที่มีผลกับผล detect (ใช้ประกอบ key ของ cache)"""
+        return detect_settings(self.predict_args, self.reduced_decode, self.cascade)
+
+    def _predict(self, imgs, predict_args):
+        if self.cascade is not None:
+            results = self._predict_cascade(imgs, predict_args)
         else:
-            self.model.to('cpu')
-            print(f"⚠️ Using CPU")
+            results = self.detector.predict(imgs, **predict_args)
+        return [Detections(boxes, classes, confs, img.shape[:2]) for img, (boxes, classes, confs) in zip(imgs, results)]
 
-    # เพิ่ม parameter 'target_class_ids' (รับเป็น list เผื่ออนาคตอยากหาหลายอย่างพร้อมกัน)
-    def crop_image(self, image_path, target_ratio, padding_percent, target_class_id):
-        try:
-            pad_factor = padding_percent / 100.0
-            
-            img = cv2.imread(image_path)
-            if img is None: return None, "Error: Cannot read image"
-            h_img, w_img, _ = img.shape
-            
-            results = self.model.predict(img, verbose=False)
-            
-            if len(results[0].boxes) == 0:
-                return None, "No object detected"
-
-            boxes = results[0].boxes.xyxy.cpu().numpy()
-            classes = results[0].boxes.cls.cpu().numpy()
-            
-            # --- Logic กรอง Class ตามที่เลือกจาก Dropdown ---
-            target_boxes = []
-            for box, cls in zip(boxes, classes):
-                # เช็คว่า Class ตรงกับที่เลือกไหม (เช่น เลือก 0=Person, 2=Car)
-                if int(cls) == int(target_class_id): 
-                    target_boxes.append(box)
-
-            if not target_boxes:
-                return None, f"Target class {target_class_id} not found"
-
-            # --- Logic หาตัวใหญ่สุด (เหมือนเดิม) ---
-            best_box = None
-            max_area = 0
-            for box in target_boxes:
-                x1, y1, x2, y2 = box
-                area = (x2 - x1) * (y2 - y1)
-                if area > max_area:
-                    max_area = area
-                    best_box = box
-
-            if best_box is None: return None, "Detection failed"
-
-            min_x, min_y, max_x, max_y = best_box
-            box_w = max_x - min_x
-            box_h = max_y - min_y
-            
-            pad_x = box_w * pad_factor
-            pad_y = box_h * pad_factor
-
-            base_x1 = max(0, min_x - pad_x)
-            base_y1 = max(0, min_y - pad_y)
-            base_x2 = min(w_img, max_x + pad_x)
-            base_y2 = min(h_img, max_y + pad_y)
-
-            if target_ratio is None:
-                crop_x1, crop_y1, crop_x2, crop_y2 = base_x1, base_y1, base_x2, base_y2
+    def _predict_cascade(self, imgs, predict_args):
+        """รอบถูก (imgsz เล็ก) ทั้ง batch แล้วรันขนาดเต็มเฉพาะรูปที่ผลยังไม่มั่นใจพอ"""
+        with timed(self.metrics, "detect:cascade_low", len(imgs)):
+            results = list(self.detector.predict(imgs, **dict(predict_args, imgsz=self.cascade.imgsz)))
+        retry = [i for i, result in enumerate(results) if not self._confident(result, predict_args)]
+        if retry:
+            with timed(self.metrics, "detect:cascade_full", len(retry)):
+                for i, result in zip(retry, self.detector.predict([imgs[i] for i in retry], **predict_args)):
+                    results[i] = result
+        with self._stats_lock:
+            self.stats["cascade_cheap"] += len(imgs) - len(retry)
+            self.stats["cascade_full"] += len(retry)
+        return results
+
+    def _confident(self, result, predict_args=None):
+        """ผลรอบถูกใช้ได้ไหม: มีกรอบของ class เป้าหมาย (ถ้ากรองไว้) ที่ conf ถึง min_conf"""
+        _, classes, confs = result
+        predict_args = self.predict_args if predict_args is None else predict_args
+        confs = np.asarray(confs).reshape(-1)
+        if "classes" in predict_args:
+            confs = confs[np.isin(np.asarray(classes).reshape(-1).astype(np.int64), predict_args["classes"])]
+        return confs.size > 0 and float(confs.max()) >= self.cascade.min_conf
+
+    def cascade_text(self):
+        """สรุปของ cascade เช่น 'Cascade: 812/1000 image(s) on the 320px pass, 188 re-run at 640px'"""
+        with self._stats_lock:
+            cheap, full = self.stats["cascade_cheap"], self.stats["cascade_full"]
+        return format_cascade(cheap, full, self.cascade.imgsz, self.predict_args.get('imgsz', DEFAULT_IMGSZ))
+
+    def detect_batch(self, imgs, keys=None, hashes=None, predict_args=None):
+        """
+        รัน predict ครั้งเดียวกับรูปทั้งกลุ่ม คืนค่า list ของ Detections เรียงตามลำดับ input
+        keys = hash ของเนื้อไฟล์แต่ละรูป (ถ้ามี cache จะข้ามรูปที่เคย detect แล้ว)
+        hashes = perceptual hash ของแต่ละรูป (ถ้าเปิด dedup รูปที่เกือบซ้ำกับรูปที่ detect แล้วจะใช้ผลเดิม)
+        predict_args = ใช้แทน self.predict_args เฉพาะครั้งนี้ (เช่น class ของ request ใน crop_server)
+        """
+        if not imgs:
+            return []
+        if predict_args is None:
+            predict_args = self.predict_args
+        with timed(self.metrics, "detect", len(imgs)):
+            return self._detect_cached(imgs, keys, hashes, predict_args)
+
+    def _detect_cached(self, imgs, keys, hashes, predict_args):
+        if self.cache is None or keys is None:
+            return self._predict_unique(imgs, hashes, predict_args)[0]
+
+        settings = detect_settings(predict_args, self.reduced_decode, self.cascade)
+        full_keys = [self.cache.make_key(k, self.model_sig, settings) if k else None for k in keys]
+        found = self.cache.get_many([k for k in full_keys if k])
+        detections = [found.get(k) if k else None for k in full_keys]
+
+        missing = [i for i, det in enumerate(detections) if det is None]
+        if missing:
+            dets, reused = self._predict_unique([imgs[i] for i in missing],
+                                                [hashes[i] for i in missing] if hashes is not None else None,
+                                                predict_args)
+            for i, det in zip(missing, dets):
+                detections[i] = det
+            # ผลที่ยืมจากรูปซ้ำเป็นค่าประมาณ ไม่เก็บลง cache ในชื่อของไฟล์นี้
+            self.cache.put_many([(full_keys[i], detections[i]) for i, r in zip(missing, reused)
+                                 if full_keys[i] and not r])
+        return detections
+
+    def _predict_unique(self, imgs, hashes, predict_args):
+        """
+        predict เฉพาะรูปที่ไม่ซ้ำกับรูปที่ detect ไปแล้ว (ใน run นี้ หรือในกลุ่มเดียวกัน)
+        คืนค่า (list ของ Detections, list ของ bool ว่ารูปนั้นใช้ผลของรูปอื่น)
+        """
+        if self.dedup is None or hashes is None:
+            return self._predict(imgs, predict_args), [False] * len(imgs)
+
+        out = [None] * len(imgs)
+        reps, followers = [], {}
+        for i, (img, h) in enumerate(zip(imgs, hashes)):
+            if h is None:
+                reps.append(i)
+                continue
+            det = self.dedup.lookup(h, img.shape[:2])
+            if det is not None:
+                out[i] = scale_detections(det, *img.shape[:2])
+                continue
+            # ซ้ำกับรูปก่อนหน้าในกลุ่มเดียวกันที่ยังไม่ได้ detect -> รอใช้ผลของรูปนั้น
+            match = next((r for r in reps if hashes[r] is not None
+                          and hamming(h, hashes[r]) <= self.dedup.threshold
+                          and same_aspect(imgs[r].shape[:2], img.shape[:2])), None)
+            if match is None:
+                reps.append(i)
             else:
-                current_w = base_x2 - base_x1
-                current_h = base_y2 - base_y1
-                current_ratio = current_w / current_h
-                
-                center_x = base_x1 + (current_w / 2)
-                center_y = base_y1 + (current_h / 2)
-
-                new_w, new_h = 0, 0
-                if current_ratio > target_ratio:
-                    new_w = current_w
-                    new_h = current_w / target_ratio
+                followers[i] = match
+
+        if reps:
+            for i, det in zip(reps, self._predict([imgs[i] for i in reps], predict_args)):
+                out[i] = det
+                if hashes[i] is not None:
+                    self.dedup.add(hashes[i], det)
+        for i, r in followers.items():
+            out[i] = scale_detections(out[r], *imgs[i].shape[:2])
+
+        computed = set(reps)
+        reused = [i not in computed for i in range(len(imgs))]
+        with self._stats_lock:
+            self.stats["dedup_saved"] += len(imgs) - len(reps)
+        return out, reused
+
+    def dedup_text(self):
+        """สรุปของ dedup เช่น 'Dedup: 42 inference(s) saved on near-duplicate images (threshold 5)'"""
+        with self._stats_lock:
+            saved = self.stats["dedup_saved"]
+        return format_dedup(saved, self.dedup.threshold)
+
+    def detect_large(self, raster):
+        """
+        detect รูปใหญ่ทีละ tile (ไม่ผ่าน cache) คืนค่า Detections ในพิกัดของรูปเต็ม
+        เปิด cascade: ถ้าผลของภาพรวมแบบย่อมั่นใจพอ จะไม่ detect ทีละ tile
+        """
+        imgsz = self.predict_args.get('imgsz', DEFAULT_IMGSZ)
+        accept = self._confident if self.cascade is not None else None
+        with timed(self.metrics, "detect"):
+            boxes, classes, confs, tiled = detect_tiled(lambda imgs: self.detector.predict(imgs, **self.predict_args),
+                                                        raster, self.tiling, self.batch_size, imgsz, accept)
+        if self.cascade is not None:
+            with self._stats_lock:
+                self.stats["cascade_full" if tiled else "cascade_cheap"] += 1
+        return Detections(boxes, classes, confs, raster.size)
+
+    def read_region(self, raster, rect):
+        """อ่านกรอบ crop [x1, y1, x2, y2] จาก raster (ไม่เกินเพดาน memory)"""
+        x1, y1, x2, y2 = rect
+        return read_region(raster, x1, y1, x2, y2, self.memory_budget)
+
+    def crop_raster(self, loaded, specs, target_class_id):
+        """detect + crop รูปใหญ่ (LoadedImage ที่มี raster) คืนค่า list ของ (cropped_img, status) ตาม specs"""
+        raster = loaded.raster
+        try:
+            det = self.detect_large(raster)
+            h, w = raster.size
+            with timed(self.metrics, "crop"):
+                rects, status = self.crop_rects(det, h, w, specs, target_class_id)
+            out = []
+            for rect, code in zip(rects.tolist(), status.tolist()):
+                if code != crop_geometry.STATUS_OK:
+                    out.append((None, crop_geometry.status_message(code, target_class_id)))
                 else:
-                    new_h = current_h
-                    new_w = current_h * target_ratio
+                    with timed(self.metrics, "decode_full"):
+                        out.append((np.ascontiguousarray(self.read_region(raster, rect)), "Success"))
+            return out
+        except Exception as e:
+            return [(None, str(e))] * len(specs)
+        finally:
+            raster.close()
+
+    def detect_batch_safe(self, imgs, keys=None, hashes=None, predict_args=None):
+        """
+        เหมือน detect_batch แต่คืนค่าเป็น list ของ (Detections, error)
+        ถ้า predict ทั้งกลุ่มพัง จะถอยไปทีละรูป เพื่อให้ fail เฉพาะรูปที่เป็นตัวปัญหา
+        """
+        if keys is None:
+            keys = [None] * len(imgs)
+        if hashes is None:
+            hashes = [None] * len(imgs)
+        try:
+            return [(det, None) for det in self.detect_batch(imgs, keys, hashes, predict_args)]
+        except Exception:
+            pass
+
+        out = []
+        for img, key, h in zip(imgs, keys, hashes):
+            try:
+                out.append((self.detect_batch([img], [key], [h], predict_args)[0], None))
+            except Exception as e:
+                out.append((None, str(e)))
+        return out
+
+    def crop_from_detections(self, img, det, target_ratio, padding_percent, target_class_id):
+        """คำนวณกรอบ crop จากผล detect ที่ได้มาแล้ว (ไม่เรียกโมเดลซ้ำ)"""
+        return self.crop_variants(img, det, [CropSpec(target_ratio, padding_percent)], target_class_id)[0]
+
+    def crop_variants(self, img, det, specs, target_class_id):
+        """ใช้ผล detect ชุดเดียว crop ออกมาหลายแบบ (ตาม list ของ CropSpec) คืนค่า list ของ (cropped_img, status)"""
+        try:
+            with timed(self.metrics, "crop"):
+                return self._crop_variants(img, det, specs, target_class_id)
+        except Exception as e:
+            return [(None, str(e))] * len(specs)
+
+    def _crop_variants(self, img, det, specs, target_class_id):
+        h_img, w_img = img.shape[:2]
+        rects, status = self.crop_rects(det, h_img, w_img, specs, target_class_id)
+        return self._slice_crops(img, rects, status, target_class_id)
+
+    @staticmethod
+    def crop_rects(det, h_img, w_img, specs, target_class_id):
+        """
+        กรอบ crop ของรูปขนาด (h_img, w_img) ทุก spec โดยไม่ต้องมี pixel ของรูป
+        คืนค่า (rects (M, 4) [x1, y1, x2, y2], status (M,) STATUS_*)
+        """
+        # กรอบจากรูปย่อ -> พิกัดของรูปเต็ม (ถ้า detect กับรูปขนาดเดียวกันจะไม่เปลี่ยนอะไร)
+        det = scale_detections(det, h_img, w_img)
+
+        boxes = np.asarray(det.boxes).reshape(-1, 4)
+        image_index = np.zeros(len(boxes), dtype=np.int64)
+        rects, status = crop_geometry.batch_crop_rects(
+            boxes, det.classes, image_index, [(h_img, w_img)], target_class_id,
+            crop_geometry.ratios_array([s.ratio for s in specs]), [s.padding for s in specs])
+        return rects[0], status[0]
 
-                crop_x1 = center_x - (new_w / 2)
-                crop_y1 = center_y - (new_h / 2)
-                crop_x2 = center_x + (new_w / 2)
-                crop_y2 = center_y + (new_h / 2)
+    @staticmethod
+    def instance_rects(det, h_img, w_img, specs, target_class_id, instances):
+        """
+        เหมือน crop_rects แต่ได้ทุก instance ของ class เป้าหมาย (InstanceOptions)
+        คืนค่า (labels [(class, idx)], rects (K, M, 4), status (K, M), status ของรูป)
+        """
+        det = scale_detections(det, h_img, w_img)
+        return crop_geometry.instance_crop_rects(
+            det.boxes, det.classes, det.confs, (h_img, w_img), target_class_id,
+            crop_geometry.ratios_array([s.ratio for s in specs]), [s.padding for s in specs],
+            instances.top_k, instances.rank)
 
-            final_x1 = int(max(0, crop_x1))
-            final_y1 = int(max(0, crop_y1))
-            final_x2 = int(min(w_img, crop_x2))
-            final_y2 = int(min(h_img, crop_y2))
+    @staticmethod
+    def _slice_crops(img, rects, status, target_class_id):
+        out = []
+        for (x1, y1, x2, y2), code in zip(rects.tolist(), status.tolist()):
+            if code != crop_geometry.STATUS_OK:
+                out.append((None, crop_geometry.status_message(code, target_class_id)))
+            else:
+                out.append((img[y1:y2, x1:x2], "Success"))
+        return out
+
+    # target_class_id รับได้ทั้ง int เดียว หรือ list / set ของ class (เอากรอบที่ใหญ่ที่สุดในทุก class ที่เลือก)
+    def crop_image(self, image_path, target_ratio, padding_percent, target_class_id):
+        result = self._crop_image(image_path, target_ratio, padding_percent, target_class_id)
+        if self.metrics is not None:
+            self.metrics.record_outputs([("", "OK" if result[0] is not None else result[1])])
+        return result
+
+    def _crop_image(self, image_path, target_ratio, padding_percent, target_class_id):
+        try:
+            loaded = self.load_source(image_path)
+            if loaded.raster is not None:
+                return self.crop_raster(loaded, [CropSpec(target_ratio, padding_percent)], target_class_id)[0]
+            if loaded.det_img is None: return None, "Error: Cannot read image"
 
-            if final_x2 <= final_x1 or final_y2 <= final_y1:
-                return None, "Crop area too small"
+            det = self.detect_batch([loaded.det_img], [loaded.key], [loaded.phash])[0]
+            with timed(self.metrics, "decode_full"):
+                img = loaded.full()
+            return self.crop_from_detections(img, det, target_ratio, padding_percent, target_class_id)
+
+        except Exception as e:
+            return None, str(e)
+
+    def crop_instances(self, image_path, specs, target_class_id, instances=InstanceOptions()):
+        """
+        detect ครั้งเดียว แล้ว crop ทุก instance ของ class เป้าหมาย x ทุก spec
+        คืนค่า list ของ (label, variants): label = (class, ลำดับ) หรือ None ถ้าไม่เจอเลย
+        variants = list (ตามลำดับ specs) ของ (cropped_img, status)
+        """
+        specs = list(specs)
+        loaded = None
+        try:
+            loaded = self.load_source(image_path)
+            if loaded.raster is not None:
+                det = self.detect_large(loaded.raster)
+                h, w = loaded.raster.size
+                img = None
+            else:
+                if loaded.det_img is None:
+                    return [(None, [(None, "Error: Cannot read image")] * len(specs))]
+                det = self.detect_batch([loaded.det_img], [loaded.key], [loaded.phash])[0]
+                with timed(self.metrics, "decode_full"):
+                    img = loaded.full()
+                h, w = img.shape[:2]
 
-            cropped_img = img[final_y1:final_y2, final_x1:final_x2]
-            return cropped_img, "Success"
+            with timed(self.metrics, "crop"):
+                labels, rects, status, image_status = self.instance_rects(det, h, w, specs, target_class_id, instances)
+            if not labels:
+                return [(None, [(None, crop_geometry.status_message(image_status, target_class_id))] * len(specs))]
 
+            out = []
+            for label, label_rects, label_status in zip(labels, rects.tolist(), status.tolist()):
+                variants = []
+                for rect, code in zip(label_rects, label_status):
+                    if code != crop_geometry.STATUS_OK:
+                        variants.append((None, crop_geometry.status_message(code, target_class_id)))
+                    elif img is None:
+                        variants.append((np.ascontiguousarray(self.read_region(loaded.raster, rect)), "Success"))
+                    else:
+                        x1, y1, x2, y2 = rect
+                        variants.append((img[y1:y2, x1:x2], "Success"))
+                out.append((label, variants))
+            return out
         except Exception as e:
-            return None, str(e)
\ No newline at end of file
+            return [(None, [(None, str(e))] * len(specs))]
+        finally:
+            if loaded is not None and loaded.raster is not None:
+                loaded.raster.close()
+
+    def crop_batch(self, paths_or_arrays, target_ratio, padding_percent, target_class_id, batch_size=None):
+        """
+        Crop หลายรูปโดยเรียก predict ครั้งเดียวต่อกลุ่ม (ขนาดกลุ่ม = batch_size)
+        คืนค่า list ของ (cropped_img, status) เรียงตามลำดับ input
+        รูปไหนพังจะ fail เฉพาะรูปนั้น ไม่ลากทั้งกลุ่มไปด้วย
+        """
+        specs = [CropSpec(target_ratio, padding_percent)]
+        results = self.crop_batch_variants(paths_or_arrays, specs, target_class_id, batch_size)
+        return [variants[0] for variants in results]
+
+    def crop_batch_variants(self, paths_or_arrays, specs, target_class_id, batch_size=None):
+        """
+        เหมือน crop_batch แต่ decode + detect รูปละครั้งเดียว แล้ว crop ออกมาทุกแบบใน specs
+        คืนค่า list (ตามลำดับ input) ของ list (ตามลำดับ specs) ของ (cropped_img, status)
+        """
+        batch_size = max(1, int(batch_size or self.batch_size))
+        specs = list(specs)
+        sources = list(paths_or_arrays)
+        results = [None] * len(sources)
+
+        for start in range(0, len(sources), batch_size):
+            group = range(start, min(start + batch_size, len(sources)))
+
+            # 1. Decode ทั้งกลุ่ม (รูปที่อ่านไม่ได้ mark fail ไว้เลย)
+            loaded, idxs = [], []
+            for i in group:
+                try:
+                    item = self.load_source(sources[i])
+                except Exception as e:
+                    results[i] = [(None, str(e))] * len(specs)
+                    continue
+                if item.raster is not None:
+                    results[i] = self.crop_raster(item, specs, target_class_id)
+                    continue
+                if item.det_img is None:
+                    results[i] = [(None, "Error: Cannot read image")] * len(specs)
+                    continue
+                loaded.append(item)
+                idxs.append(i)
+
+            # 2. Predict ครั้งเดียวทั้งกลุ่ม
+            dets = self.detect_batch_safe([x.det_img for x in loaded], [x.key for x in loaded],
+                                          [x.phash for x in loaded])
+            ready_idx, ready_imgs, ready_dets = [], [], []
+            for i, item, (det, error) in zip(idxs, loaded, dets):
+                if det is None:
+                    results[i] = [(None, error)] * len(specs)
+                    continue
+                img = item.full()
+                if img is None:
+                    results[i] = [(None, "Error: Cannot read image")] * len(specs)
+                    continue
+                ready_idx.append(i)
+                ready_imgs.append(img)
+                ready_dets.append(scale_detections(det, *img.shape[:2]))
+
+            # 3. คำนวณกรอบ crop ของทุกรูป x ทุก spec ในการเรียกครั้งเดียว (จากรูปเต็มความละเอียด)
+            if ready_idx:
+                try:
+                    boxes, classes, _, image_index = crop_geometry.stack_detections(ready_dets)
+                    rects, status = crop_geometry.batch_crop_rects(
+                        boxes, classes, image_index, [img.shape[:2] for img in ready_imgs], target_class_id,
+                        crop_geometry.ratios_array([s.ratio for s in specs]), [s.padding for s in specs])
+                    for n, (i, img) in enumerate(zip(ready_idx, ready_imgs)):
+                        results[i] = self._slice_crops(img, rects[n], status[n], target_class_id)
+                except Exception as e:
+                    for i in ready_idx:
+                        results[i] = [(None, str(e))] * len(specs)
+
+        return results
+
+
+if __name__ == "__main__":
+    # python -m crop_logic ... = รันแบบ headless (ไม่เปิด GUI)
+    import sys
+    from batch_cli import main
+    sys.exit(main())
@@ -0,0 +1,453 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import socketserver
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import crop_geometry
+from batch_cli import parse_class_ids, parse_ratio, resolve_model
+from crop_logic import AICropper, CropSpec, predict_settings
+from encoder import Encoder, EncodeOptions
+from image_io import decode_bytes, read_image
+from metrics import StageMetrics, timed
+from model_pool import ModelPool
+
+# ==========================================
+# Crop Server (HTTP บนเครื่อง ให้เครื่องมืออื่นขอ crop โดยไม่ต้องโหลดโมเดลเอง)
+# ==========================================
+# ตัวอย่าง:
+#   python crop_server.py --model "General(yolov8n)" --port 8765
+#   python crop_server.py --unix /tmp/smartcrop.sock
+#   curl --data-binary @cat.jpg "http://127.0.0.1:8765/crop?ratio=4:5&padding=15&class_id=0" -o out.jpg
+#   curl --data-binary @cat.jpg "http://127.0.0.1:8765/crop?ratio=1:1&output=box"
+#   curl -X POST "http://127.0.0.1:8765/crop?path=D:/photos/a.jpg&output=box"
+#   curl http://127.0.0.1:8765/metrics
+#
+# decode / crop / encode ทำใน thread ของแต่ละ request ส่วน detect รวม request ที่เข้ามาพร้อมๆ กัน
+# เป็น batch เดียว (MicroBatcher): รอไม่เกิน max_wait_ms หลัง request แรก หรือจนครบ max_batch แล้วค่อย predict
+# โมเดลโหลด + warm-up ครั้งเดียวผ่าน ModelPool โมเดลละ 1 batcher (thread เดียวที่ใช้ AICropper ตัวนั้น)
+# batcher ผูกกับ key ของ pool (ไม่ใช่ชื่อที่ request ส่งมา) และถูกปิดเมื่อ pool ทิ้งโมเดลตัวนั้น
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 16
+DEFAULT_MAX_WAIT_MS = 10.0
+# body ใหญ่สุดที่รับ
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+_CONTENT_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+_EXT = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+
+class RequestError(Exception):
+    """request ผิดรูปแบบ / ใช้ไม่ได้ (ตอบกลับเป็น status code ที่กำหนด)"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class MicroBatcher:
+    """
+    รวมรูปจากหลาย request เป็น batch เดียวก่อน predict  submit() คืน Future ของ Detections
+    class ของแต่ละ request ต่างกันได้: predict ด้วย class รวมของทั้ง batch แล้วแต่ละ request เลือกกรอบของตัวเองตอน crop
+    """
+
+    def __init__(self, cropper, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS, metrics=None,
+                 name="default"):
+        self.cropper = cropper
+        # ชื่อใน /metrics
+        self.name = name
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.metrics = metrics
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        # ขนาด batch -> จำนวนครั้ง / คิวยาวที่สุดที่เคยเห็น
+        self.batch_sizes = {}
+        self.max_depth = 0
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, img, target_class_id=None):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RequestError(503, "Server is shutting down")
+            self._pending.append((img, target_class_id, future, time.perf_counter()))
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._cond.notify()
+        return future
+
+    def _take(self):
+        """รอ request แรก แล้วรอต่ออีกไม่เกิน max_wait (หรือจนครบ max_batch) คืน list ของ job ([] = ปิดแล้ว)"""
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return []
+            deadline = self._pending[0][3] + self.max_wait
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            jobs = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            self.batch_sizes[len(jobs)] = self.batch_sizes.get(len(jobs), 0) + 1
+            return jobs
+
+    def _loop(self):
+        while True:
+            jobs = self._take()
+            if not jobs:
+                return
+            try:
+                self._run(jobs)
+            except Exception as e:
+                for _, _, future, _ in jobs:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _run(self, jobs):
+        now = time.perf_counter()
+        if self.metrics is not None:
+            for job in jobs:
+                self.metrics.observe("queue", now - job[3])
+
+        # class รวมของทั้ง batch (ถ้ามี request ที่ไม่กรอง class ก็ไม่กรองเลย)
+        # ส่งเป็นค่าของ batch นี้ ไม่แก้ cropper.predict_args ที่ใช้ร่วมกัน
+        ids = set()
+        for _, target_class_id, _, _ in jobs:
+            if target_class_id is None:
+                ids = None
+                break
+            ids.update(crop_geometry.class_ids(target_class_id))
+        predict_args = predict_settings(sorted(ids) if ids is not None else None)
+
+        dets = self.cropper.detect_batch_safe([job[0] for job in jobs], predict_args=predict_args)
+        for (_, _, future, _), (det, error) in zip(jobs, dets):
+            if det is None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(det)
+
+    def stats(self):
+        with self._cond:
+            sizes = dict(self.batch_sizes)
+            depth, max_depth = len(self._pending), self.max_depth
+        batches = sum(sizes.values())
+        images = sum(size * n for size, n in sizes.items())
+        return {
+            "queue_depth": depth,
+            "max_queue_depth": max_depth,
+            "batches": batches,
+            "mean_batch_size": round(images / batches, 3) if batches else None,
+            "batch_sizes": {str(k): v for k, v in sorted(sizes.items())},
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+class CropServer:
+    """
+    model_path / backend = โมเดล default (request ระบุ model=<ชื่อใน models_list.json> เพื่อใช้ตัวอื่นได้)
+    ทุก batcher ใช้ StageMetrics ร่วมกัน (decode / queue / detect / crop / encode:*)
+    """
+
+    def __init__(self, model_path, backend, device=None, max_batch=DEFAULT_MAX_BATCH,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, max_models=2):
+        self.model_path = model_path
+        self.backend = backend
+        self.device = device
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.pool = ModelPool(max_models=max_models, on_evict=self._on_evict)
+        self.metrics = StageMetrics()
+        # key ของ ModelPool -> MicroBatcher (ชื่อ / path ที่ชี้ไปไฟล์เดียวกันได้ batcher ตัวเดียวกัน)
+        self.batchers = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def batcher(self, model=None):
+        """batcher ของโมเดล (โหลดครั้งแรกที่มีคนขอ)"""
+        if model is None:
+            path, backend = self.model_path, self.backend
+        else:
+            try:
+                path, backend = resolve_model(model)
+            except ValueError as e:
+                raise RequestError(400, str(e))
+        key = self.pool.key(path, self.device, backend)
+        with self._lock:
+            batcher = self.batchers.get(key)
+        if batcher is not None:
+            # ใช้อยู่ทุก request แต่ไม่ผ่าน pool.get -> บอก pool ว่าเพิ่งใช้ (LRU) ไม่งั้นโมเดลที่งานเยอะสุดจะถูกทิ้งก่อน
+            self.pool.touch(key)
+            return batcher
+
+        # โหลดนอก lock: request ของโมเดลอื่น / /metrics ไม่ต้องรอ (ModelPool กันการโหลดซ้ำเอง)
+        cropper, _ = self.pool.get(path, self.device, backend)
+        stale = None
+        with self._lock:
+            if self._closed:
+                raise RequestError(503, "Server is shutting down")
+            batcher = self.batchers.get(key)
+            if batcher is None or batcher.cropper is not cropper:
+                # batcher เดิม (ถ้ามี) ผูกกับ cropper ที่ pool ทิ้งไปแล้วแต่ _on_evict ยังไม่ทันลบ
+                stale = batcher
+                cropper.configure(batch_size=self.max_batch, metrics=self.metrics)
+                batcher = self.batchers[key] = MicroBatcher(cropper, self.max_batch, self.max_wait_ms, self.metrics,
+                                                            os.path.basename(path))
+        if stale is not None:
+            stale.close()
+        return batcher
+
+    def _on_evict(self, evicted):
+        """pool ทิ้งโมเดลแล้ว: ปิด batcher ของมัน (ทำ request ที่ค้างอยู่ให้เสร็จก่อน) ไม่ถือ cropper ไว้ต่อ"""
+        batchers = []
+        with self._lock:
+            for key, cropper in evicted:
+                # ถ้าระหว่างนี้โมเดลถูกโหลดใหม่แล้ว batcher ใน dict เป็นของตัวใหม่ ไม่ต้องปิด
+                if key in self.batchers and self.batchers[key].cropper is cropper:
+                    batchers.append(self.batchers.pop(key))
+        for batcher in batchers:
+            batcher.close()
+
+    def crop(self, loaded, spec, target_class_id, model=None):
+        """คืนค่า (rect [x1, y1, x2, y2] ในพิกัดรูปเต็ม, รูปเต็ม, status)"""
+        while True:
+            try:
+                future = self.batcher(model).submit(loaded.det_img, target_class_id)
+                break
+            except RequestError as e:
+                # batcher เพิ่งถูกปิดเพราะโมเดลถูกทิ้งออกจาก pool -> ขอตัวใหม่ (โหลดใหม่)
+                if e.code != 503 or self._closed:
+                    raise
+        det = future.result()
+        with timed(self.metrics, "decode_full"):
+            img = loaded.full()
+        if img is None:
+            raise RequestError(400, "Cannot read image")
+        h, w = img.shape[:2]
+        with timed(self.metrics, "crop"):
+            rects, status = AICropper.crop_rects(det, h, w, [spec], target_class_id)
+        code = int(status[0])
+        if code != crop_geometry.STATUS_OK:
+            return None, img, crop_geometry.status_message(code, target_class_id)
+        return [int(v) for v in rects[0]], img, "OK"
+
+    def stats(self):
+        with self._lock:
+            batchers = dict(self.batchers)
+        return {
+            "models": {b.name: b.stats() for b in batchers.values()},
+            "pipeline": self.metrics.to_dict(),
+        }
+
+    def to_prometheus(self, prefix="smartcrop"):
+        lines = [self.metrics.to_prometheus(prefix).rstrip("\n")]
+        with self._lock:
+            batchers = dict(self.batchers)
+        gauges = (("queue_depth", "Requests waiting for the next batch."),
+                  ("max_queue_depth", "Longest queue seen since start."))
+        for key, text in gauges:
+            name = f"{prefix}_server_{key}"
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} gauge"]
+            for b in batchers.values():
+                lines.append(f'{name}{{model="{b.name}"}} {b.stats()[key]}')
+        name = f"{prefix}_server_batches_total"
+        lines += [f"# HELP {name} Predict calls by batch size.", f"# TYPE {name} counter"]
+        for b in batchers.values():
+            for size, n in b.stats()["batch_sizes"].items():
+                lines.append(f'{name}{{model="{b.name}",size="{size}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            batchers, self.batchers = list(self.batchers.values()), {}
+        for batcher in batchers:
+            batcher.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "SmartCrop/1.0"
+    # keep-alive: client เรียกซ้ำๆ ไม่ต้องเปิด connection ใหม่ทุกครั้ง
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def app(self):
+        return self.server.app
+
+    def address_string(self):
+        # Unix socket ไม่มี (host, port)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_request(self, code="-", size="-"):
+        # ไม่ log ทุก request (ช้าเมื่อมี request เยอะ) error ยัง log ตามปกติ
+        pass
+
+    def _send(self, code, body, content_type, headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, code, obj):
+        self._send(code, json.dumps(obj).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif url.path == "/metrics":
+            if query.get("format", [""])[0] == "json":
+                self._send_json(200, self.app.stats())
+            else:
+                self._send(200, self.app.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"status": f"Not found: {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        # อ่าน body ให้หมดก่อนเสมอ (ไม่งั้น keep-alive connection จะเพี้ยน)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"status": "Request body too large"})
+            return
+        body = self.rfile.read(length) if length else b""
+        if url.path != "/crop":
+            self._send_json(404, {"status": f"Not found: {url.path}"})
+            return
+        try:
+            self._crop(parse_qs(url.query), body)
+        except RequestError as e:
+            self._send_json(e.code, {"status": str(e)})
+        except Exception as e:
+            self._send_json(500, {"status": f"Error: {e}"})
+
+    def _crop(self, query, body):
+        def param(name, default=None):
+            return query.get(name, [default])[0]
+
+        try:
+            spec = CropSpec(parse_ratio(param("ratio", "free")), int(param("padding", "15")))
+            target_class_id = parse_class_ids(param("class_id", "0"))
+            quality = int(param("quality", "95"))
+        except ValueError as e:
+            raise RequestError(400, str(e))
+        output = param("output", "image")
+        fmt = param("format", "jpeg")
+        if output not in ("image", "box"):
+            raise RequestError(400, f"Unknown output '{output}' (image, box)")
+        if fmt not in _EXT:
+            raise RequestError(400, f"Unknown format '{fmt}' ({', '.join(_EXT)})")
+
+        path = param("path")
+        with timed(self.app.metrics, "decode"):
+            if path is not None:
+                if not os.path.isfile(path):
+                    raise RequestError(404, f"File not found: {path}")
+                loaded = read_image(path)
+            elif body:
+                loaded = decode_bytes(body)
+            else:
+                raise RequestError(400, "Send image bytes as the request body or pass path=")
+        if loaded.det_img is None:
+            raise RequestError(400, "Cannot read image")
+
+        rect, img, status = self.app.crop(loaded, spec, target_class_id, param("model"))
+        self.app.metrics.record_outputs([("", status)])
+        if rect is None:
+            self._send_json(422, {"status": status})
+            return
+        h, w = img.shape[:2]
+        if output == "box":
+            self._send_json(200, {"status": "OK", "box": rect, "image_size": [w, h]})
+            return
+
+        x1, y1, x2, y2 = rect
+        encoder = Encoder(EncodeOptions(fmt, quality))
+        buf = encoder.encode("crop" + _EXT[fmt], img[y1:y2, x1:x2], self.app.metrics)
+        if buf is None:
+            raise RequestError(500, "Cannot encode image")
+        self._send(200, buf.tobytes(), _CONTENT_TYPES[fmt], {"X-Crop-Box": f"{x1},{y1},{x2},{y2}"})
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(app, host="127.0.0.1", port=DEFAULT_PORT, unix_socket=None):
+    """สร้าง HTTP server (ยังไม่เริ่มรับ request: เรียก serve_forever() เอง)"""
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        httpd = _UnixHTTPServer(unix_socket, _Handler)
+    else:
+        httpd = ThreadingHTTPServer((host, port), _Handler)
+        httpd.daemon_threads = True
+    httpd.app = app
+    return httpd
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AI Smart Crop - local crop server")
+    parser.add_argument("--model", default=None, help="Default model (name from config/models_list.json or a path)")
+    parser.add_argument("--backend", choices=("torch", "onnx"), default=None)
+    parser.add_argument("--device", default=None, help="cpu, cuda, cuda:1 ... (default: auto)")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument("--unix", default=None, metavar="PATH", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help=f"Most images per predict call (default: {DEFAULT_MAX_BATCH})")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="How long the first request of a batch waits for others (default: 10)")
+    parser.add_argument("--max-models", type=int, default=2, help="Models kept loaded at once (default: 2)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        model_path, backend = resolve_model(args.model)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+
+    app = CropServer(model_path, args.backend or backend, args.device, args.max_batch, args.max_wait_ms,
+                     args.max_models)
+    # โหลดโมเดล default ก่อนเปิดรับ request (request แรกไม่ต้องรอโหลด)
+    app.batcher()
+    httpd = serve(app, args.host, args.port, args.unix)
+    where = args.unix or f"http://{args.host}:{httpd.server_address[1]}"
+    print(f"Serving {model_path} on {where} (batch <= {args.max_batch}, wait <= {args.max_wait_ms:g} ms)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        app.close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import threading
+
+import cv2
+import numpy as np
+
+# ==========================================
+# Near-duplicate Detection (ใช้ผล detect ของรูปที่เหมือนกันซ้ำ)
+# ==========================================
+# burst shot / export ซ้ำ / รูปเดิมที่ถูกย่อขนาด -> hash แบบ perceptual (dHash 64 bit) ต่างกันไม่กี่ bit
+# รูปแรกของกลุ่ม (representative) รัน YOLO ตามปกติ รูปถัดๆ ไปที่ hash ห่างไม่เกิน threshold
+# ใช้กรอบของ representative (scale ตามขนาดรูปเองตอน crop) ไม่ต้องรันโมเดลซ้ำ
+# ค้นด้วย BK-tree (ไม่ต้องเทียบกับทุกรูปที่เคยเห็น) index อยู่ใน memory ของ run นั้นๆ เท่านั้น
+
+DEFAULT_THRESHOLD = 5
+
+# รูปที่สัดส่วนต่างกันเกินนี้ไม่ถือว่าซ้ำ (เช่น รูปเดิมที่ถูก crop มาแล้ว) แม้ hash จะใกล้กัน
+_ASPECT_TOLERANCE = 0.02
+
+
+def dhash(img, size=8):
+    """difference hash: ย่อเป็น (size+1) x size แบบ grayscale แล้วเทียบ pixel ที่ติดกันในแนวนอน คืนค่า int"""
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(img, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).reshape(-1)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """BK-tree บน hamming distance: ค้นหา hash ที่ห่างไม่เกิน d โดยข้าม subtree ที่เป็นไปไม่ได้"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, h, value):
+        node = [h, value, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        cur = self.root
+        while True:
+            d = hamming(h, cur[0])
+            child = cur[2].get(d)
+            if child is None:
+                cur[2][d] = node
+                return
+            cur = child
+
+    def nearest(self, h, max_dist):
+        """(distance, value) ของตัวที่ใกล้ที่สุดที่ห่างไม่เกิน max_dist หรือ None"""
+        if self.root is None:
+            return None
+        best = None
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= max_dist and (best is None or d < best[0]):
+                best = (d, node[1])
+                if d == 0:
+                    break
+            limit = best[0] if best is not None else max_dist
+            for dist, child in node[2].items():
+                if d - limit <= dist <= d + limit:
+                    stack.append(child)
+        return best
+
+
+class DedupIndex:
+    """
+    index ของรูปที่ detect แล้วใน run นี้: hash -> Detections ของ representative
+    threshold = hamming distance สูงสุด (จาก 64 bit) ที่ถือว่าเป็นรูปเดียวกัน
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = int(threshold)
+        self.tree = BKTree()
+        self._lock = threading.Lock()
+
+    def lookup(self, h, shape):
+        """Detections ของรูปที่ซ้ำกัน (สัดส่วนต้องใกล้กัน) หรือ None"""
+        with self._lock:
+            found = self.tree.nearest(h, self.threshold)
+        if found is None:
+            return None
+        det = found[1]
+        if not same_aspect(det.shape, shape):
+            return None
+        return det
+
+    def add(self, h, det):
+        with self._lock:
+            self.tree.add(h, det)
+
+
+def same_aspect(a, b):
+    if a is None or b is None:
+        return False
+    return abs((a[1] / a[0]) / (b[1] / b[0]) - 1.0) <= _ASPECT_TOLERANCE
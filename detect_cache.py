@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+# ==========================================
+# Detection Cache (เก็บผล detect ลง disk)
+# ==========================================
+# key = hash ของเนื้อไฟล์ + โมเดล + ค่า predict ที่ใช้
+# เปลี่ยนแค่ ratio / padding แล้วรันใหม่ จะไม่ต้องรัน YOLO ซ้ำ
+# ขนาดรวมถูกจำกัดด้วย max_bytes (ลบอันที่ไม่ได้ใช้นานที่สุดออกก่อน)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# ค่าประมาณ overhead ต่อ 1 แถวของ sqlite (key + index)
+_ROW_OVERHEAD = 96
+
+# เปลี่ยนเลขนี้เมื่อรูปแบบ payload เปลี่ยน (ของเก่าจะไม่ถูกอ่าน แล้วค่อยๆ ถูก evict ออกไป)
+_PAYLOAD_VERSION = 2
+
+
+def content_digest(data):
+    """hash ของเนื้อไฟล์ (bytes หรือ numpy array)"""
+    return hashlib.sha1(memoryview(data).cast('B')).hexdigest()
+
+
+def evict_lru(conn, table, max_bytes):
+    """
+    ตาราง sqlite แบบ (key, ..., size, atime): นับขนาดจริงใหม่ (process อื่นอาจเขียนเพิ่ม)
+    ถ้าเกิน max_bytes ลบอันที่ไม่ได้ใช้นานที่สุดจนเหลือ 90% คืนค่าขนาดรวมหลังลบ (ใช้ร่วมกับ ThumbnailCache)
+    """
+    total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+    if total <= max_bytes:
+        return total
+    target = int(max_bytes * 0.9)
+    removed = 0
+    victims = []
+    for key, size in conn.execute(f"SELECT key, size FROM {table} ORDER BY atime ASC").fetchall():
+        if total - removed <= target:
+            break
+        victims.append((key,))
+        removed += size
+    conn.executemany(f"DELETE FROM {table} WHERE key=?", victims)
+    conn.commit()
+    return total - removed
+
+
+def model_signature(model_path):
+    """path + ขนาด + เวลาแก้ไขของไฟล์โมเดล (train ใหม่ทับไฟล์เดิม cache ก็จะไม่ถูกใช้ผิด)"""
+    try:
+        st = os.stat(model_path)
+        return f"{os.path.abspath(model_path)}|{st.st_size}|{st.st_mtime_ns}"
+    except OSError:
+        return str(model_path)
+
+
+class DetectionCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "detections.sqlite")
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS detections ("
+            " key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_atime ON detections(atime)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM detections").fetchone()[0]
+
+    @staticmethod
+    def make_key(digest, model_sig, settings):
+        raw = f"v{_PAYLOAD_VERSION}|{digest}|{model_sig}|{json.dumps(settings, sort_keys=True)}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _pack(det):
+        # แถวแรกเก็บ shape (h, w) ของรูปที่ใช้ detect ที่เหลือคือ [x1, y1, x2, y2, cls, conf]
+        n = len(det.boxes)
+        arr = np.zeros((n + 1, 6), dtype=np.float32)
+        if det.shape is not None:
+            arr[0, :2] = det.shape[:2]
+        if n:
+            arr[1:, :4] = det.boxes
+            arr[1:, 4] = det.classes
+            arr[1:, 5] = det.confs
+        return arr.tobytes()
+
+    @staticmethod
+    def _unpack(payload):
+        from crop_logic import Detections
+
+        arr = np.frombuffer(payload, dtype=np.float32).reshape(-1, 6)
+        h, w = int(arr[0, 0]), int(arr[0, 1])
+        shape = (h, w) if h and w else None
+        rows = arr[1:]
+        return Detections(rows[:, :4].copy(), rows[:, 4].copy(), rows[:, 5].copy(), shape)
+
+    def get_many(self, keys):
+        """คืนค่า dict {key: Detections} เฉพาะตัวที่มีใน cache"""
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, payload FROM detections WHERE key IN ({marks})", part).fetchall()
+                for key, payload in rows:
+                    found[key] = self._unpack(payload)
+            if found:
+                self._conn.executemany("UPDATE detections SET atime=? WHERE key=?", [(now, k) for k in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """items = list ของ (key, Detections)"""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, det in items:
+            payload = self._pack(det)
+            rows.append((key, payload, len(payload) + len(key) + _ROW_OVERHEAD, now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO detections (key, payload, size, atime) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._total += sum(r[2] for r in rows)
+            if self._total > self.max_bytes:
+                self._total = evict_lru(self._conn, "detections", self.max_bytes)
+
+    def stats_text(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"Detection cache: {self.hits} hit(s), {self.misses} miss(es) ({rate:.0f}% hit)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,273 @@
+import os
+
+import cv2
+import numpy as np
+
+from detect_cache import model_signature
+
+# ==========================================
+# Detector Backends (ตัวรันโมเดลที่อยู่หลัง AICropper)
+# ==========================================
+# ทุก backend มี predict(imgs, **predict_args) คืน list ของ (boxes xyxy, classes, confs) เป็น numpy
+# พิกัดอยู่ในระบบของรูป input แต่ละรูป (BGR, ขนาดไหนก็ได้)
+# เลือก backend ได้ต่อโมเดลใน config/models_list.json: "backend": "torch" (default) หรือ "onnx"
+# "stub" = ตัวปลอมที่ไม่ต้องใช้ไฟล์โมเดล (ใช้กับ benchmarks/ ให้รันแบบ offline ได้)
+
+BACKENDS = ("torch", "onnx", "stub")
+DEFAULT_BACKEND = "torch"
+
+# ค่า default เดียวกับ ultralytics predict
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.7
+DEFAULT_MAX_DET = 300
+_LETTERBOX_COLOR = (114, 114, 114)
+# ระยะเลื่อนกรอบของแต่ละ class ตอนทำ NMS (ให้กรอบต่าง class ไม่ทับกัน) เหมือน ultralytics
+_MAX_WH = 7680
+
+
+def detector_signature(model_path, backend=DEFAULT_BACKEND):
+    """model_signature + ชื่อ backend (ผล detect ของแต่ละ backend ต่างกันเล็กน้อย -> cache แยกกัน)"""
+    sig = model_signature(model_path)
+    return sig if backend == DEFAULT_BACKEND else f"{sig}|{backend}"
+
+
+def import_torch():
+    """
+    import torch + ultralytics ตอนที่ต้องใช้จริงเท่านั้น (ช้าหลายวินาที และกิน memory หลายร้อย MB)
+    ไม่มี module ไหน import ไว้ตอนเริ่มโปรแกรม GUI จึงเปิดหน้าต่างได้ทันที คืนค่า (torch, YOLO)
+    """
+    import torch
+    from ultralytics import YOLO
+
+    # แก้ปัญหา PyTorch 2.4+ (torch.load แบบ weights_only) ให้โหลด weights ของ ultralytics ได้
+    try:
+        from ultralytics.nn.tasks import DetectionModel
+        torch.serialization.add_safe_globals([DetectionModel])
+    except (ImportError, AttributeError):
+        pass
+    return torch, YOLO
+
+
+def resolve_device(device=None):
+    """None = เลือกเอง (มี GPU ใช้ GPU)"""
+    if device is None:
+        import torch
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    return str(device)
+
+
+def create_detector(backend, model_path, device=None, threads=None):
+    """threads = จำนวน thread ต่อ process ของ backend (None = ค่า default ของ backend)"""
+    backend = (backend or DEFAULT_BACKEND).lower()
+    if backend == "torch":
+        return TorchDetector(model_path, device, threads)
+    if backend == "onnx":
+        return OnnxDetector(model_path, device, threads=threads)
+    if backend == "stub":
+        return StubDetector(model_path, device)
+    raise ValueError(f"Unknown backend '{backend}' (available: {', '.join(BACKENDS)})")
+
+
+class TorchDetector:
+    """ultralytics YOLO บน torch (แบบเดิม)"""
+    name = "torch"
+
+    def __init__(self, model_path, device=None, threads=None):
+        torch, YOLO = import_torch()
+
+        if threads:
+            torch.set_num_threads(threads)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                # ตั้งได้ครั้งเดียวต่อ process (ก่อนเริ่มงานแบบ parallel ครั้งแรก)
+                pass
+        self.device = resolve_device(device)
+        self.model = YOLO(model_path)
+        self.model.to(self.device)
+        if self.device.startswith('cuda'):
+            print(f"✅ Using GPU: {torch.cuda.get_device_name(torch.device(self.device))}")
+        else:
+            print(f"⚠️ Using CPU")
+
+    def predict(self, imgs, **predict_args):
+        results = self.model.predict(list(imgs), verbose=False, **predict_args)
+        return [(r.boxes.xyxy.cpu().numpy(), r.boxes.cls.cpu().numpy(), r.boxes.conf.cpu().numpy())
+                for r in results]
+
+
+def export_onnx(pt_path, imgsz=640):
+    """
+    แปลง .pt เป็น .onnx ครั้งเดียว แล้วเก็บไว้ข้างไฟล์ .pt (ชื่อเดียวกัน)
+    ถ้ามี .onnx ที่ใหม่กว่า .pt อยู่แล้วจะใช้ของเดิม
+    """
+    if pt_path.lower().endswith(".onnx"):
+        return pt_path
+    onnx_path = os.path.splitext(pt_path)[0] + ".onnx"
+    if os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(pt_path):
+        return onnx_path
+
+    _, YOLO = import_torch()
+
+    print(f"Exporting {pt_path} -> {onnx_path} (one time)")
+    # dynamic=True: รับ batch ได้หลายรูปต่อครั้ง
+    exported = YOLO(pt_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    if exported and os.path.abspath(str(exported)) != os.path.abspath(onnx_path):
+        os.replace(str(exported), onnx_path)
+    return onnx_path
+
+
+def letterbox(img, size):
+    """
+    ย่อรูปให้พอดี size x size โดยคงสัดส่วน แล้วเติมขอบสีเทา (แบบเดียวกับ ultralytics LetterBox)
+    คืนค่า (รูปใหม่, gain, (pad_x, pad_y))
+    """
+    h, w = img.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    if (w, h) != (new_w, new_h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=_LETTERBOX_COLOR)
+    return img, gain, (left, top)
+
+
+def nms(boxes, scores, iou_thres):
+    """Non-maximum suppression (NumPy) คืน index ของกรอบที่เหลือ เรียงตาม score มาก->น้อย"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess(pred, conf, iou, max_det, classes=None):
+    """
+    แปลง output ของ YOLOv8/11 ต่อ 1 รูป (4 + nc, anchors) เป็น (boxes xyxy, classes, confs) ในพิกัด letterbox
+    ทำแบบเดียวกับ ultralytics non_max_suppression (ไม่ agnostic: NMS แยกตาม class)
+    """
+    pred = pred.T
+    scores_all = pred[:, 4:]
+    cls = scores_all.argmax(axis=1)
+    score = scores_all[np.arange(len(cls)), cls]
+
+    mask = score > conf
+    if classes is not None:
+        mask &= np.isin(cls, classes)
+    pred, cls, score = pred[mask], cls[mask], score[mask]
+    if not len(pred):
+        empty = np.zeros(0, dtype=np.float32)
+        return np.zeros((0, 4), dtype=np.float32), empty, empty
+
+    cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    keep = nms(boxes + (cls * _MAX_WH)[:, None], score, iou)[:max_det]
+    return boxes[keep].astype(np.float32), cls[keep].astype(np.float32), score[keep].astype(np.float32)
+
+
+class OnnxDetector:
+    """
+    ONNX Runtime บน CPU (ไม่ต้องใช้ torch ตอนรัน) pre/post-process ทำเองด้วย NumPy
+    รับได้ทั้ง .onnx ตรงๆ หรือ .pt (จะ export เป็น .onnx ไว้ข้างๆ ให้ครั้งแรก)
+    """
+    name = "onnx"
+
+    def __init__(self, model_path, device=None, imgsz=640, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime (pip install onnxruntime)")
+
+        if device not in (None, 'cpu'):
+            print(f"⚠️ onnx backend runs on CPU only (requested {device})")
+        self.device = 'cpu'
+
+        path = export_onnx(model_path, imgsz)
+        opts = ort.SessionOptions()
+        # batch_cli ส่ง --threads มาต่อ worker: ไม่ให้ N process แย่ง core กัน
+        if threads:
+            opts.intra_op_num_threads = int(threads)
+            opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # export แบบ dynamic: shape เป็นชื่อ (str) แทนตัวเลข
+        self.fixed_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+        self.fixed_size = inp.shape[2] if isinstance(inp.shape[2], int) else None
+        print(f"⚠️ Using CPU (onnxruntime, {os.path.basename(path)})")
+
+    def predict(self, imgs, imgsz=640, conf=DEFAULT_CONF, iou=DEFAULT_IOU, max_det=DEFAULT_MAX_DET,
+                classes=None, **_):
+        size = self.fixed_size or imgsz
+        blobs, metas = [], []
+        for img in imgs:
+            boxed, gain, pad = letterbox(img, size)
+            blobs.append(boxed[:, :, ::-1].transpose(2, 0, 1))  # BGR HWC -> RGB CHW
+            metas.append((gain, pad, img.shape[:2]))
+
+        outputs = []
+        step = self.fixed_batch or len(blobs)
+        for start in range(0, len(blobs), step):
+            batch = np.ascontiguousarray(np.stack(blobs[start:start + step]), dtype=np.float32) / 255.0
+            outputs.extend(self.session.run(None, {self.input_name: batch})[0])
+
+        results = []
+        for pred, (gain, (pad_x, pad_y), (h, w)) in zip(outputs, metas):
+            boxes, cls, score = postprocess(pred, conf, iou, max_det, classes)
+            # พิกัด letterbox -> พิกัดรูปเดิม
+            boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / gain).clip(0, w)
+            boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / gain).clip(0, h)
+            results.append((boxes, cls, score))
+        return results
+
+
+class StubDetector:
+    """
+    detector ปลอมสำหรับ benchmark: ไม่โหลดโมเดล ผลลัพธ์ขึ้นกับเนื้อรูปเท่านั้น (รันซ้ำได้ผลเดิมทุกครั้ง)
+    คืนกรอบ 1-3 กรอบต่อรูป (class 0 อย่างน้อย 1 กรอบ)
+    delay_ms = เวลาที่หน่วงต่อรูป (จำลองเวลา inference) ปรับได้หลังสร้าง
+    call_delay_ms = เวลาที่หน่วงต่อการเรียก predict 1 ครั้ง (จำลอง overhead คงที่ที่ batch ช่วยเฉลี่ยได้)
+    """
+    name = "stub"
+
+    def __init__(self, model_path=None, device=None, delay_ms=0.0, call_delay_ms=0.0):
+        self.device = 'cpu'
+        self.delay_ms = delay_ms
+        self.call_delay_ms = call_delay_ms
+
+    def predict(self, imgs, conf=DEFAULT_CONF, max_det=DEFAULT_MAX_DET, classes=None, **_):
+        import time
+
+        if self.delay_ms or self.call_delay_ms:
+            time.sleep((self.call_delay_ms + self.delay_ms * len(imgs)) / 1000.0)
+        results = []
+        for img in imgs:
+            h, w = img.shape[:2]
+            # ค่า seed จากพิกเซลตัวอย่างบางจุด (ถูก ไม่ต้องอ่านทั้งรูป)
+            seed = int(img[::max(1, h // 16), ::max(1, w // 16)].astype(np.int64).sum())
+            n = 1 + seed % 3
+            boxes = np.zeros((n, 4), dtype=np.float32)
+            for i in range(n):
+                v = (seed >> (3 * i)) % 97 / 97.0
+                bw, bh = w * (0.2 + 0.5 * v), h * (0.3 + 0.4 * v)
+                x1, y1 = (w - bw) * ((seed >> i) % 11) / 10.0, (h - bh) * ((seed >> (i + 2)) % 11) / 10.0
+                boxes[i] = (x1, y1, x1 + bw, y1 + bh)
+            cls = (np.arange(n) % 2).astype(np.float32)
+            confs = np.linspace(0.9, 0.5, n, dtype=np.float32)
+            keep = confs > conf
+            if classes is not None:
+                keep &= np.isin(cls, classes)
+            keep = np.flatnonzero(keep)[:max_det]
+            results.append((boxes[keep], cls[keep], confs[keep]))
+        return results
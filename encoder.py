@@ -0,0 +1,96 @@
+import os
+import shutil
+import time
+from collections import namedtuple
+
+import cv2
+
+# ==========================================
+# Output Encoder (เลือก format / quality ของไฟล์ output)
+# ==========================================
+# format: "keep" = นามสกุลเดียวกับไฟล์ต้นฉบับ (แบบเดิม) หรือ "jpeg" / "png" / "webp"
+# quality: JPEG / WebP (1-100), png_compression: 0 (เร็ว ไฟล์ใหญ่) - 9 (ช้า ไฟล์เล็ก)
+# max_dim: ถ้าด้านยาวของรูป crop เกินค่านี้ จะย่อก่อน encode (0 = ไม่ย่อ)
+# copy_source: crop แล้วได้ทั้งรูป (และไม่ต้องย่อ/เปลี่ยน format) -> copy ไฟล์เดิมเลย ไม่ decode/encode ใหม่
+
+EncodeOptions = namedtuple("EncodeOptions", ["format", "quality", "png_compression", "max_dim", "copy_source"],
+                           defaults=("keep", 95, 1, 0, True))
+
+FORMATS = ("keep", "jpeg", "png", "webp")
+_EXT = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+_FORMAT_OF_EXT = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".webp": "webp", ".bmp": "bmp"}
+
+
+def format_of(path):
+    return _FORMAT_OF_EXT.get(os.path.splitext(path)[1].lower(), "other")
+
+
+class Encoder:
+    # metrics (StageMetrics) ที่ส่งให้ write / copy: เก็บเวลา encode แยกตาม format (stage "encode:jpeg" ฯลฯ) และ "copy"
+    def __init__(self, options=None):
+        self.options = options or EncodeOptions()
+
+    def extension(self, src_path):
+        """นามสกุลของไฟล์ output (format=keep ใช้นามสกุลเดิม)"""
+        if self.options.format == "keep":
+            return os.path.splitext(src_path)[1]
+        return _EXT[self.options.format]
+
+    def params(self, fmt):
+        o = self.options
+        if fmt == "jpeg":
+            return [cv2.IMWRITE_JPEG_QUALITY, int(o.quality)]
+        if fmt == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, int(o.quality)]
+        if fmt == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, int(o.png_compression)]
+        return []
+
+    def needs_resize(self, w, h):
+        return bool(self.options.max_dim) and max(w, h) > self.options.max_dim
+
+    def can_copy(self, src_path, w, h):
+        """ไฟล์ต้นฉบับใช้เป็น output ได้เลยไหม (format เดียวกัน และไม่ต้องย่อ)"""
+        if not self.options.copy_source or self.needs_resize(w, h):
+            return False
+        return self.options.format == "keep" or self.options.format == format_of(src_path)
+
+    def copy(self, src_path, save_path, metrics=None):
+        start = time.perf_counter()
+        try:
+            # output folder = input folder และชื่อเดียวกัน -> ไฟล์เดิมคือผลลัพธ์อยู่แล้ว
+            if not (os.path.exists(save_path) and os.path.samefile(src_path, save_path)):
+                shutil.copyfile(src_path, save_path)
+        except OSError:
+            return "", "Failed: Error: Cannot write image"
+        if metrics is not None:
+            metrics.observe("copy", time.perf_counter() - start)
+        return save_path, "OK"
+
+    def encode(self, name, img, metrics=None):
+        """ย่อ (ถ้าตั้ง max_dim) -> encode ตามนามสกุลของ name คืนค่า buffer (numpy uint8) หรือ None ถ้า encode ไม่ได้"""
+        h, w = img.shape[:2]
+        if self.needs_resize(w, h):
+            scale = self.options.max_dim / max(w, h)
+            img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+        fmt = format_of(name)
+        ext = os.path.splitext(name)[1] or ".jpg"
+        start = time.perf_counter()
+        ok, buf = cv2.imencode(ext, img, self.params(fmt))
+        if metrics is not None:
+            metrics.observe(f"encode:{fmt}", time.perf_counter() - start)
+        return buf if ok else None
+
+    def write(self, save_path, img, metrics=None):
+        """ย่อ (ถ้าตั้ง max_dim) -> encode -> เขียนไฟล์ คืนค่า (save_path, status)"""
+        buf = self.encode(save_path, img, metrics)
+        if buf is None:
+            return "", "Failed: Error: Cannot encode image"
+
+        # เขียนเองแทน cv2.imwrite (รองรับ path ภาษาไทย/unicode บน Windows)
+        try:
+            buf.tofile(save_path)
+        except OSError:
+            return "", "Failed: Error: Cannot write image"
+        return save_path, "OK"
@@ -1,15 +1,49 @@
 import sys
 import os
-import cv2
+import time
+# เวลาเริ่มโปรแกรม (ใช้วัด startup: import / สร้างหน้าต่าง / first paint / โมเดลพร้อม)
+_STARTED = time.perf_counter()
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QPushButton, QListWidget, 
                              QListWidgetItem, QLineEdit, QFileDialog, QComboBox, 
-                             QSlider, QProgressBar, QSplitter, QFrame, QMessageBox, QDialog) # <--- เพิ่ม QSlider ตรงนี้แล้ว
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QSize, QSettings
-from PyQt6.QtGui import QIcon, QPixmap, QImage
+                             QSlider, QProgressBar, QSplitter, QFrame, QMessageBox, QDialog,
+                             QCheckBox, QSpinBox, QDoubleSpinBox) # <--- เพิ่ม QSlider ตรงนี้แล้ว
+from PyQt6.QtCore import Qt, QThread, QObject, QTimer, pyqtSignal, QSize, QSettings
+from PyQt6.QtGui import QIcon, QPixmap, QImage, QColor
 import json
 # Import Logic ที่แยกไว้ (ต้องมีไฟล์ crop_logic.py อยู่ที่เดียวกัน)
-from crop_logic import AICropper
+from crop_logic import (CropSpec, CascadeOptions, InstanceOptions, DEFAULT_BATCH_SIZE, RATIO_MAP, IMAGE_EXTS, VIDEO_EXTS,
+                        predict_settings, ratio_folder_name)
+from pipeline import CropPipeline
+from detect_cache import DetectionCache
+from manifest import RunManifest, settings_key
+from thumb_cache import ThumbnailCache, THUMB_SIZE
+from model_pool import shared_pool
+from detectors import DEFAULT_BACKEND, import_torch
+from metrics import StageMetrics, format_eta
+from encoder import Encoder, EncodeOptions, FORMATS
+from video import VideoCropper, DEFAULT_STRIDE, is_video
+from tiling import TileOptions
+from dedup import DEFAULT_THRESHOLD
+from archive_io import ShardWriter, is_member
+
+# import ทั้งหมดข้างบน (torch / ultralytics ไม่รวม: โหลดใน ModelPreloadThread หลังหน้าต่างขึ้นแล้ว)
+IMPORT_TIME = time.perf_counter() - _STARTED
+
+# รันด้วย --startup-exit: ปิดเองหลัง first paint แล้ว print เวลา startup เป็น JSON (ใช้กับ benchmarks/bench_startup.py)
+STARTUP_EXIT = "--startup-exit"
+
+
+def startup_text(startup):
+    """
+    เช่น 'imports 0.41s · window 0.58s · first paint 0.63s · torch import 2.90s · model ready 4.20s'
+    ทุกค่าเป็นวินาทีนับจากเริ่มโปรแกรม ยกเว้น torch import (เวลาที่ใช้ import อย่างเดียว)
+    """
+    names = (("imports", "imports"), ("window", "window"), ("first_paint", "first paint"),
+             ("torch_import", "torch import"), ("model_ready", "model ready"))
+    return " · ".join(f"{label} {startup[key]:.2f}s" for key, label in names if key in startup)
 
 # ==========================================
 # Worker Thread
@@ -18,54 +52,212 @@ class WorkerThread(QThread):
     progress_signal = pyqtSignal(int)
     finished_signal = pyqtSignal(str, str)
     log_signal = pyqtSignal(str)
+    # ความเร็ว / ETA / เวลาต่อ stage (อัปเดตไม่เกินทุก 0.5 วินาที)
+    metrics_signal = pyqtSignal(str)
     finished = pyqtSignal()
 
     # --- [แก้ไขจุดที่ 1] รับตัวแปรเพิ่มให้ครบ ---
-    def __init__(self, file_paths, output_dir, ratio, padding, model_path, target_class_id):
+    def __init__(self, file_paths, output_dir, ratio, padding, model_path, target_class_id, batch_size=DEFAULT_BATCH_SIZE,
+                 reduced_decode=False, specs=None, resume=True, retry_failed=False, backend=DEFAULT_BACKEND,
+                 encode_options=None, video_stride=DEFAULT_STRIDE, tiling=None, conf=None, instances=None,
+                 cascade=None, dedup_threshold=None, shard_output=False):
         super().__init__()
         self.file_paths = file_paths
         self.output_dir = output_dir
         self.ratio = ratio
         self.padding = padding
+        # หลาย ratio/padding ในรอบเดียว (detect รูปละครั้ง แล้วเขียนออกทุกแบบ)
+        self.specs = list(specs) if specs else [CropSpec(ratio, padding)]
         
         # เก็บค่าใหม่ไว้ใช้งาน
         self.model_path = model_path
+        self.backend = backend
+        # format / quality / ขนาดสูงสุดของไฟล์ output
+        self.encode_options = encode_options or EncodeOptions()
         self.target_class_id = target_class_id
+        self.batch_size = max(1, int(batch_size))
+        self.reduced_decode = reduced_decode
+        # resume: ข้ามไฟล์ที่ทำเสร็จแล้ว (ดูจาก manifest ใน output folder)
+        self.resume = resume
+        self.retry_failed = retry_failed
+        # วิดีโอ: detect ทุกกี่เฟรม
+        self.video_stride = video_stride
+        # TileOptions: รูปใหญ่มาก (scan / panorama) detect แบบ tile (None = ปิด)
+        self.tiling = tiling
+        # target_class_id อาจเป็น list (หลาย class) / conf = ความมั่นใจขั้นต่ำ (None = ค่า default ของโมเดล)
+        self.conf = conf
+        # InstanceOptions: crop ทุก instance แยกไฟล์ (None = เอาแค่กรอบที่ใหญ่ที่สุด)
+        self.instances = instances
+        # CascadeOptions: ลอง detect ด้วย input เล็กก่อน (None = ขนาดเต็มทุกรูป)
+        self.cascade = cascade
+        # ใช้ผล detect ของรูปที่เกือบซ้ำกัน (burst / export ซ้ำ) แทนการรันโมเดลใหม่ (None = ปิด)
+        self.dedup_threshold = dedup_threshold
+        # เขียน crop ลง tar shard ใน output folder แทนไฟล์ทีละไฟล์
+        self.shard_output = shard_output
         
         self.is_running = True
+        self.pipeline = None
+        # ข้อความสรุปท้าย run (แสดงตอนจบงาน)
+        self.summary = []
 
     def run(self):
         # --- [แก้ไขจุดที่ 2] ส่ง path โมเดลไปให้ Logic ---
-        cropper = AICropper(self.model_path)
-        
-        total = len(self.file_paths)
-        
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
+        # cache ผล detect: รันโฟลเดอร์เดิมด้วย ratio/padding ใหม่ จะไม่ต้องรัน YOLO ซ้ำ
+        cache = DetectionCache()
+        # ยืมโมเดลจาก pool (โหลด + warm-up ไว้แล้วตั้งแต่ตอนเลือกโมเดล) ไม่ต้องโหลด weights ใหม่ทุกครั้งที่กด Start
+        self.log_signal.emit("Loading model...")
+        cropper, loaded_now = shared_pool.get(self.model_path, backend=self.backend)
+        metrics = StageMetrics()
+        cropper.configure(batch_size=self.batch_size, cache=cache, reduced_decode=self.reduced_decode,
+                          metrics=metrics, tiling=self.tiling,
+                          predict_args=predict_settings(self.target_class_id, self.conf), cascade=self.cascade,
+                          dedup_threshold=self.dedup_threshold)
+        if loaded_now:
+            self.summary.append(cropper.timing_text())
+        
+        manifest = None
+        if self.resume:
+            manifest = RunManifest(self.output_dir, settings_key(cropper.model_sig, cropper.cache_settings(),
+                                                             self.specs, self.target_class_id, self.encode_options,
+                                                             self.instances),
+                                   retry_failed=self.retry_failed)
 
-        for i, file_path in enumerate(self.file_paths):
-            if not self.is_running: break
-            
-            filename = os.path.basename(file_path)
-            self.log_signal.emit(f"Processing: {filename}...")
-            
-            # --- [แก้ไขจุดที่ 3] ส่ง ID ของสิ่งที่อยาก Detect ไปให้ฟังก์ชัน crop ---
-            cropped_img, status = cropper.crop_image(file_path, self.ratio, self.padding, self.target_class_id)
-            
-            if cropped_img is not None:
-                save_path = os.path.join(self.output_dir, filename)
-                cv2.imwrite(save_path, cropped_img)
-                self.finished_signal.emit(save_path, "OK")
-            else:
-                self.finished_signal.emit("", f"Failed: {status}")
-
-            progress = int(((i + 1) / total) * 100)
+        total = len(self.file_paths)
+        done = 0
+        skipped = 0
+        last_emit = 0.0
+        lock = threading.Lock()
+
+        def emit_metrics(force=False):
+            nonlocal last_emit
+            now = time.monotonic()
+            with lock:
+                if not force and now - last_emit < 0.5:
+                    return
+                last_emit = now
+                remaining = total - done
+            rate = metrics.throughput()
+            text = f"⏱ {rate:.1f} img/s · ETA {format_eta(metrics.eta(remaining))}"
+            stages = metrics.stage_text()
+            self.metrics_signal.emit(text + (f"\n{stages}" if stages else ""))
+
+        def on_skip(file_path):
+            nonlocal done, skipped
+            with lock:
+                done += 1
+                skipped += 1
+            self.progress_signal.emit(int((done / total) * 100))
+
+        # on_result ถูกเรียกจาก thread ของ pipeline (emit signal ข้าม thread ได้ปลอดภัย)
+        def on_result(file_path, outputs):
+            nonlocal done
+            with lock:
+                done += 1
+                count = done
+            progress = int((count / total) * 100)
+            self.log_signal.emit(f"Processing: {os.path.basename(file_path)}... ({count}/{total})")
+            for save_path, status in outputs:
+                if status == "OK":
+                    self.finished_signal.emit(save_path, "OK")
+                else:
+                    self.finished_signal.emit("", status)
             self.progress_signal.emit(progress)
+            emit_metrics()
+
+        # --- [แก้ไขจุดที่ 3] decode -> detect (ทีละ batch) -> write แยก stage ทำงานซ้อนกัน ---
+        sink = ShardWriter(self.output_dir) if self.shard_output else None
+        self.pipeline = CropPipeline(cropper, self.output_dir, self.ratio, self.padding,
+                                     self.target_class_id, batch_size=self.batch_size, specs=self.specs,
+                                     manifest=manifest, encoder=Encoder(self.encode_options),
+                                     instances=self.instances, sink=sink)
+        if not self.is_running:
+            self.pipeline.stop()
+        images = [f for f in self.file_paths if not is_video(f)]
+        videos = [f for f in self.file_paths if is_video(f)]
+        try:
+            self.pipeline.run(images, on_result=on_result, on_skip=on_skip)
+        finally:
+            if sink is not None:
+                sink.close()
+        if sink is not None and sink.shards:
+            self.summary.append(f"Wrote {sink.count} crop(s) into {len(sink.shards)} tar shard(s)")
+
+        # วิดีโอทำทีละไฟล์ (นับเป็น 1 รายการใน progress เหมือนรูป 1 รูป)
+        if videos:
+            if manifest is not None:
+                videos, done_videos = manifest.filter(videos)
+                for file_path in done_videos:
+                    on_skip(file_path)
+            video_cropper = VideoCropper(cropper, self.specs, self.target_class_id, stride=self.video_stride)
+            for file_path in videos:
+                if not self.is_running:
+                    break
+                name = os.path.basename(file_path)
+
+                def on_frames(frames_done, frames_total, name=name):
+                    if frames_total:
+                        self.log_signal.emit(f"Video: {name} ({frames_done}/{frames_total} frames)")
+
+                outputs = video_cropper.process(file_path, self.output_dir, on_progress=on_frames,
+                                                should_stop=lambda: not self.is_running)
+                if not self.is_running:
+                    break
+                metrics.record_outputs(outputs)
+                if manifest is not None:
+                    manifest.record(file_path, outputs)
+                on_result(file_path, outputs)
+        emit_metrics(force=True)
+        if self.cascade is not None:
+            self.summary.append(cropper.cascade_text())
+        if self.dedup_threshold is not None:
+            self.summary.append(cropper.dedup_text())
+        # cropper กลับไปอยู่ใน pool: ไม่ผูกกับ cache (กำลังจะปิด) / metrics ของรอบนี้
+        cropper.configure(batch_size=self.batch_size)
+        self.summary.extend(metrics.summary_lines())
+
+        if manifest is not None:
+            manifest.close()
+            if skipped:
+                self.summary.append(f"Skipped {skipped} already processed file(s)")
+
+        self.summary.append(cache.stats_text())
+        cache.close()
             
         self.finished.emit()
 
     def stop(self):
         self.is_running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
+
+# ==========================================
+# Model Preload Thread (โหลดโมเดลรอไว้ตอนเปลี่ยน combo_model)
+# ==========================================
+class ModelPreloadThread(QThread):
+    # (ข้อความสถานะ, โหลดสำเร็จไหม)
+    ready_signal = pyqtSignal(str, bool)
+
+    def __init__(self, model_path, backend=DEFAULT_BACKEND):
+        super().__init__()
+        self.model_path = model_path
+        self.backend = backend
+        # เวลา import torch + ultralytics (ครั้งแรกเท่านั้นที่ช้า)
+        self.import_time = None
+
+    def run(self):
+        try:
+            if self.backend == DEFAULT_BACKEND:
+                start = time.perf_counter()
+                import_torch()
+                self.import_time = time.perf_counter() - start
+            cropper, loaded_now = shared_pool.get(self.model_path, backend=self.backend)
+        except Exception as e:
+            self.ready_signal.emit(f"Model load failed: {e}", False)
+            return
+        if loaded_now:
+            self.ready_signal.emit(f"Model ready ({cropper.timing_text()})", True)
+        else:
+            self.ready_signal.emit("Model ready", True)
 
 # ==========================================
 # Image Viewer Dialog
@@ -87,19 +279,80 @@ class ImageViewer(QDialog):
         layout.addWidget(label)
         self.setLayout(layout)
 
+# ==========================================
+# Thumbnail Loader (สร้างรูปย่อนอก GUI thread)
+# ==========================================
+class ThumbnailLoader(QObject):
+    # (file_path, generation, QImage) ถูก emit จาก thread ของ pool แล้ว Qt ส่งต่อเข้า GUI thread ให้เอง
+    # ทำรูปย่อไม่ได้ -> QImage ว่าง (isNull) ให้ GUI ลบออกจาก pending ไว้ลองใหม่ตอน add ไฟล์เดิมอีกครั้ง
+    thumb_ready = pyqtSignal(str, int, QImage)
+
+    def __init__(self, cache, workers=None):
+        super().__init__()
+        self.cache = cache
+        self.generation = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1))
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def request(self, file_path):
+        generation = self.generation
+        future = self._pool.submit(self._load, file_path, generation)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _load(self, file_path, generation):
+        # list ถูก clear ไปแล้ว -> ไม่ต้องทำ
+        if generation != self.generation:
+            return
+        try:
+            data = self.cache.get(file_path)
+        except Exception as e:
+            print(f"Thumbnail error {file_path}: {e}")
+            data = None
+        # QImage ใช้นอก GUI thread ได้ (QPixmap ไม่ได้) แปลงเป็น QPixmap ตอนรับ signal
+        qimg = QImage.fromData(data) if data is not None else QImage()
+        self.thumb_ready.emit(file_path, generation, qimg)
+
+    def cancel_pending(self):
+        """ยกเลิกงานที่ยังไม่เริ่ม (ใช้ตอน clear list)"""
+        self.generation += 1
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+    def shutdown(self):
+        self.cancel_pending()
+        self._pool.shutdown(wait=False)
+
 # ==========================================
 # Drag & Drop List Widget
 # ==========================================
 class FileListWidget(QListWidget):
-    def __init__(self):
+    def __init__(self, thumb_cache=None):
         super().__init__()
         self.setAcceptDrops(True)
-        self.setIconSize(QSize(80, 80))
+        self.setIconSize(QSize(THUMB_SIZE, THUMB_SIZE))
         self.setSelectionMode(QListWidget.SelectionMode.ExtendedSelection)
         self.setStyleSheet("QListWidget { border: 2px dashed #aaa; border-radius: 5px; background: #f9f9f9; }")             
         self.setViewMode(QListWidget.ViewMode.IconMode)# --- [เพิ่มบรรทัดนี้] เพื่อให้แสดงผลแบบ Icon Mode (เรียงเป็นตาราง) ---        
         self.setResizeMode(QListWidget.ResizeMode.Adjust)# --- [เพิ่มบรรทัดนี้] เพื่อให้จัดเรียงใหม่อัตโนมัติเวลาขยายหน้าต่าง ---
         self.setSpacing(10)# --- [เพิ่มบรรทัดนี้] เว้นระยะห่างระหว่างรูปไม่ให้เบียดกัน ---
+
+        # ใส่ item พร้อม icon สีเทาก่อน แล้วค่อยเติมรูปย่อเมื่อ loader ทำเสร็จ
+        placeholder = QPixmap(THUMB_SIZE, THUMB_SIZE)
+        placeholder.fill(QColor("#dddddd"))
+        self.placeholder_icon = QIcon(placeholder)
+        self.pending = {}
+        self.loader = ThumbnailLoader(thumb_cache or ThumbnailCache())
+        self.loader.thumb_ready.connect(self.on_thumb_ready)
+
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
             event.accept()
@@ -115,7 +368,7 @@ class FileListWidget(QListWidget):
     def dropEvent(self, event):
         files = [u.toLocalFile() for u in event.mimeData().urls()]
         for f in files:
-            if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.webp')):
+            if f.lower().endswith(IMAGE_EXTS + VIDEO_EXTS):
                 self.add_image_item(f)
 
     def add_image_item(self, file_path):
@@ -126,52 +379,73 @@ class FileListWidget(QListWidget):
         item.setToolTip(os.path.basename(file_path))
         
         item.setData(Qt.ItemDataRole.UserRole, file_path)
-        
-        img = cv2.imread(file_path)
-        if img is not None:
-            # Resize ให้พอดีกับ icon size
-            img = cv2.resize(img, (80, 80)) 
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            h, w, ch = img.shape
-            qimg = QImage(img.data, w, h, ch * w, QImage.Format.Format_RGB888)
-            item.setIcon(QIcon(QPixmap.fromImage(qimg)))
-        
+        item.setIcon(self.placeholder_icon)
         self.addItem(item)
 
+        # ไม่ decode ใน GUI thread: ส่งให้ loader ทำ (ไฟล์เดิมซ้ำหลาย item ก็ขอครั้งเดียว)
+        items = self.pending.setdefault(file_path, [])
+        items.append(item)
+        if len(items) == 1:
+            self.loader.request(file_path)
+
+    def on_thumb_ready(self, file_path, generation, qimg):
+        if generation != self.loader.generation:
+            return
+        items = self.pending.pop(file_path, [])
+        # อ่านรูปไม่ได้: คง icon สีเทาไว้
+        if qimg.isNull():
+            return
+        icon = QIcon(QPixmap.fromImage(qimg))
+        for item in items:
+            item.setIcon(icon)
+
+    def clear(self):
+        self.loader.cancel_pending()
+        self.pending.clear()
+        super().clear()
+
 # ==========================================
 # Main Application
 # ==========================================
 class AppWindow(QMainWindow):
     # Dictionary เก็บค่าสัดส่วน
-    RATIO_MAP = {
-        "Free (No Ratio)": None,
-        "1:1 (Square)": 1 / 1,
-        "4:5 (IG Portrait)": 4 / 5,
-        "3:4 (Portrait)": 3 / 4,
-        "2:3 (Classic 35mm)": 2 / 3,
-        "3:2 (Landscape)": 3 / 2,
-        "4:3 (Monitor)": 4 / 3,
-        "5:4 (Monitor)": 5 / 4,
-        "7:5": 7 / 5,
-        "9:16 (Story/TikTok)": 9 / 16,
-        "16:9 (Youtube)": 16 / 9,
-        "21:9 (Cinema)": 21 / 9,
-        "2:1": 2 / 1,
-    }
+    RATIO_MAP = RATIO_MAP
 
     def __init__(self):
         super().__init__()
         self.setWindowTitle("AI Smart Crop")
         self.resize(1000, 700)
-        self.initUI()
+        # เวลา startup (วินาทีนับจากเริ่มโปรแกรม) print ลง console ไว้จับ regression
+        self.startup = {"imports": IMPORT_TIME}
+        self.first_paint_done = False
+        # โมเดลที่จะโหลดหลัง first paint (combo_model ถูกตั้งค่าระหว่าง initUI)
+        self.pending_preload = None
         # ---(เก็บเป็นไฟล์ตั้งค่าล่าสุด .ini ข้างๆ ไฟล์โปรแกรม) ---
-        import os
         config_path = os.path.join(os.getcwd(), "settings.ini")
         self.settings = QSettings(config_path, QSettings.Format.IniFormat)
-        
+
         self.initUI()
         self.load_settings()
-        
+        self.startup["window"] = time.perf_counter() - _STARTED
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            self.startup["first_paint"] = time.perf_counter() - _STARTED
+            # งานหนัก (import torch + โหลดโมเดล) เริ่มหลังหน้าต่างขึ้นแล้ว ไม่แย่ง GIL กับการวาดครั้งแรก
+            QTimer.singleShot(0, self.on_first_paint)
+
+    def on_first_paint(self):
+        print(f"Startup: {startup_text(self.startup)}")
+        if STARTUP_EXIT in sys.argv:
+            print("STARTUP " + json.dumps(dict(self.startup, torch_loaded="torch" in sys.modules)), flush=True)
+            QApplication.quit()
+            return
+        if self.pending_preload is not None:
+            self.preload_model(*self.pending_preload)
+            self.pending_preload = None
+
     def initUI(self):
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
@@ -183,7 +457,9 @@ class AppWindow(QMainWindow):
         input_label = QLabel("📥 Input Images (Drag & Drop Here)")
         input_label.setStyleSheet("font-weight: bold; font-size: 14px;")
         
-        self.input_list = FileListWidget()
+        # thumbnail cache ใช้ร่วมกันทั้ง input และ output list
+        self.thumb_cache = ThumbnailCache()
+        self.input_list = FileListWidget(self.thumb_cache)
         clear_btn = QPushButton("Clear List")
         clear_btn.clicked.connect(self.input_list.clear)
 
@@ -212,24 +488,48 @@ class AppWindow(QMainWindow):
         # ==========================================
         # [ใหม่] ส่วน Detection Class Selection
         # ==========================================
-        settings_layout.addWidget(QLabel("🎯 Detect Target:"))
-        self.combo_class = QComboBox()
+        settings_layout.addWidget(QLabel("🎯 Detect Target (tick one or more):"))
+        self.list_class = QListWidget()
+        self.list_class.setFixedHeight(110)
         # (ไม่ต้องเรียก load_detect_list_json() ตรงนี้แล้ว เพราะจะถูกเรียกอัตโนมัติเมื่อโหลดโมเดลเสร็จ)
-        settings_layout.addWidget(self.combo_class)
+        settings_layout.addWidget(self.list_class)
+
+        # ทุก instance แยกไฟล์ (<ชื่อ>_<class>_<ลำดับ>) / เก็บแค่ K ตัวแรก / ความมั่นใจขั้นต่ำ
+        self.chk_all_instances = QCheckBox("👥 Crop every instance (name_<class>_<idx>)")
+        self.chk_all_instances.setToolTip("Write one file per detected object instead of only the largest one")
+        settings_layout.addWidget(self.chk_all_instances)
+        instance_row = QHBoxLayout()
+        self.spin_top_k = QSpinBox()
+        self.spin_top_k.setRange(0, 100)
+        self.spin_top_k.setSpecialValueText("Top: all")
+        self.spin_top_k.setPrefix("Top ")
+        self.spin_top_k.setToolTip("Keep only the K largest instances (0 = all)")
+        instance_row.addWidget(self.spin_top_k)
+        self.spin_conf = QDoubleSpinBox()
+        self.spin_conf.setRange(0.05, 0.95)
+        self.spin_conf.setSingleStep(0.05)
+        self.spin_conf.setValue(0.25)
+        self.spin_conf.setPrefix("Conf ")
+        self.spin_conf.setToolTip("Minimum detection confidence")
+        instance_row.addWidget(self.spin_conf)
+        settings_layout.addLayout(instance_row)
 
         settings_layout.addSpacing(10)
         self.load_models_json()
-        # Ratio Dropdown
-        settings_layout.addWidget(QLabel("📏 Aspect Ratio:"))
-        self.combo_ratio = QComboBox()
-        self.combo_ratio.addItems(self.RATIO_MAP.keys()) # ดึง Key จาก Dict
+        # Ratio List (ติ๊กได้หลายอัน -> ได้ output หลายแบบจากการ detect ครั้งเดียว)
+        settings_layout.addWidget(QLabel("📏 Aspect Ratio (tick one or more):"))
+        self.list_ratio = QListWidget()
+        self.list_ratio.setFixedHeight(150)
+        for text in self.RATIO_MAP.keys(): # ดึง Key จาก Dict
+            item = QListWidgetItem(text)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Unchecked)
+            self.list_ratio.addItem(item)
         
         # ตั้ง Default เป็น 3:4 ถ้ามี
-        default_idx = self.combo_ratio.findText("3:4 (Portrait)")
-        if default_idx >= 0:
-            self.combo_ratio.setCurrentIndex(default_idx)
+        self.set_checked_ratios(["3:4 (Portrait)"])
             
-        settings_layout.addWidget(self.combo_ratio)
+        settings_layout.addWidget(self.list_ratio)
 
         settings_layout.addSpacing(10)
 
@@ -251,6 +551,82 @@ class AppWindow(QMainWindow):
         slider_layout.addWidget(self.lbl_padding_value)
         settings_layout.addLayout(slider_layout)
 
+        settings_layout.addSpacing(10)
+
+        # Fast decode: JPEG ใหญ่ๆ ใช้รูปย่อตอน detect แล้วค่อย crop จากรูปเต็ม
+        self.chk_fast_decode = QCheckBox("⚡ Fast decode (large JPEG)")
+        self.chk_fast_decode.setToolTip("Detect on a reduced-size decode, crop from full-resolution pixels")
+        self.chk_fast_decode.setChecked(False)
+        settings_layout.addWidget(self.chk_fast_decode)
+
+        # Cascade: detect ที่ 320px ก่อน ถ้าไม่เจอ/ไม่มั่นใจ ค่อยรันใหม่ที่ขนาดเต็ม
+        self.chk_cascade = QCheckBox("🪜 Cascade (try a 320px pass first)")
+        self.chk_cascade.setToolTip("Re-run at full size only when the target is missing or its confidence is below 0.5")
+        settings_layout.addWidget(self.chk_cascade)
+
+        # รูปที่เกือบเหมือนกัน (burst shot / export ซ้ำ) ใช้กรอบของรูปแรกในกลุ่ม ไม่ต้อง detect ซ้ำ
+        self.chk_dedup = QCheckBox("♻️ Reuse detections for near-duplicate images")
+        self.chk_dedup.setToolTip("Images whose perceptual hash differs by at most 5 bits reuse the detection "
+                                  "of the first one, scaled to their resolution")
+        settings_layout.addWidget(self.chk_dedup)
+
+        # รูปใหญ่มาก (50MP+): detect ทีละ tile ไม่ให้ subject เล็กๆ หาย และไม่ decode ทั้งรูปถ้าไม่จำเป็น
+        self.chk_tiling = QCheckBox("🧩 Tiled detection for huge images (50MP+)")
+        self.chk_tiling.setToolTip("Detect in overlapping tiles and read only the crop region "
+                                   "(uncompressed BMP is memory-mapped)")
+        settings_layout.addWidget(self.chk_tiling)
+
+        # วิดีโอ: รัน YOLO ทุก N เฟรม (เฟรมระหว่างนั้นใช้ตำแหน่งที่ interpolate + smoothing)
+        self.spin_video_stride = QSpinBox()
+        self.spin_video_stride.setRange(1, 120)
+        self.spin_video_stride.setValue(DEFAULT_STRIDE)
+        self.spin_video_stride.setPrefix("🎬 Video: detect every ")
+        self.spin_video_stride.setSuffix(" frame(s)")
+        self.spin_video_stride.setToolTip(
+            "Higher = faster; the crop window is interpolated between detections.\n"
+            "Videos use the largest window of each ratio that fits the frame: padding does not apply "
+            "and Free ratio outputs are skipped.")
+        settings_layout.addWidget(self.spin_video_stride)
+
+        # Output format: keep = นามสกุลเดิม / quality ใช้กับ JPEG, WebP / ย่อด้านยาวไม่เกิน max (0 = ไม่ย่อ)
+        settings_layout.addWidget(QLabel("💾 Output Format:"))
+        format_row = QHBoxLayout()
+        self.combo_format = QComboBox()
+        for fmt in FORMATS:
+            self.combo_format.addItem("Keep original" if fmt == "keep" else fmt.upper(), fmt)
+        format_row.addWidget(self.combo_format)
+        self.spin_quality = QSpinBox()
+        self.spin_quality.setRange(1, 100)
+        self.spin_quality.setValue(95)
+        self.spin_quality.setPrefix("Q ")
+        self.spin_quality.setToolTip("JPEG / WebP quality")
+        format_row.addWidget(self.spin_quality)
+        settings_layout.addLayout(format_row)
+
+        self.spin_max_dim = QSpinBox()
+        self.spin_max_dim.setRange(0, 20000)
+        self.spin_max_dim.setSingleStep(256)
+        self.spin_max_dim.setSpecialValueText("Max size: off")
+        self.spin_max_dim.setPrefix("Max size: ")
+        self.spin_max_dim.setSuffix(" px")
+        self.spin_max_dim.setToolTip("Downscale crops whose long side is larger than this (0 = keep full size)")
+        settings_layout.addWidget(self.spin_max_dim)
+
+        # ชุดข้อมูลใหญ่: เขียน crop ต่อท้ายลง tar (crops-000000.tar ...) แทนไฟล์เล็กหลายล้านไฟล์
+        self.chk_shards = QCheckBox("📦 Write crops into tar shards")
+        self.chk_shards.setToolTip("Append crops and a .json sidecar with the box to crops-NNNNNN.tar "
+                                   "(new shard every 1 GB) in the output folder")
+        settings_layout.addWidget(self.chk_shards)
+
+        # Resume: ข้ามไฟล์ที่เคยทำแล้วด้วย settings เดียวกัน (จำไว้ใน output folder)
+        self.chk_resume = QCheckBox("↩️ Skip already processed files")
+        self.chk_resume.setChecked(True)
+        settings_layout.addWidget(self.chk_resume)
+
+        self.chk_retry_failed = QCheckBox("🔁 Retry files that failed before")
+        self.chk_retry_failed.setChecked(False)
+        settings_layout.addWidget(self.chk_retry_failed)
+
         settings_layout.addSpacing(20)
 
         # Output Path
@@ -282,6 +658,11 @@ class AppWindow(QMainWindow):
 
         settings_layout.addWidget(self.lbl_status)
         settings_layout.addWidget(self.progress_bar)
+
+        self.lbl_metrics = QLabel("")
+        self.lbl_metrics.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.lbl_metrics.setStyleSheet("color: #666; font-size: 11px;")
+        settings_layout.addWidget(self.lbl_metrics)
         settings_layout.addWidget(self.btn_start)
 
         # --- Right Panel ---
@@ -289,7 +670,7 @@ class AppWindow(QMainWindow):
         output_label = QLabel("📤 Output Preview")
         output_label.setStyleSheet("font-weight: bold; font-size: 14px;")
         
-        self.output_list = FileListWidget()
+        self.output_list = FileListWidget(self.thumb_cache)
         self.output_list.setStyleSheet("QListWidget { border: 2px solid #4CAF50; border-radius: 5px; }")
         self.output_list.itemDoubleClicked.connect(self.view_large_image)
 
@@ -317,11 +698,36 @@ class AppWindow(QMainWindow):
         else:
             QMessageBox.warning(self, "Error", "Output folder does not exist.")
 
-    def get_ratio_value(self):
-        selected = self.combo_ratio.currentText()
-        # ดึงค่าจาก Dict (จะได้ None ถ้าเลือก Free)
-        return self.RATIO_MAP.get(selected)
-        
+    def get_checked_ratios(self):
+        texts = []
+        for i in range(self.list_ratio.count()):
+            item = self.list_ratio.item(i)
+            if item.checkState() == Qt.CheckState.Checked:
+                texts.append(item.text())
+        return texts
+
+    def set_checked_ratios(self, texts):
+        for i in range(self.list_ratio.count()):
+            item = self.list_ratio.item(i)
+            checked = item.text() in texts
+            item.setCheckState(Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked)
+
+    def get_crop_specs(self, padding):
+        """
+        สร้าง CropSpec จาก ratio ที่ติ๊กไว้
+        เลือกอันเดียว = เขียนลง output folder ตรงๆ (เหมือนเดิม)
+        เลือกหลายอัน = แยกโฟลเดอร์ย่อยตามสัดส่วน เช่น output/4x5, output/9x16
+        """
+        texts = self.get_checked_ratios()
+        if len(texts) == 1:
+            # ดึงค่าจาก Dict (จะได้ None ถ้าเลือก Free)
+            return [CropSpec(self.RATIO_MAP.get(texts[0]), padding)]
+        return [CropSpec(self.RATIO_MAP.get(t), padding, "", ratio_folder_name(t)) for t in texts]
+        
+    def get_encode_options(self):
+        return EncodeOptions(self.combo_format.currentData() or "keep", self.spin_quality.value(),
+                             max_dim=self.spin_max_dim.value())
+
     # ฟังก์ชันโหลด Model List
     def load_models_json(self):
         self.combo_model.clear()
@@ -336,7 +742,8 @@ class AppWindow(QMainWindow):
                 for m in models:
                     user_data = {
                         "model_path": m['path'],
-                        "list_path": m.get('detect_list', 'lists/coco_80.json')
+                        "list_path": m.get('detect_list', 'lists/coco_80.json'),
+                        "backend": m.get('backend', DEFAULT_BACKEND)
                     }
                     self.combo_model.addItem(m['name'], user_data)
         except Exception as e:
@@ -352,17 +759,45 @@ class AppWindow(QMainWindow):
             list_file = data.get("list_path")
             # โหลดรายการใหม่ทันที
             self.load_detect_list_json(list_file)
+            self.preload_model(data.get("model_path"), data.get("backend", DEFAULT_BACKEND))
+
+    def preload_model(self, model_path, backend=DEFAULT_BACKEND):
+        """โหลด + warm-up โมเดลไว้ก่อนใน background (กด Start แล้วรูปแรกเร็วเท่ารูปอื่น)"""
+        if not model_path:
+            return
+        if not self.first_paint_done:
+            # ยังไม่เห็นหน้าต่าง: รอ first paint ก่อน (เลือกโมเดลซ้ำหลายครั้งระหว่าง initUI ใช้ตัวล่าสุด)
+            self.pending_preload = (model_path, backend)
+            return
+        self.lbl_status.setText("Loading AI engine..." if "torch" not in sys.modules and backend == DEFAULT_BACKEND
+                                else "Loading model...")
+        thread = ModelPreloadThread(model_path, backend)
+        thread.ready_signal.connect(self.on_model_preloaded)
+        # เก็บ reference ไว้ไม่ให้ thread ถูกเก็บกวาดก่อนทำเสร็จ
+        self.preload_threads = [t for t in getattr(self, "preload_threads", []) if t.isRunning()] + [thread]
+        thread.start()
+
+    def on_model_preloaded(self, text, ok):
+        thread = self.sender()
+        if ok and "model_ready" not in self.startup:
+            if thread is not None and thread.import_time is not None:
+                self.startup["torch_import"] = thread.import_time
+            self.startup["model_ready"] = time.perf_counter() - _STARTED
+            print(f"Startup: {startup_text(self.startup)}")
+        # ไม่ทับข้อความ progress ระหว่างที่กำลังประมวลผล
+        if self.btn_start.isEnabled():
+            self.lbl_status.setText(text)
 
     # [แก้ใหม่] รับชื่อไฟล์เป็น Parameter
     def load_detect_list_json(self, relative_path):
-        self.combo_class.clear()
+        self.list_class.clear()
         
         # หาทีอยู่จริงของไฟล์ gui_app.py แล้วต่อด้วย path ของ json
         base_dir = os.path.dirname(os.path.abspath(__file__))
         full_path = os.path.join(base_dir, relative_path)
         
         if not os.path.exists(full_path):
-            self.combo_class.addItem(f"List not found", 0)
+            self.list_class.addItem("List not found")
             return
 
         try:
@@ -371,15 +806,36 @@ class AppWindow(QMainWindow):
                 labels = data.get("id2label", {})
                 
                 if not labels:
-                    self.combo_class.addItem("No classes found", 0)
+                    self.list_class.addItem("No classes found")
                     return
 
                 for key_id in sorted(labels.keys(), key=int):
                     name = labels[key_id]
-                    self.combo_class.addItem(f"{key_id}: {name.capitalize()}", int(key_id))
+                    item = QListWidgetItem(f"{key_id}: {name.capitalize()}")
+                    item.setData(Qt.ItemDataRole.UserRole, int(key_id))
+                    item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+                    # ค่าเริ่มต้น = class แรก (เหมือน combo เดิม)
+                    item.setCheckState(Qt.CheckState.Checked if self.list_class.count() == 0 else Qt.CheckState.Unchecked)
+                    self.list_class.addItem(item)
                     
         except Exception as e:
-            self.combo_class.addItem(f"Error: {e}", 0)
+            self.list_class.addItem(f"Error: {e}")
+
+    def get_conf(self):
+        """ค่า default ของโมเดล (0.25) คืน None -> key ของ cache / manifest ตรงกับฝั่ง CLI ที่ไม่ได้ตั้ง --conf"""
+        conf = round(self.spin_conf.value(), 2)
+        return None if conf == 0.25 else conf
+
+    def get_checked_classes(self):
+        """class id ที่ติ๊กไว้ (1 ตัว = int แบบเดิม, หลายตัว = list) ไม่ได้ติ๊ก/โหลดไม่ได้ = 0"""
+        ids = []
+        for i in range(self.list_class.count()):
+            item = self.list_class.item(i)
+            if item.checkState() == Qt.CheckState.Checked and item.data(Qt.ItemDataRole.UserRole) is not None:
+                ids.append(item.data(Qt.ItemDataRole.UserRole))
+        if not ids:
+            return 0
+        return ids[0] if len(ids) == 1 else ids
 
     def start_processing(self):
         files = []
@@ -392,18 +848,23 @@ class AppWindow(QMainWindow):
             return
 
         output_dir = self.txt_output.text()
-        ratio = self.get_ratio_value()
         padding = self.slider.value()
+        specs = self.get_crop_specs(padding)
+        if not specs:
+            QMessageBox.warning(self, "Warning", "Please tick at least one aspect ratio!")
+            return
+        ratio = specs[0].ratio
         
         # [แก้ใหม่] ดึง path โมเดล จาก Dictionary
         current_data = self.combo_model.currentData()
+        backend = DEFAULT_BACKEND
         if isinstance(current_data, dict):
             model_path = current_data.get("model_path")
+            backend = current_data.get("backend", DEFAULT_BACKEND)
         else:
             model_path = "models/yolov8n.pt" # Default
 
-        target_class_id = self.combo_class.currentData()
-        if target_class_id is None: target_class_id = 0
+        target_class_id = self.get_checked_classes()
         
         # ป้องกันค่า None (กรณีโหลด JSON พัง)
         if model_path is None: model_path = "models/yolov8n.pt"
@@ -412,12 +873,26 @@ class AppWindow(QMainWindow):
         self.btn_start.setEnabled(False)
         self.output_list.clear()
         self.progress_bar.setValue(0)
+        self.lbl_metrics.setText("")
 
         # ส่งค่าทั้งหมดไปให้ Worker
-        self.worker = WorkerThread(files, output_dir, ratio, padding, model_path, target_class_id)
+        self.worker = WorkerThread(files, output_dir, ratio, padding, model_path, target_class_id,
+                                   reduced_decode=self.chk_fast_decode.isChecked(), specs=specs,
+                                   resume=self.chk_resume.isChecked(),
+                                   retry_failed=self.chk_retry_failed.isChecked(), backend=backend,
+                                   encode_options=self.get_encode_options(),
+                                   video_stride=self.spin_video_stride.value(),
+                                   tiling=TileOptions() if self.chk_tiling.isChecked() else None,
+                                   conf=self.get_conf(),
+                                   instances=InstanceOptions(self.spin_top_k.value())
+                                   if self.chk_all_instances.isChecked() else None,
+                                   cascade=CascadeOptions() if self.chk_cascade.isChecked() else None,
+                                   dedup_threshold=DEFAULT_THRESHOLD if self.chk_dedup.isChecked() else None,
+                                   shard_output=self.chk_shards.isChecked())
         self.worker.progress_signal.connect(self.update_progress)
         self.worker.finished_signal.connect(self.on_image_finished)
         self.worker.log_signal.connect(self.update_status)
+        self.worker.metrics_signal.connect(self.lbl_metrics.setText)
         self.worker.finished.connect(self.on_process_complete)
         self.worker.start()
 
@@ -428,13 +903,15 @@ class AppWindow(QMainWindow):
         self.lbl_status.setText(text)
 
     def on_image_finished(self, path, status):
-        if status == "OK":
+        # crop ที่อยู่ใน tar shard ไม่มีไฟล์ให้แสดง thumbnail
+        if status == "OK" and not is_member(path):
             self.output_list.add_image_item(path)
 
     def on_process_complete(self):
         self.btn_start.setEnabled(True)
-        self.lbl_status.setText("Done!")
-        QMessageBox.information(self, "Success", "Processing Complete!")
+        summary = "\n".join(self.worker.summary)
+        self.lbl_status.setText("Done!" + (f"\n{summary}" if summary else ""))
+        QMessageBox.information(self, "Success", "Processing Complete!" + (f"\n\n{summary}" if summary else ""))
 
     def view_large_image(self, item):
         path = item.data(Qt.ItemDataRole.UserRole)
@@ -455,21 +932,70 @@ class AppWindow(QMainWindow):
         saved_padding = self.settings.value("padding", 15) # Default 15
         self.slider.setValue(int(saved_padding))
 
-        # 3. Aspect Ratio (จำชื่อที่เลือกไว้ล่าสุด)
+        # 3. Aspect Ratio (จำชื่อที่ติ๊กไว้ล่าสุด คั่นด้วย |)
         saved_ratio = self.settings.value("ratio_text", "3:4 (Portrait)")
-        index = self.combo_ratio.findText(str(saved_ratio))
-        if index >= 0:
-            self.combo_ratio.setCurrentIndex(index)
+        texts = [t for t in str(saved_ratio).split("|") if t in self.RATIO_MAP]
+        if texts:
+            self.set_checked_ratios(texts)
+
+        # 4. Fast decode
+        saved_fast = self.settings.value("fast_decode", False)
+        self.chk_fast_decode.setChecked(str(saved_fast).lower() in ("true", "1"))
+
+        # 5. Resume / Retry failed
+        saved_resume = self.settings.value("resume", True)
+        self.chk_resume.setChecked(str(saved_resume).lower() in ("true", "1"))
+        saved_retry = self.settings.value("retry_failed", False)
+        self.chk_retry_failed.setChecked(str(saved_retry).lower() in ("true", "1"))
+
+        # 6. Output format
+        index = self.combo_format.findData(str(self.settings.value("output_format", "keep")))
+        self.combo_format.setCurrentIndex(max(0, index))
+        self.spin_quality.setValue(int(self.settings.value("output_quality", 95)))
+        self.spin_max_dim.setValue(int(self.settings.value("output_max_dim", 0)))
+        saved_shards = self.settings.value("shards", False)
+        self.chk_shards.setChecked(str(saved_shards).lower() in ("true", "1"))
+
+        # 7. Video / Tiling
+        self.spin_video_stride.setValue(int(self.settings.value("video_stride", DEFAULT_STRIDE)))
+        saved_tiling = self.settings.value("tiling", False)
+        self.chk_tiling.setChecked(str(saved_tiling).lower() in ("true", "1"))
+
+        # 8. Instances
+        saved_instances = self.settings.value("all_instances", False)
+        self.chk_all_instances.setChecked(str(saved_instances).lower() in ("true", "1"))
+        self.spin_top_k.setValue(int(self.settings.value("top_k", 0)))
+        self.spin_conf.setValue(float(self.settings.value("conf", 0.25)))
+        saved_cascade = self.settings.value("cascade", False)
+        self.chk_cascade.setChecked(str(saved_cascade).lower() in ("true", "1"))
+        saved_dedup = self.settings.value("dedup", False)
+        self.chk_dedup.setChecked(str(saved_dedup).lower() in ("true", "1"))
 
     def save_settings(self):
         """บันทึกค่าปัจจุบันลง Memory"""
         self.settings.setValue("output_dir", self.txt_output.text())
         self.settings.setValue("padding", self.slider.value())
-        self.settings.setValue("ratio_text", self.combo_ratio.currentText())
+        self.settings.setValue("ratio_text", "|".join(self.get_checked_ratios()))
+        self.settings.setValue("fast_decode", self.chk_fast_decode.isChecked())
+        self.settings.setValue("resume", self.chk_resume.isChecked())
+        self.settings.setValue("retry_failed", self.chk_retry_failed.isChecked())
+        self.settings.setValue("output_format", self.combo_format.currentData())
+        self.settings.setValue("output_quality", self.spin_quality.value())
+        self.settings.setValue("output_max_dim", self.spin_max_dim.value())
+        self.settings.setValue("shards", self.chk_shards.isChecked())
+        self.settings.setValue("video_stride", self.spin_video_stride.value())
+        self.settings.setValue("tiling", self.chk_tiling.isChecked())
+        self.settings.setValue("all_instances", self.chk_all_instances.isChecked())
+        self.settings.setValue("top_k", self.spin_top_k.value())
+        self.settings.setValue("conf", self.spin_conf.value())
+        self.settings.setValue("cascade", self.chk_cascade.isChecked())
+        self.settings.setValue("dedup", self.chk_dedup.isChecked())
 
     def closeEvent(self, event):
         """ทำงานอัตโนมัติเมื่อกดปิดโปรแกรม (กากบาท)"""
         self.save_settings() # สั่งบันทึกก่อนปิด
+        self.input_list.loader.shutdown()
+        self.output_list.loader.shutdown()
         super().closeEvent(event) # ปิดโปรแกรมตามปกติ
 
 if __name__ == "__main__":
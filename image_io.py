@@ -0,0 +1,163 @@
+import struct
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from detect_cache import content_digest
+
+# ==========================================
+# Image I/O (อ่านไฟล์ / decode แบบย่อขนาด)
+# ==========================================
+
+# JPEG decode แบบย่อขนาดได้ในตัว (libjpeg ย่อใน DCT เลย ไม่ต้อง decode เต็มก่อน)
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# SOF markers ของ JPEG (ยกเว้น DHT=C4, JPG=C8, DAC=CC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def is_jpeg(data):
+    return len(data) > 3 and data[0] == 0xFF and data[1] == 0xD8
+
+
+def probe_size(data):
+    """อ่านขนาดรูป (w, h) จาก header ของ JPEG / PNG / WebP โดยไม่ decode คืน None ถ้าอ่านไม่ได้"""
+    buf = memoryview(data).cast('B')
+    n = len(buf)
+
+    # PNG: signature 8 bytes แล้วตามด้วย IHDR (width, height เป็น big-endian)
+    if n >= 24 and bytes(buf[:8]) == b'\x89PNG\r\n\x1a\n':
+        w, h = struct.unpack('>II', bytes(buf[16:24]))
+        return w, h
+
+    if n >= 16 and bytes(buf[:4]) == b'RIFF' and bytes(buf[8:12]) == b'WEBP':
+        return _webp_size(buf)
+
+    if not is_jpeg(buf):
+        return None
+
+    i = 2
+    while i + 9 < n:
+        if buf[i] != 0xFF:
+            i += 1
+            continue
+        marker = buf[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = (buf[i + 2] << 8) | buf[i + 3]
+        if marker in _JPEG_SOF:
+            h = (buf[i + 5] << 8) | buf[i + 6]
+            w = (buf[i + 7] << 8) | buf[i + 8]
+            return w, h
+        i += 2 + length
+    return None
+
+
+def _webp_size(buf):
+    # chunk แรกหลัง "RIFF....WEBP" (ข้อมูลของ chunk เริ่มที่ byte 20)
+    chunk = bytes(buf[12:16])
+    n = len(buf)
+    # VP8 (lossy): frame tag 3 bytes + start code 9D 01 2A แล้วตามด้วย width, height 14 bit (little-endian)
+    if chunk == b'VP8 ' and n >= 30 and bytes(buf[23:26]) == b'\x9d\x01\x2a':
+        w, h = struct.unpack('<HH', bytes(buf[26:30]))
+        return w & 0x3FFF, h & 0x3FFF
+    # VP8L (lossless): signature 0x2F แล้วตามด้วย width-1, height-1 อย่างละ 14 bit
+    if chunk == b'VP8L' and n >= 25 and buf[20] == 0x2F:
+        bits, = struct.unpack('<I', bytes(buf[21:25]))
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    # VP8X (extended): flags 4 bytes แล้วตามด้วยขนาด canvas width-1, height-1 อย่างละ 24 bit
+    if chunk == b'VP8X' and n >= 30:
+        w = buf[24] | (buf[25] << 8) | (buf[26] << 16)
+        h = buf[27] | (buf[28] << 8) | (buf[29] << 16)
+        return w + 1, h + 1
+    return None
+
+
+def reduce_factor(w, h, min_side):
+    """เลือกตัวหารที่ใหญ่ที่สุด (8/4/2) ที่ด้านยาวหลังย่อยังไม่เล็กกว่า min_side"""
+    long_side = max(w, h)
+    for factor in (8, 4, 2):
+        if long_side / factor >= min_side:
+            return factor
+    return 1
+
+
+class LoadedImage(namedtuple("LoadedImage", ["det_img", "full_img", "data", "key", "raster", "phash"],
+                             defaults=(None, None))):
+    """
+    det_img  = รูปที่ใช้ detect (อาจถูกย่อขนาด)
+    full_img = รูปเต็มความละเอียด (None ถ้ายังไม่ได้ decode เต็ม)
+    data     = bytes ของไฟล์ (ไว้ decode เต็มตอน crop)
+    key      = hash ของเนื้อไฟล์ (ใช้กับ DetectionCache)
+    raster   = รูปใหญ่ที่ต้อง detect แบบ tile (ดู tiling.py) ถ้ามี det_img จะเป็น None
+    phash    = perceptual hash ของ det_img (ใช้กับ DedupIndex ดู dedup.py, None ถ้าไม่ได้เปิด)
+    """
+    __slots__ = ()
+
+    def full(self):
+        if self.raster is not None:
+            return self.raster.full()
+        if self.full_img is not None:
+            return self.full_img
+        return cv2.imdecode(self.data, cv2.IMREAD_COLOR)
+
+    def full_size(self, det_shape=None):
+        """
+        ขนาด (h, w) ของรูปเต็มโดยไม่ต้อง decode (อ่านจาก header) คืน None ถ้าไม่รู้
+        det_shape = (h, w) ของรูปที่ใช้ detect: ใช้เช็คการหมุนตาม EXIF (header เก็บขนาดก่อนหมุน)
+        """
+        if self.raster is not None:
+            return self.raster.size
+        if self.full_img is not None:
+            return self.full_img.shape[:2]
+        size = probe_size(self.data) if self.data is not None else None
+        if size is None:
+            return None
+        w, h = size
+        if det_shape is not None and w != h and (det_shape[0] > det_shape[1]) != (h > w):
+            w, h = h, w
+        return h, w
+
+
+def read_image(path, with_digest=False, reduce_to=None):
+    """
+    อ่านรูปจาก path คืนค่า LoadedImage
+    with_digest=True : อ่านไฟล์เป็น bytes ครั้งเดียว ใช้ทั้ง hash และ decode (ไม่อ่านไฟล์ซ้ำ)
+    reduce_to=N      : ถ้าเป็น JPEG ที่ใหญ่พอ จะ decode แบบย่อ (ด้านยาว >= N) ไว้ detect
+                       ส่วนรูปเต็มจะ decode จาก bytes อีกทีตอน crop
+    """
+    if not with_digest and not reduce_to:
+        img = cv2.imread(path)
+        return LoadedImage(img, img, None, None)
+
+    data = np.fromfile(path, dtype=np.uint8)
+    if data.size == 0:
+        return LoadedImage(None, None, None, None)
+    return decode_bytes(data, with_digest, reduce_to)
+
+
+def decode_bytes(data, with_digest=False, reduce_to=None):
+    """เหมือน read_image แต่รับ bytes / numpy uint8 ที่อ่านมาแล้ว"""
+    if not isinstance(data, np.ndarray):
+        data = np.frombuffer(data, dtype=np.uint8)
+    digest = content_digest(data) if with_digest else None
+
+    if reduce_to and is_jpeg(data):
+        size = probe_size(data)
+        factor = reduce_factor(size[0], size[1], reduce_to) if size else 1
+        if factor > 1:
+            det_img = cv2.imdecode(data, _REDUCED_FLAGS[factor])
+            if det_img is not None:
+                return LoadedImage(det_img, None, data, digest)
+
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    return LoadedImage(img, img, None, digest)
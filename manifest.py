@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from archive_io import MEMBER_SEP, archive_path, is_member, source_name
+from encoder import EncodeOptions
+
+# ==========================================
+# Run Manifest (ทำงานต่อจากรอบที่แล้วได้)
+# ==========================================
+# เก็บเป็นไฟล์ JSON Lines ใน output folder: 1 บรรทัดต่อ 1 input ที่ทำเสร็จ (append อย่างเดียว ปิดโปรแกรมกลางคันก็ไม่เสีย)
+# รันใหม่ด้วย settings เดิม -> ข้ามไฟล์ที่ทำแล้ว (รวมถึงไฟล์ที่ fail เช่น "No object detected")
+# ทำใหม่เฉพาะไฟล์ใหม่ / ไฟล์ที่เนื้อหาเปลี่ยน / settings เปลี่ยน / ไฟล์ output หายไป
+# รูปใน tar/zip บันทึกเป็น "<archive>::<member>" คู่กับขนาด/mtime ของ archive (archive เปลี่ยน = ทำใหม่ทั้งก้อน)
+
+MANIFEST_NAME = ".smartcrop_manifest.jsonl"
+
+
+def file_sha1(path, chunk_size=1024 * 1024):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def settings_key(model_sig, predict_settings, specs, target_class_id, encode_options=None, instances=None):
+    """
+    hash ของทุกค่าที่มีผลกับไฟล์ output (โมเดล, ค่า predict, class, ratio/padding/ชื่อไฟล์, format output, โหมด instance)
+    model_sig / predict_settings = cropper.model_sig / cropper.cache_settings()
+    """
+    data = {
+        "model": model_sig,
+        "predict": predict_settings,
+        "class": target_class_id,
+        "specs": [list(spec) for spec in specs],
+    }
+    # ค่า default (ไม่ได้ตั้ง format) ไม่ใส่ใน key -> manifest ของรอบก่อนๆ ยังใช้ได้
+    if encode_options is not None and tuple(encode_options) != tuple(EncodeOptions()):
+        data["output"] = list(encode_options)
+    if instances is not None:
+        data["instances"] = list(instances)
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def input_record(file_path, outputs, sha1=None):
+    """
+    record ของ input 1 ไฟล์ (ยังไม่มี settings) outputs = list ของ (save_path, status)
+    sha1 = hash ของเนื้อไฟล์ถ้ารู้อยู่แล้ว (LoadedImage.key) ไม่งั้นอ่านไฟล์มา hash ใหม่
+    เรียกใน worker ได้ (ไม่ต้องให้ process หลักอ่านไฟล์ซ้ำ) แล้วส่งให้ RunManifest.add()
+    รูปใน archive: size / mtime เป็นของ archive และไม่ hash (ไม่อ่าน archive ทั้งก้อนซ้ำต่อ 1 รูป)
+    """
+    try:
+        st = os.stat(archive_path(file_path))
+        size, mtime_ns = st.st_size, st.st_mtime_ns
+        if is_member(file_path):
+            sha1 = None
+        elif sha1 is None:
+            sha1 = file_sha1(file_path)
+    except OSError:
+        size, mtime_ns, sha1 = None, None, None
+
+    ok = bool(outputs) and all(status == "OK" for _, status in outputs)
+    reasons = sorted({status for _, status in outputs if status != "OK"})
+    return {
+        "input": os.path.normcase(os.path.abspath(file_path)),
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "sha1": sha1,
+        "status": "ok" if ok else "failed",
+        "reason": "; ".join(reasons),
+        "outputs": [p for p, status in outputs if status == "OK"],
+        "time": time.time(),
+    }
+
+
+class RecordCollector:
+    """
+    ใช้แทน RunManifest ใน worker process (CropPipeline(manifest=...)): ไม่กรองอะไร
+    สร้าง record (stat + sha1) ใน worker แล้วให้ process หลักเขียนลง manifest ด้วย RunManifest.add()
+    """
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def filter(self, file_paths):
+        return list(file_paths), []
+
+    def is_done(self, path):
+        return False
+
+    def record(self, file_path, outputs, sha1=None):
+        rec = input_record(file_path, outputs, sha1)
+        with self._lock:
+            self.records.append(rec)
+
+    def take(self):
+        """คืน record ที่เก็บไว้แล้วล้างรายการ"""
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+
+class RunManifest:
+    # hash_changed=False: mtime เปลี่ยน = ไฟล์เปลี่ยน ไม่อ่านไฟล์มา hash เทียบ (watch_folder: เปิดใหม่ต้อง stat อย่างเดียว)
+    def __init__(self, output_dir, settings, retry_failed=False, hash_changed=True):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.settings = settings
+        self.retry_failed = retry_failed
+        self.hash_changed = hash_changed
+        self.records = {}
+        self._lock = threading.Lock()
+        # stat ล่าสุดของ archive: (path, stat, เวลา) รูปเป็นล้านรูปใน archive เดียวไม่ต้อง stat ทีละรูป
+        self._archive_stat = (None, None, 0.0)
+        self._load()
+        self._fh = open(self.path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def _norm(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # บรรทัดสุดท้ายอาจขาดครึ่ง (โปรแกรมถูกปิดตอนกำลังเขียน)
+                    continue
+                self.records[rec["input"]] = rec
+        # มีบรรทัดซ้ำเยอะ (รันหลายรอบ) -> เขียนไฟล์ใหม่ให้เหลือแค่ล่าสุดของแต่ละ input
+        if lines > 2 * len(self.records) + 1000:
+            self._compact()
+
+    def _compact(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for rec in self.records.values():
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def _stat(self, path):
+        if not is_member(path):
+            return os.stat(path)
+        archive = archive_path(path)
+        cached, st, when = self._archive_stat
+        now = time.monotonic()
+        if cached != archive or now - when > 1.0:
+            st = os.stat(archive)
+            self._archive_stat = (archive, st, now)
+        return st
+
+    def is_done(self, path):
+        """input นี้ (path หรือ "<archive>::<member>") ทำเสร็จแล้วด้วย settings เดิม และยังไม่เปลี่ยน"""
+        rec = self.records.get(self._norm(path))
+        if rec is None or rec.get("settings") != self.settings:
+            return False
+        if rec["status"] != "ok" and self.retry_failed:
+            return False
+
+        try:
+            st = self._stat(path)
+        except OSError:
+            return False
+        if rec.get("size") != st.st_size:
+            return False
+        if rec.get("mtime_ns") != st.st_mtime_ns:
+            # archive ถูกแก้ -> ทำใหม่ (ไม่ hash archive ทั้งก้อน)
+            if is_member(path) or not self.hash_changed:
+                return False
+            # mtime เปลี่ยนแต่เนื้อไฟล์เหมือนเดิม (copy ทับ / touch) ก็ถือว่าทำแล้ว
+            if rec.get("sha1") != file_sha1(path):
+                return False
+
+        # ไฟล์ output ถูกลบไปแล้ว -> ทำใหม่ (crop ที่อยู่ใน tar shard ดูแค่ว่ายังมีไฟล์ shard)
+        return all(os.path.exists(p.split(MEMBER_SEP)[0]) for p in rec.get("outputs", []) if p)
+
+    def filter(self, file_paths):
+        """คืนค่า (ไฟล์ที่ต้องทำ, ไฟล์ที่ข้ามได้)"""
+        todo, skipped = [], []
+        for path in file_paths:
+            (skipped if self.is_done(source_name(path)) else todo).append(path)
+        return todo, skipped
+
+    def record(self, file_path, outputs, sha1=None):
+        """
+        บันทึกผลของ input 1 ไฟล์ outputs = list ของ (save_path, status)
+        sha1 = hash ของเนื้อไฟล์ถ้ารู้อยู่แล้ว (ไม่ต้องอ่านไฟล์ซ้ำ)
+        """
+        self.add(input_record(file_path, outputs, sha1))
+
+    def add(self, rec):
+        """เขียน record จาก input_record() (เช่นที่ worker ส่งกลับมา)"""
+        rec = dict(rec, settings=self.settings)
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.records[rec["input"]] = rec
+            self._fh.write(line)
+            self._fh.flush()
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import crop_geometry
+
+# ==========================================
+# Stage Metrics (จับเวลาแต่ละ stage + นับผลลัพธ์)
+# ==========================================
+# stage: decode (อ่าน/decode รูปที่ใช้ detect), detect, decode_full (decode รูปเต็มตอน crop), crop, write
+# ผลลัพธ์ต่อรูป: ok / no_detection / class_not_found / error
+# histogram สะสม (แบบ Prometheus) + หน้าต่างล่าสุด (ไว้ดู p50/p95 ระหว่างรัน และคำนวณ img/s, ETA)
+# ปิดไว้ (metrics=None) จะไม่มีการจับเวลาเลย
+
+STAGES = ("decode", "detect", "decode_full", "crop", "write")
+OUTCOMES = ("ok", "no_detection", "class_not_found", "error")
+
+# ขอบบนของแต่ละช่อง histogram (วินาที)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_WINDOW = 512
+_RATE_WINDOW_S = 10.0
+
+
+def timed(metrics, stage, n=1):
+    """with timed(metrics, "detect", len(batch)): ... (metrics=None -> ไม่ทำอะไร)"""
+    if metrics is None:
+        return nullcontext()
+    return metrics.time(stage, n)
+
+
+def classify(outputs):
+    """สรุปผลของ input 1 รูปจาก list ของ (save_path, status) เป็น 1 ใน OUTCOMES"""
+    failed = [status for _, status in outputs if status != "OK"]
+    if outputs and not failed:
+        return "ok"
+    no_det = crop_geometry.status_message(crop_geometry.STATUS_NO_DETECTION, 0)
+    for status in failed:
+        if status.endswith(no_det):
+            return "no_detection"
+        if "Target class" in status and status.endswith("not found"):
+            return "class_not_found"
+    return "error"
+
+
+class StageMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.hist = {}
+        self.recent = {}
+        self.counters = dict.fromkeys(OUTCOMES, 0)
+        self._done = deque()
+
+    # ------------------------------------------
+    # Recording
+    # ------------------------------------------
+    @contextmanager
+    def time(self, stage, n=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, n)
+
+    def observe(self, stage, seconds, n=1):
+        """n > 1: เวลาของทั้ง batch (เก็บเป็นเวลาต่อรูป n ครั้ง)"""
+        n = max(1, int(n))
+        per_item = seconds / n
+        idx = bisect.bisect_left(BUCKETS, per_item)
+        with self._lock:
+            h = self.hist.get(stage)
+            if h is None:
+                h = self.hist[stage] = {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0}
+                self.recent[stage] = deque(maxlen=_WINDOW)
+            h["buckets"][idx] += n
+            h["count"] += n
+            h["sum"] += seconds
+            self.recent[stage].append(per_item)
+
+    def count(self, outcome, n=1):
+        now = time.time()
+        with self._lock:
+            self.counters[outcome] = self.counters.get(outcome, 0) + n
+            self._done.append((now, n))
+            while self._done and now - self._done[0][0] > _RATE_WINDOW_S:
+                self._done.popleft()
+
+    def record_outputs(self, outputs):
+        self.count(classify(outputs))
+
+    # ------------------------------------------
+    # Reading
+    # ------------------------------------------
+    def processed(self):
+        with self._lock:
+            return sum(self.counters.values())
+
+    def throughput(self):
+        """img/s ของ 10 วินาทีล่าสุด (ช่วงแรกใช้ค่าเฉลี่ยตั้งแต่เริ่ม)"""
+        now = time.time()
+        with self._lock:
+            total = sum(self.counters.values())
+            recent = sum(n for t, n in self._done if now - t <= _RATE_WINDOW_S)
+        elapsed = now - self.started
+        if elapsed < _RATE_WINDOW_S:
+            return total / max(elapsed, 1e-9)
+        return recent / _RATE_WINDOW_S
+
+    def eta(self, remaining):
+        """วินาทีที่เหลือโดยประมาณ (None ถ้ายังไม่มีข้อมูล)"""
+        rate = self.throughput()
+        return remaining / rate if rate > 0 else None
+
+    def recent_ms(self, stage, q=50):
+        with self._lock:
+            values = sorted(self.recent.get(stage, ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * q / 100))] * 1000.0
+
+    def stage_text(self):
+        """เช่น 'decode 12ms · detect 41ms · crop 2ms · write 7ms' (ค่ากลางของรูปล่าสุด)"""
+        parts = []
+        for stage in STAGES:
+            ms = self.recent_ms(stage)
+            if ms is not None:
+                parts.append(f"{stage} {ms:.0f}ms")
+        return " · ".join(parts)
+
+    def state(self):
+        """ค่าดิบทั้งหมด (ส่งข้าม process แล้ว merge ได้)"""
+        with self._lock:
+            return {
+                "hist": {k: {"buckets": list(v["buckets"]), "count": v["count"], "sum": v["sum"]}
+                         for k, v in self.hist.items()},
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, state):
+        """รวมค่าจาก state() ของ process อื่น (batch_cli)"""
+        now = time.time()
+        with self._lock:
+            for stage, src in state["hist"].items():
+                h = self.hist.get(stage)
+                if h is None:
+                    h = self.hist[stage] = {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0}
+                    self.recent[stage] = deque(maxlen=_WINDOW)
+                h["buckets"] = [a + b for a, b in zip(h["buckets"], src["buckets"])]
+                h["count"] += src["count"]
+                h["sum"] += src["sum"]
+                if src["count"]:
+                    self.recent[stage].append(src["sum"] / src["count"])
+            n = 0
+            for outcome, value in state["counters"].items():
+                self.counters[outcome] = self.counters.get(outcome, 0) + value
+                n += value
+            if n:
+                self._done.append((now, n))
+            while self._done and now - self._done[0][0] > _RATE_WINDOW_S:
+                self._done.popleft()
+
+    # ------------------------------------------
+    # Export
+    # ------------------------------------------
+    def to_dict(self):
+        state = self.state()
+        stages = {}
+        for stage, h in state["hist"].items():
+            stages[stage] = {
+                "count": h["count"],
+                "total_s": round(h["sum"], 4),
+                "mean_ms": round(h["sum"] / h["count"] * 1000.0, 3) if h["count"] else None,
+                "p50_ms": self.recent_ms(stage, 50),
+                "p95_ms": self.recent_ms(stage, 95),
+                "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], h["buckets"])),
+            }
+        return {
+            "time": time.time(),
+            "elapsed_s": round(time.time() - self.started, 3),
+            "images_per_sec": round(self.throughput(), 3),
+            "outcomes": state["counters"],
+            "stages": stages,
+        }
+
+    def to_prometheus(self, prefix="smartcrop"):
+        state = self.state()
+        lines = [
+            f"# HELP {prefix}_images_total Processed input images by outcome.",
+            f"# TYPE {prefix}_images_total counter",
+        ]
+        for outcome, value in state["counters"].items():
+            lines.append(f'{prefix}_images_total{{outcome="{outcome}"}} {value}')
+
+        name = f"{prefix}_stage_seconds"
+        lines += [f"# HELP {name} Per-image time spent in each pipeline stage.", f"# TYPE {name} histogram"]
+        for stage, h in state["hist"].items():
+            cumulative = 0
+            for bound, value in zip(list(BUCKETS) + ["+Inf"], h["buckets"]):
+                cumulative += value
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {h["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {h["count"]}')
+
+        lines += [f"# HELP {prefix}_images_per_second Recent throughput.",
+                  f"# TYPE {prefix}_images_per_second gauge",
+                  f"{prefix}_images_per_second {self.throughput():.3f}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """เขียนไฟล์ (.prom / .txt = Prometheus text format, อื่นๆ = JSON) แบบ atomic"""
+        if path.lower().endswith((".prom", ".txt")):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.to_dict(), indent=2)
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def summary_lines(self):
+        hist = self.state()["hist"]
+        lines = []
+        # stage หลักตามลำดับ แล้วตามด้วย stage ย่อย (encode:jpeg, copy ...)
+        for stage in list(STAGES) + sorted(set(hist) - set(STAGES)):
+            h = hist.get(stage)
+            if h and h["count"]:
+                lines.append(f"{stage}: {h['sum'] / h['count'] * 1000:.1f} ms/img (total {h['sum']:.1f}s)")
+        return lines
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from detectors import DEFAULT_BACKEND, detector_signature, resolve_device
+
+# ==========================================
+# Model Pool (เก็บโมเดลที่โหลดแล้วไว้ใช้ซ้ำข้ามรอบ)
+# ==========================================
+# key = (ไฟล์โมเดล + ขนาด + เวลาแก้ไข + backend, device) -> AICropper ที่โหลดและ warm-up แล้ว
+# กด Start ซ้ำ / สลับโมเดลไปมา ไม่ต้องโหลด weights ใหม่
+# เก็บได้ไม่เกิน max_models ตัว (เกินแล้วทิ้งตัวที่ไม่ได้ใช้นานที่สุด)
+
+DEFAULT_MAX_MODELS = 2
+
+
+class ModelPool:
+    # on_evict(list ของ (key, cropper)) ถูกเรียกหลังโมเดลถูกทิ้งออกจาก pool (ให้คนที่ถือ cropper ไว้ปล่อยตาม)
+    def __init__(self, max_models=DEFAULT_MAX_MODELS, warmup=True, on_evict=None):
+        self.max_models = max(1, int(max_models))
+        self.warmup = warmup
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model_path, device=None, backend=DEFAULT_BACKEND):
+        """key ของโมเดลใน pool: ชื่อ/path ต่างกันแต่ไฟล์เดียวกันและ device เดียวกัน = ตัวเดียวกัน"""
+        # onnx รันบน CPU อย่างเดียว
+        device = resolve_device(device) if backend == DEFAULT_BACKEND else 'cpu'
+        return detector_signature(os.path.abspath(model_path), backend), device
+
+    def get(self, model_path, device=None, backend=DEFAULT_BACKEND):
+        """
+        คืน (cropper, loaded_now) loaded_now=False แปลว่าได้ตัวที่โหลดไว้แล้ว
+        ถ้ามี thread อื่นกำลังโหลดโมเดลเดียวกันอยู่ จะรอตัวนั้นแทนการโหลดซ้ำ
+        """
+        key = self.key(model_path, device, backend)
+        with self._lock:
+            future = self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._entries[key] = future
+            else:
+                self._entries.move_to_end(key)
+
+        if not owner:
+            return future.result(), False
+
+        try:
+            cropper = self._load(model_path, key[1], backend)
+        except BaseException as e:
+            with self._lock:
+                self._entries.pop(key, None)
+            future.set_exception(e)
+            raise
+        future.set_result(cropper)
+        self._evict(keep=key)
+        return cropper, True
+
+    def touch(self, key):
+        """นับว่าโมเดลนี้เพิ่งถูกใช้ (คนที่ถือ cropper ไว้เองไม่ได้เรียก get ทุกครั้ง) ไม่ให้ถูกทิ้งก่อนตัวที่ไม่มีใครใช้"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def _load(self, model_path, device, backend):
+        from crop_logic import AICropper
+
+        cropper = AICropper(model_path, device=device, backend=backend)
+        if self.warmup:
+            cropper.warmup()
+        print(f"Model ready: {cropper.timing_text()}")
+        return cropper
+
+    def _evict(self, keep):
+        victims = []
+        with self._lock:
+            for key in list(self._entries):
+                if len(self._entries) - len(victims) <= self.max_models:
+                    break
+                # ข้ามตัวที่เพิ่งขอ และตัวที่ยังโหลดไม่เสร็จ
+                if key == keep or not self._entries[key].done():
+                    continue
+                victims.append(key)
+            evicted = [(key, self._entries.pop(key).result()) for key in victims]
+        if victims:
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+            self._release([key[1] for key in victims])
+
+    @staticmethod
+    def _release(devices):
+        # คืน memory ของ GPU ที่โมเดลที่ถูกทิ้งจองไว้
+        if any(str(d).startswith('cuda') for d in devices):
+            import torch
+            torch.cuda.empty_cache()
+
+    def clear(self):
+        with self._lock:
+            devices = [key[1] for key in self._entries]
+            self._entries.clear()
+        self._release(devices)
+
+
+# ใช้ร่วมกันทั้ง process
+shared_pool = ModelPool()
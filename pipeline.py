@@ -0,0 +1,347 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import crop_geometry
+from archive_io import ArchiveMember, is_archive, is_member, iter_sources, source_name
+from crop_logic import IMAGE_EXTS, CropSpec
+from encoder import Encoder
+from metrics import timed
+
+# ==========================================
+# Pipeline: decode -> detect -> encode/write
+# ==========================================
+# decode และ encode/write ทำใน thread pool (cv2 ปล่อย GIL ตอนอ่าน/encode/เขียนไฟล์)
+# ส่วน detect ทำใน thread ที่เรียก run() เพื่อให้โมเดลถูกใช้จาก thread เดียว
+# คิวระหว่าง stage มีขนาดจำกัด (max_queue) เพื่อคุมจำนวนรูปที่ค้างอยู่ใน memory
+# input ที่เป็น tar/zip จะถูกอ่านทีละ member ระหว่าง feed (ไม่แตกไฟล์ลง disk) ดู archive_io.py
+
+_DONE = object()
+
+
+def output_path(output_dir, file_path, spec, ext=None, label=None):
+    """
+    path ของไฟล์ output ตาม spec: output_dir/<subfolder>/<ชื่อไฟล์><suffix><นามสกุล (ค่าเดิม = ของไฟล์ต้นฉบับ)>
+    label = (class, ลำดับ) ของ instance -> <ชื่อไฟล์>_<class>_<ลำดับ><suffix><นามสกุล>
+    """
+    name, src_ext = os.path.splitext(os.path.basename(file_path))
+    if label is not None:
+        name = f"{name}_{label[0]}_{label[1]}"
+    folder = os.path.join(output_dir, spec.subfolder) if spec.subfolder else output_dir
+    return os.path.join(folder, f"{name}{spec.suffix}{ext or src_ext}")
+
+
+class CropPipeline:
+    # specs = list ของ CropSpec (ถ้าไม่ส่งมา ใช้ ratio/padding เป็นแบบเดียว)
+    def __init__(self, cropper, output_dir, ratio, padding, target_class_id,
+                 batch_size=None, decode_workers=2, write_workers=2, max_queue=16, specs=None,
+                 manifest=None, encoder=None, instances=None, sink=None):
+        self.cropper = cropper
+        self.output_dir = output_dir
+        self.specs = list(specs) if specs else [CropSpec(ratio, padding)]
+        self.target_class_id = target_class_id
+        # InstanceOptions (ถ้ามี): เขียนทุก instance ของ class เป้าหมาย ไม่ใช่แค่กรอบที่ใหญ่ที่สุด
+        self.instances = instances
+        # RunManifest (ถ้ามี): ข้ามไฟล์ที่ทำเสร็จแล้วในรอบก่อน และบันทึกผลของไฟล์ที่ทำในรอบนี้
+        self.manifest = manifest
+        # Encoder: format / quality / ย่อขนาด ของไฟล์ output (ค่าเดิม = นามสกุลเดิม)
+        self.encoder = encoder or Encoder()
+        # ShardWriter (ถ้ามี): เขียน crop ต่อท้ายลง tar shard แทนการเขียนไฟล์ทีละไฟล์
+        self.sink = sink
+        self.batch_size = max(1, int(batch_size or cropper.batch_size))
+        self.decode_workers = max(1, int(decode_workers))
+        self.write_workers = max(1, int(write_workers))
+        self.max_queue = max(self.batch_size, int(max_queue))
+
+        self._stop = threading.Event()
+        # จำนวนรูปที่อ่านออกมาจาก archive / ที่ข้ามเพราะ manifest บอกว่าทำแล้ว (นับแทน archive ในสรุปผล)
+        self._members = 0
+        self._members_skipped = 0
+
+    def stop(self):
+        """สั่งหยุด: ไม่รับรูปใหม่ เคลียร์คิว decode และรอไฟล์ที่กำลังเขียนให้เสร็จ"""
+        self._stop.set()
+
+    def is_stopped(self):
+        return self._stop.is_set()
+
+    # ------------------------------------------
+    # Stage 1: decode (prefetch ล่วงหน้า)
+    # ------------------------------------------
+    def _skip_member(self, path):
+        if self.manifest.is_done(path):
+            self._members_skipped += 1
+            return True
+        return False
+
+    def _feed(self, file_paths, decode_pool, decode_q):
+        skip = self._skip_member if self.manifest is not None else None
+        try:
+            for source in iter_sources(file_paths, IMAGE_EXTS, skip):
+                if self._stop.is_set():
+                    break
+                if isinstance(source, ArchiveMember):
+                    self._members += 1
+                item = (source_name(source), decode_pool.submit(self.cropper.load_source, source))
+                # put แบบมี timeout เพื่อให้ยังเช็ค stop ได้ตอนคิวเต็ม
+                while not self._stop.is_set():
+                    try:
+                        decode_q.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                else:
+                    item[1].cancel()
+        finally:
+            decode_q.put(_DONE)
+
+    def _next_batch(self, decode_q):
+        """ดึงรูปจากคิว decode ให้ได้ครบ batch (หรือจนหมดไฟล์) คืนค่า (batch, หมดแล้วหรือยัง)"""
+        batch = []
+        while len(batch) < self.batch_size:
+            item = decode_q.get()
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _drain(self, decode_q):
+        while True:
+            item = decode_q.get()
+            if item is _DONE:
+                return
+            item[1].cancel()
+
+    # ------------------------------------------
+    # Stage 3: crop (จากรูปเต็มความละเอียด) + encode + write
+    # ------------------------------------------
+    def _fail_all(self, status):
+        return [("", status)] * len(self.specs)
+
+    def _plan(self, file_path, det, h, w, ext):
+        """
+        กรอบ crop ของรูปขนาด (h, w) คืนค่า list ของ (save_path, rect, failure)
+        failure = ข้อความ "Failed: ..." (ถ้ามี save_path / rect จะเป็น None)
+        instances: ได้ทุก instance x ทุก spec (ไฟล์ละ 1 instance) ไม่งั้น 1 ไฟล์ต่อ spec จากกรอบที่ใหญ่ที่สุด
+        """
+        if self.instances is None:
+            rects, status = self.cropper.crop_rects(det, h, w, self.specs, self.target_class_id)
+            labels = [None]
+            rects, status = rects[None], status[None]
+        else:
+            labels, rects, status, image_status = self.cropper.instance_rects(
+                det, h, w, self.specs, self.target_class_id, self.instances)
+            if not labels:
+                failure = f"Failed: {crop_geometry.status_message(image_status, self.target_class_id)}"
+                return [(None, None, failure)] * len(self.specs)
+
+        jobs = []
+        for label, label_rects, label_status in zip(labels, rects.tolist(), status.tolist()):
+            for spec, rect, code in zip(self.specs, label_rects, label_status):
+                if code != crop_geometry.STATUS_OK:
+                    jobs.append((None, None, f"Failed: {crop_geometry.status_message(code, self.target_class_id)}"))
+                else:
+                    jobs.append((output_path(self.output_dir, file_path, spec, ext, label), rect, None))
+        return jobs
+
+    def _crop_and_write(self, file_path, loaded, det):
+        """
+        คำนวณกรอบจากขนาดรูปใน header ก่อน: กรอบที่ได้ทั้งรูปพอดี copy ไฟล์เดิมได้เลย (ไม่ decode/encode)
+        ที่เหลือ decode รูปเต็มครั้งเดียว แล้วเขียนทุกไฟล์จาก array เดียวกัน
+        """
+        metrics = self.cropper.metrics
+        img = None
+        size = loaded.full_size(det.shape)
+        if size is None:
+            with timed(metrics, "decode_full"):
+                img = loaded.full()
+            if img is None:
+                return self._fail_all("Failed: Error: Cannot read image")
+            size = img.shape[:2]
+
+        h, w = size
+        ext = self.encoder.extension(file_path)
+        with timed(metrics, "crop"):
+            jobs = self._plan(file_path, det, h, w, ext)
+        # copy ได้เฉพาะไฟล์จริงที่เขียนออกเป็นไฟล์
+        can_copy = self.sink is None and not is_member(file_path) and self.encoder.can_copy(file_path, w, h)
+
+        outputs = []
+        for save_path, rect, failure in jobs:
+            if failure is not None:
+                outputs.append(("", failure))
+                continue
+            if can_copy and rect == [0, 0, w, h]:
+                outputs.append(self.encoder.copy(file_path, save_path, metrics))
+                continue
+            if loaded.raster is not None:
+                # อ่านเฉพาะกรอบที่ crop (memmap / รูปที่ decode ค้างไว้) ไม่ต้องมีทั้งรูป
+                with timed(metrics, "decode_full"):
+                    region = self.cropper.read_region(loaded.raster, rect)
+                outputs.append(self._write(save_path, region, file_path, rect))
+                continue
+            if img is None:
+                with timed(metrics, "decode_full"):
+                    img = loaded.full()
+                if img is None:
+                    outputs.append(("", "Failed: Error: Cannot read image"))
+                    continue
+                if img.shape[:2] != (h, w):
+                    # ขนาดจาก header ไม่ตรงกับรูปที่ decode ได้ (เช่น EXIF หมุนภาพ) -> คำนวณกรอบใหม่จากรูปจริง
+                    return self._write_all(file_path, img, det, ext)
+            x1, y1, x2, y2 = rect
+            outputs.append(self._write(save_path, img[y1:y2, x1:x2], file_path, rect))
+        return outputs
+
+    def _write_all(self, file_path, img, det, ext):
+        h, w = img.shape[:2]
+        with timed(self.cropper.metrics, "crop"):
+            jobs = self._plan(file_path, det, h, w, ext)
+        outputs = []
+        for save_path, rect, failure in jobs:
+            if failure is not None:
+                outputs.append(("", failure))
+                continue
+            x1, y1, x2, y2 = rect
+            outputs.append(self._write(save_path, img[y1:y2, x1:x2], file_path, rect))
+        return outputs
+
+    def _write(self, save_path, cropped_img, file_path, rect):
+        metrics = self.cropper.metrics
+        if self.sink is None:
+            with timed(metrics, "write"):
+                return self.encoder.write(save_path, cropped_img, metrics)
+
+        buf = self.encoder.encode(save_path, cropped_img, metrics)
+        if buf is None:
+            return "", "Failed: Error: Cannot encode image"
+        with timed(metrics, "write"):
+            try:
+                return self.sink.add(save_path, buf.tobytes(), {"source": file_path, "box": rect}), "OK"
+            except OSError:
+                return "", "Failed: Error: Cannot write shard"
+
+    def run(self, file_paths, on_result=None, on_skip=None):
+        """
+        ประมวลผลทุกไฟล์ผ่าน pipeline
+        on_result(file_path, outputs) ถูกเรียกไฟล์ละครั้ง (อาจถูกเรียกจาก thread ของ writer)
+        outputs = list ของ (save_path, status) เรียงตาม specs (โหมด instances: instance ละชุด เรียงตามลำดับ instance)
+        on_skip(file_path) ถูกเรียกกับไฟล์ที่ manifest บอกว่าทำเสร็จแล้ว (ไม่ถูกประมวลผลซ้ำ)
+        file_paths มี tar/zip (หรือ ArchiveMember ที่อ่านมาแล้ว) ได้: รูปข้างในถูกนับเป็นรายการละรูป
+        (file_path = "<archive>::<member>") และถูกบันทึก / ข้ามด้วย manifest เหมือนไฟล์ปกติ
+        คืนค่า dict สรุปผล (นับเป็นจำนวนรูป: ok = ทุกแบบสำเร็จ)
+        """
+        for spec in self.specs if self.sink is None else ():
+            folder = os.path.join(self.output_dir, spec.subfolder) if spec.subfolder else self.output_dir
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+        stats = {"total": len(file_paths), "ok": 0, "failed": 0, "skipped": 0}
+        lock = threading.Lock()
+
+        if self.manifest is not None:
+            file_paths, skipped = self.manifest.filter(file_paths)
+            stats["skipped"] = len(skipped)
+            if on_skip is not None:
+                for path in skipped:
+                    on_skip(path)
+
+        def report(file_path, outputs, digest=None):
+            ok = all(status == "OK" for _, status in outputs)
+            with lock:
+                stats["ok" if ok else "failed"] += 1
+            if self.manifest is not None:
+                # digest = hash ของเนื้อไฟล์ที่คำนวณไว้แล้วตอน decode (เปิด cache) manifest ไม่ต้องอ่านไฟล์ซ้ำ
+                self.manifest.record(file_path, outputs, digest)
+            if self.cropper.metrics is not None:
+                self.cropper.metrics.record_outputs(outputs)
+            if on_result is not None:
+                on_result(file_path, outputs)
+
+        decode_q = queue.Queue(maxsize=self.max_queue)
+        write_slots = threading.BoundedSemaphore(self.max_queue)
+        decode_pool = ThreadPoolExecutor(self.decode_workers, thread_name_prefix="decode")
+        write_pool = ThreadPoolExecutor(self.write_workers, thread_name_prefix="write")
+
+        def write_task(file_path, loaded, det):
+            try:
+                outputs = self._crop_and_write(file_path, loaded, det)
+            except Exception as e:
+                outputs = self._fail_all(f"Failed: {e}")
+            finally:
+                if loaded.raster is not None:
+                    loaded.raster.close()
+                write_slots.release()
+            report(file_path, outputs, loaded.key)
+
+        feeder = threading.Thread(target=self._feed, args=(file_paths, decode_pool, decode_q), daemon=True)
+        feeder.start()
+
+        try:
+            finished = False
+            while not finished:
+                if self._stop.is_set():
+                    self._drain(decode_q)
+                    break
+
+                batch, finished = self._next_batch(decode_q)
+                if not batch:
+                    break
+
+                # Stage 2: detect ทั้ง batch ด้วย predict ครั้งเดียว
+                paths, loaded = [], []
+                for path, fut in batch:
+                    try:
+                        item = fut.result()
+                    except Exception as e:
+                        report(path, self._fail_all(f"Failed: {e}"))
+                        continue
+                    if item.raster is not None:
+                        # รูปใหญ่มาก: detect แบบ tile เองทั้งรูป (ไม่เข้า batch กับรูปอื่น)
+                        try:
+                            det = self.cropper.detect_large(item.raster)
+                        except Exception as e:
+                            item.raster.close()
+                            report(path, self._fail_all(f"Failed: {e}"))
+                            continue
+                        write_slots.acquire()
+                        write_pool.submit(write_task, path, item, det)
+                        continue
+                    if item.det_img is None:
+                        report(path, self._fail_all("Failed: Error: Cannot read image"))
+                        continue
+                    paths.append(path)
+                    loaded.append(item)
+
+                dets = self.cropper.detect_batch_safe([x.det_img for x in loaded], [x.key for x in loaded],
+                                                      [x.phash for x in loaded])
+                for path, item, (det, error) in zip(paths, loaded, dets):
+                    if det is None:
+                        report(path, self._fail_all(f"Failed: {error}"))
+                        continue
+                    # ไม่ต้องเก็บรูปที่ใช้ detect ไว้ต่อ (ถ้าเป็นรูปย่อ รูปเต็มจะ decode ใหม่ใน writer)
+                    item = item._replace(det_img=None)
+                    write_slots.acquire()
+                    write_pool.submit(write_task, path, item, det)
+        finally:
+            # pipeline ใช้ได้ครั้งเดียว: ปิด feeder และเคลียร์คิวที่ยังค้าง (กรณีหลุดออกมาด้วย exception)
+            self._stop.set()
+            while feeder.is_alive():
+                try:
+                    item = decode_q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is not _DONE:
+                    item[1].cancel()
+            feeder.join()
+            decode_pool.shutdown(wait=True, cancel_futures=True)
+            # รอไฟล์ที่ crop เสร็จแล้วเขียนลง disk ให้ครบก่อนจบ
+            write_pool.shutdown(wait=True)
+
+        # archive นับเป็นจำนวนรูปข้างใน (ArchiveMember ที่ส่งมาตรงๆ ถูกนับใน len(file_paths) แล้ว)
+        given = sum(1 for path in file_paths if is_archive(path) or isinstance(path, ArchiveMember))
+        stats["total"] += self._members + self._members_skipped - given
+        stats["skipped"] += self._members_skipped
+        stats["cancelled"] = stats["total"] - stats["ok"] - stats["failed"] - stats["skipped"]
+        return stats
@@ -0,0 +1,120 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+import cv2
+import numpy as np
+
+from detect_cache import DEFAULT_CACHE_DIR, evict_lru
+from image_io import _REDUCED_FLAGS, is_jpeg, probe_size, reduce_factor
+
+# ==========================================
+# Thumbnail Cache (เก็บรูปย่อของ list ลง disk)
+# ==========================================
+# key = path + ขนาดไฟล์ + เวลาแก้ไข + ขนาด thumbnail (ไฟล์ถูกแก้ -> key เปลี่ยนเอง)
+# เก็บเป็น JPEG เล็กๆ ใน sqlite ไฟล์เดียว (ไม่สร้างไฟล์เล็กเป็นพันไฟล์) จำกัดขนาดรวมด้วย max_bytes
+
+THUMB_SIZE = 80
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+_JPEG_QUALITY = 85
+
+
+def thumb_key(path, size=THUMB_SIZE):
+    """คืน None ถ้า stat ไฟล์ไม่ได้"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{size}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def make_thumbnail(path, size=THUMB_SIZE):
+    """
+    สร้าง thumbnail (JPEG bytes) ด้านยาวไม่เกิน size คืน None ถ้าอ่านรูปไม่ได้
+    JPEG ใหญ่ๆ ใช้ decode แบบย่อ (1/2, 1/4, 1/8) ไม่ต้อง decode เต็มความละเอียด
+    วิดีโอใช้เฟรมแรก (ไม่อ่านทั้งไฟล์)
+    """
+    from crop_logic import VIDEO_EXTS
+
+    if path.lower().endswith(VIDEO_EXTS):
+        cap = cv2.VideoCapture(path)
+        ok, img = cap.read()
+        cap.release()
+        return _encode_thumbnail(img, size) if ok else None
+
+    data = np.fromfile(path, dtype=np.uint8)
+    if data.size == 0:
+        return None
+
+    img = None
+    if is_jpeg(data):
+        dims = probe_size(data)
+        factor = reduce_factor(dims[0], dims[1], size) if dims else 1
+        if factor > 1:
+            img = cv2.imdecode(data, _REDUCED_FLAGS[factor])
+    if img is None:
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return _encode_thumbnail(img, size)
+
+
+def _encode_thumbnail(img, size):
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, _JPEG_QUALITY])
+    return buf.tobytes() if ok else None
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, size=THUMB_SIZE):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "thumbnails.sqlite")
+        self.max_bytes = int(max_bytes)
+        self.size = size
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbs ("
+            " key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_thumbs_atime ON thumbs(atime)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbs").fetchone()[0]
+
+    def get(self, path):
+        """คืน JPEG bytes ของ thumbnail (จาก cache หรือสร้างใหม่แล้วเก็บไว้) / None ถ้าอ่านรูปไม่ได้"""
+        key = thumb_key(path, self.size)
+        if key is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM thumbs WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE thumbs SET atime=? WHERE key=?", (time.time(), key))
+                self._conn.commit()
+                return bytes(row[0])
+
+        data = make_thumbnail(path, self.size)
+        if data is not None:
+            self._put(key, data)
+        return data
+
+    def _put(self, key, data):
+        size = len(data) + len(key)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO thumbs (key, data, size, atime) VALUES (?, ?, ?, ?)",
+                               (key, data, size, time.time()))
+            self._conn.commit()
+            self._total += size
+            if self._total > self.max_bytes:
+                self._total = evict_lru(self._conn, "thumbs", self.max_bytes)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
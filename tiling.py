@@ -0,0 +1,285 @@
+import struct
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from image_io import _REDUCED_FLAGS, is_jpeg, probe_size
+
+# ==========================================
+# Tiled Detection (รูปใหญ่มาก เช่น scan / panorama 100MP+)
+# ==========================================
+# ส่งทั้งรูปให้ predict ตรงๆ subject เล็กๆ จะถูกย่อจนหายไป และรูปที่ decode แล้วกิน memory เป็น GB
+# -> ตัดเป็น tile ที่ซ้อนกันเล็กน้อย detect ทีละ batch แล้วรวมกรอบที่ถูกตัดตรงขอบ tile เข้าด้วยกัน
+#    (บวกรอบภาพรวมแบบย่อ 1 ครั้ง ไว้จับ subject ใหญ่ที่ไม่อยู่ครบใน tile ไหนเลย)
+# BMP (ไม่บีบอัด) อ่านผ่าน np.memmap: tile / กรอบ crop ถูกอ่านจาก disk เฉพาะส่วนที่ใช้
+# JPEG / PNG / WebP ต้อง decode ทั้งรูป -> จองจาก MemoryBudget ก่อน
+#   (JPEG ที่ใหญ่เกิน budget ใช้ decode แบบย่อ 1/2, 1/4, 1/8 แทน ส่วน format อื่นจะ fail)
+
+# tile = ขนาดด้านของ tile (px ของรูปเต็ม), overlap = สัดส่วนที่ tile ติดกันซ้อนกัน
+# min_pixels = ใช้ tiling เฉพาะรูปที่มีจำนวน pixel ตั้งแต่ค่านี้ขึ้นไป
+# memory_mb = เพดาน memory ของ pixel ที่ decode ค้างไว้พร้อมกัน (ต่อ process)
+TileOptions = namedtuple("TileOptions", ["tile", "overlap", "min_pixels", "memory_mb"],
+                         defaults=(1024, 0.2, 50_000_000, 2048))
+
+# กรอบ class เดียวกันที่ซ้อนกันเกินค่านี้ (เทียบกับพื้นที่กรอบที่เล็กกว่า) ถือว่าเป็น subject เดียวกัน
+MERGE_THRESHOLD = 0.5
+
+# อ่านแค่หัวไฟล์ไว้ดูขนาด (พอสำหรับ BMP / PNG / WebP และ JPEG ส่วนใหญ่)
+_PROBE_BYTES = 4096
+# JPEG ที่ยังไม่เจอ SOF ใน _PROBE_BYTES อ่านเพิ่มถึงค่านี้ (EXIF ที่มีรูปย่อฝังมาอาจยาวหลายสิบ KB)
+_HEADER_BYTES = 512 * 1024
+
+
+def tile_grid(w, h, tile, overlap):
+    """list ของ (x1, y1, x2, y2) ที่คลุมทั้งรูป tile สุดท้ายของแต่ละแถว/คอลัมน์ชิดขอบรูปพอดี"""
+    tile = int(tile)
+    step = max(1, int(tile * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        out = list(range(0, length - tile, step))
+        out.append(length - tile)
+        return out
+
+    return [(x, y, min(x + tile, w), min(y + tile, h)) for y in starts(h) for x in starts(w)]
+
+
+def merge_boxes(boxes, classes, confs, threshold=MERGE_THRESHOLD):
+    """
+    รวมกรอบจากหลาย tile: กรอบ class เดียวกันที่ซ้อนกัน (intersection / พื้นที่กรอบที่เล็กกว่า >= threshold)
+    ถูกรวมเป็นกรอบเดียวที่คลุมทั้งคู่ (ครึ่งตัวจาก tile ซ้าย + ครึ่งตัวจาก tile ขวา = ทั้งตัว)
+    ทำแบบ NMS: ไล่จาก conf มาก->น้อย, conf ของกรอบที่รวมแล้ว = ค่ามากสุด
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    classes = np.asarray(classes).reshape(-1)
+    confs = np.asarray(confs, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return boxes, classes, confs
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-confs, kind="stable")
+    out_boxes, out_classes, out_confs = [], [], []
+    while order.size:
+        i = order[0]
+        rest = order[1:]
+        w = np.maximum(0.0, np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]))
+        h = np.maximum(0.0, np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]))
+        ios = (w * h) / (np.minimum(areas[i], areas[rest]) + 1e-9)
+        group = rest[(ios >= threshold) & (classes[rest] == classes[i])]
+        members = np.concatenate(([i], group))
+        out_boxes.append([boxes[members, 0].min(), boxes[members, 1].min(),
+                          boxes[members, 2].max(), boxes[members, 3].max()])
+        out_classes.append(classes[i])
+        out_confs.append(confs[i])
+        order = rest[~np.isin(rest, group)]
+    return (np.asarray(out_boxes, dtype=np.float32), np.asarray(out_classes), np.asarray(out_confs, dtype=np.float32))
+
+
+class MemoryBudget:
+    """นับ bytes ของรูปที่ decode ค้างไว้ รอจนกว่าจะมีที่ว่าง (ใช้ร่วมกันทั้ง decode / detect / writer thread)"""
+
+    def __init__(self, limit_mb):
+        self.limit = int(limit_mb) * 1024 * 1024
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def fits(self, nbytes):
+        return nbytes <= self.limit
+
+    def acquire(self, nbytes):
+        with self._cond:
+            self._cond.wait_for(lambda: self.used == 0 or self.used + nbytes <= self.limit)
+            self.used += nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.used = max(0, self.used - nbytes)
+            self._cond.notify_all()
+
+
+# ------------------------------------------
+# แหล่ง pixel ของรูปใหญ่ (อ่านเป็นช่วงได้)
+# ------------------------------------------
+class BmpRaster:
+    """BMP 24/32 bit ไม่บีบอัด อ่านผ่าน np.memmap (ไม่โหลดทั้งไฟล์)"""
+    # pixel ที่ read() คืนมา 1 px = กี่ px ของรูปเต็ม
+    scale = 1
+
+    def __init__(self, path, offset, w, h, channels, top_down):
+        stride = (w * channels + 3) & ~3
+        self._map = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(h, stride))
+        self.size = (h, w)
+        self.channels = channels
+        self.top_down = top_down
+
+    def read(self, x1, y1, x2, y2, step=1):
+        """pixel ในกรอบ (BGR, contiguous) step > 1 = อ่านแบบข้าม pixel (ย่อขนาด)"""
+        h, _ = self.size
+        if self.top_down:
+            rows = self._map[y1:y2:step]
+        else:
+            # BMP ปกติเก็บแถวจากล่างขึ้นบน
+            rows = self._map[h - y2:h - y1][::-1][::step]
+        c = self.channels
+        region = rows[:, x1 * c:x2 * c].reshape(rows.shape[0], x2 - x1, c)[:, ::step, :3]
+        return np.ascontiguousarray(region)
+
+    def open(self):
+        return self
+
+    def full(self):
+        h, w = self.size
+        return self.read(0, 0, w, h)
+
+    def close(self):
+        self._map = None
+
+
+class DecodedRaster:
+    """รูปที่ decode แล้วทั้งรูป (จองจาก MemoryBudget) factor > 1 = เป็นรูปย่อ (JPEG ที่ใหญ่เกิน budget)"""
+
+    def __init__(self, data, size, budget, factor=1):
+        self._data = data
+        self._budget = budget
+        self._factor = factor
+        self.scale = factor
+        self._img = None
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.size = size
+
+    def _decoded(self):
+        with self._lock:
+            if self._img is None:
+                h, w = self.size
+                self._nbytes = (h // self._factor + 1) * (w // self._factor + 1) * 3
+                self._budget.acquire(self._nbytes)
+                flags = _REDUCED_FLAGS[self._factor] if self._factor > 1 else cv2.IMREAD_COLOR
+                self._img = cv2.imdecode(self._data, flags)
+                self._data = None
+                if self._img is None:
+                    self._budget.release(self._nbytes)
+                    raise ValueError("Cannot read image")
+                # header เก็บขนาดก่อนหมุนตาม EXIF -> ใช้ทิศของรูปที่ decode ได้จริง
+                h_img, w_img = self._img.shape[:2]
+                if self._factor == 1:
+                    self.size = (h_img, w_img)
+                elif h != w and (h_img > w_img) != (h > w):
+                    self.size = (w, h)
+            return self._img
+
+    def open(self):
+        self._decoded()
+        return self
+
+    def read(self, x1, y1, x2, y2, step=1):
+        img = self._decoded()
+        f = self._factor
+        return img[y1 // f:y2 // f:step, x1 // f:x2 // f:step]
+
+    def full(self):
+        return self._decoded() if self._factor == 1 else None
+
+    def close(self):
+        with self._lock:
+            if self._img is not None:
+                self._img = None
+                self._budget.release(self._nbytes)
+
+
+def _bmp_header(head):
+    """(offset, w, h, channels, top_down) ของ BMP ที่ memmap ได้ หรือ None"""
+    if len(head) < 34 or bytes(head[:2]) != b'BM':
+        return None
+    offset, = struct.unpack_from('<I', head, 10)
+    w, h = struct.unpack_from('<ii', head, 18)
+    bpp, compression = struct.unpack_from('<HI', head, 28)
+    if compression != 0 or bpp not in (24, 32) or w <= 0 or h == 0:
+        return None
+    return offset, w, abs(h), bpp // 8, h < 0
+
+
+def open_large(path, options, budget):
+    """
+    ถ้ารูปมี pixel ตั้งแต่ options.min_pixels ขึ้นไป คืนค่า raster (BmpRaster / DecodedRaster) ไม่งั้นคืน None
+    ยังไม่ decode อะไร (DecodedRaster decode ตอนใช้ครั้งแรก)
+    """
+    head = np.fromfile(path, dtype=np.uint8, count=_PROBE_BYTES)
+    bmp = _bmp_header(head)
+    if bmp is not None:
+        offset, w, h, channels, top_down = bmp
+        if w * h < options.min_pixels:
+            return None
+        return BmpRaster(path, offset, w, h, channels, top_down)
+
+    size = probe_size(head)
+    if size is None and is_jpeg(head) and head.size == _PROBE_BYTES:
+        size = probe_size(np.fromfile(path, dtype=np.uint8, count=_HEADER_BYTES))
+    if size is None or size[0] * size[1] < options.min_pixels:
+        return None
+    w, h = size
+    data = np.fromfile(path, dtype=np.uint8)
+    factor = 1
+    if not budget.fits(w * h * 3):
+        if not is_jpeg(data):
+            raise ValueError(f"Image too large for memory limit ({w}x{h})")
+        factor = next((f for f in (2, 4, 8) if budget.fits((w // f + 1) * (h // f + 1) * 3)), None)
+        if factor is None:
+            raise ValueError(f"Image too large for memory limit ({w}x{h})")
+        print(f"⚠️ {w}x{h} exceeds the memory limit, using 1/{factor} resolution")
+    return DecodedRaster(data, (h, w), budget, factor)
+
+
+def read_region(raster, x1, y1, x2, y2, budget):
+    """อ่านกรอบ crop จาก raster ถ้ากรอบใหญ่เกิน budget จะอ่านแบบย่อ (ข้าม pixel) ให้พอดี"""
+    nbytes = (x2 - x1) * (y2 - y1) * 3
+    step = 1
+    while not budget.fits(nbytes // (step * step)):
+        step += 1
+    if step > 1:
+        print(f"⚠️ Crop {x2 - x1}x{y2 - y1} exceeds the memory limit, writing at 1/{step} resolution")
+        return np.ascontiguousarray(raster.read(x1, y1, x2, y2, step))
+    return raster.read(x1, y1, x2, y2)
+
+
+def detect_tiled(predict, raster, options, batch_size, imgsz, accept=None):
+    """
+    predict(list ของรูป) -> list ของ (boxes, classes, confs) ในพิกัดของแต่ละรูป
+    accept(ผลของภาพรวม) -> True = ใช้ผลภาพรวมเลย ไม่ต้อง detect ทีละ tile (cascade)
+    คืนค่า (boxes, classes, confs, ใช้ tile หรือไม่) ในพิกัดของรูปเต็ม
+    """
+    h, w = raster.open().size
+    all_boxes, all_classes, all_confs = [], [], []
+
+    def collect(results, offsets, steps):
+        for (boxes, classes, confs), (x, y), step in zip(results, offsets, steps):
+            boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+            if len(boxes):
+                all_boxes.append(boxes * (step * raster.scale) + np.array([x, y, x, y], dtype=np.float32))
+                all_classes.append(np.asarray(classes).reshape(-1))
+                all_confs.append(np.asarray(confs).reshape(-1))
+
+    # ภาพรวมแบบย่อ (ด้านยาวประมาณ 2 x imgsz)
+    step = max(1, max(w, h) // raster.scale // (imgsz * 2))
+    overview = predict([raster.read(0, 0, w, h, step)])
+    collect(overview, [(0, 0)], [step])
+
+    # tile ทีละ batch (ใน memory พร้อมกันแค่ batch เดียว)
+    tiles = tile_grid(w, h, options.tile, options.overlap)
+    if accept is not None and accept(overview[0]):
+        tiles = []
+    for start in range(0, len(tiles), batch_size):
+        group = tiles[start:start + batch_size]
+        imgs = [raster.read(x1, y1, x2, y2) for x1, y1, x2, y2 in group]
+        collect(predict(imgs), [(x1, y1) for x1, y1, _, _ in group], [1] * len(group))
+
+    if not all_boxes:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0), np.zeros(0, dtype=np.float32), bool(tiles)
+    boxes, classes, confs = merge_boxes(np.concatenate(all_boxes), np.concatenate(all_classes),
+                                        np.concatenate(all_confs))
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, w)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, h)
+    return boxes, classes, confs, bool(tiles)
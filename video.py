@@ -0,0 +1,192 @@
+import os
+
+import cv2
+import numpy as np
+
+import crop_geometry
+from crop_logic import VIDEO_EXTS
+from pipeline import output_path
+
+# ==========================================
+# Video Mode (reframe วิดีโอตาม subject เช่น 16:9 -> 9:16)
+# ==========================================
+# อ่านทีละเฟรม (ไม่ decode ทั้งไฟล์ลง memory) และรัน detect แค่ทุก stride เฟรม
+# เฟรมระหว่าง keyframe ใช้ตำแหน่ง subject ที่ interpolate ระหว่าง keyframe ก่อน/หลัง แล้วทำ EMA ให้กล้องแพนนุ่มๆ
+# ต้องพักเฟรมไว้ไม่เกิน stride เฟรม (รอ keyframe ถัดไปก่อนถึงจะรู้ตำแหน่ง)
+# กรอบ crop มีขนาดคงที่ทั้งวิดีโอ = กรอบใหญ่สุดของ ratio ที่อยู่ในเฟรมได้ (padding ไม่มีผล)
+# spec แบบ Free (ratio None) ไม่มีอะไรให้ reframe -> ข้าม ไม่เขียนไฟล์
+# ไฟล์ output เป็น .mp4 (mp4v) ไม่มีเสียง / ยกเลิก, error หรือไม่เจอ subject เลย -> ลบไฟล์ที่เขียนไปแล้วทิ้ง
+
+FREE_RATIO_STATUS = "Failed: Free ratio is not supported for video"
+
+DEFAULT_STRIDE = 5
+DEFAULT_SMOOTHING = 0.8
+
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTS)
+
+
+def iter_frames(path):
+    """generator ของ (index, frame BGR) ทีละเฟรม"""
+    cap = cv2.VideoCapture(path)
+    try:
+        index = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                return
+            yield index, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def video_info(path):
+    """คืนค่า (fps, จำนวนเฟรมโดยประมาณ, (w, h)) หรือ None ถ้าเปิดไม่ได้"""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return fps, count, size
+    finally:
+        cap.release()
+
+
+def _remove(paths):
+    for p in paths:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def window_size(w, h, ratio):
+    """กรอบใหญ่สุดของ ratio (w/h) ที่อยู่ในเฟรม (ปัดเป็นเลขคู่ ตามที่ encoder ส่วนใหญ่ต้องการ)"""
+    if ratio is None:
+        win_w, win_h = w, h
+    elif w / h > ratio:
+        win_w, win_h = h * ratio, h
+    else:
+        win_w, win_h = w, w / ratio
+    return max(2, int(win_w) // 2 * 2), max(2, int(win_h) // 2 * 2)
+
+
+class VideoCropper:
+    """
+    ใช้ AICropper ที่โหลดแล้ว crop วิดีโอ 1 ไฟล์ออกมาเป็นวิดีโอ 1 ไฟล์ต่อ spec (อ่านวิดีโอรอบเดียว)
+    stride    = รัน detect ทุกกี่เฟรม
+    smoothing = 0 (ตาม subject ทันที) - 0.95 (แพนช้ามาก) ค่า EMA ต่อเฟรม
+    """
+
+    def __init__(self, cropper, specs, target_class_id, stride=DEFAULT_STRIDE, smoothing=DEFAULT_SMOOTHING):
+        self.cropper = cropper
+        self.specs = list(specs)
+        self.target_class_id = target_class_id
+        self.stride = max(1, int(stride))
+        self.smoothing = min(max(float(smoothing), 0.0), 0.95)
+
+    def _subject_center(self, frame):
+        """จุดกึ่งกลางของกรอบ class เป้าหมายที่ใหญ่ที่สุด (None ถ้าไม่เจอ)"""
+        det = self.cropper.detect_batch([frame])[0]
+        boxes = np.asarray(det.boxes).reshape(-1, 4)
+        best, status = crop_geometry.select_best_boxes(
+            boxes, det.classes, np.zeros(len(boxes), dtype=np.int64), 1, self.target_class_id)
+        if best[0] < 0:
+            return None
+        x1, y1, x2, y2 = boxes[best[0]]
+        return np.array([(x1 + x2) / 2.0, (y1 + y2) / 2.0])
+
+    def process(self, file_path, output_dir, on_progress=None, should_stop=None):
+        """
+        คืนค่า list ของ (save_path, status) ตามลำดับ specs (รูปแบบเดียวกับ CropPipeline)
+        on_progress(frames_done, frames_total) / should_stop() -> True เพื่อยกเลิก
+        """
+        info = video_info(file_path)
+        if info is None:
+            return [("", "Failed: Error: Cannot open video")] * len(self.specs)
+        fps, total, (w, h) = info
+        specs = [spec for spec in self.specs if spec.ratio is not None]
+        if not specs:
+            return [("", FREE_RATIO_STATUS)] * len(self.specs)
+        windows = [window_size(w, h, spec.ratio) for spec in specs]
+        paths = [output_path(output_dir, file_path, spec, ".mp4") for spec in specs]
+        for p in paths:
+            os.makedirs(os.path.dirname(p) or ".", exist_ok=True)
+        writers = [cv2.VideoWriter(p, cv2.VideoWriter_fourcc(*"mp4v"), fps, size) for p, size in zip(paths, windows)]
+        if not all(wr.isOpened() for wr in writers):
+            for wr in writers:
+                wr.release()
+            _remove(paths)
+            return [("", "Failed: Error: Cannot write video")] * len(self.specs)
+
+        state = {"center": None, "smooth": None, "found": False, "written": 0}
+
+        def emit(frames, start_center, end_center):
+            # interpolate ตำแหน่ง subject ระหว่าง keyframe แล้วทำ EMA ทีละเฟรม
+            n = len(frames)
+            for i, frame in enumerate(frames):
+                t = i / n if n else 0.0
+                target = start_center + (end_center - start_center) * t
+                if state["smooth"] is None:
+                    state["smooth"] = target
+                else:
+                    state["smooth"] = self.smoothing * state["smooth"] + (1 - self.smoothing) * target
+                cx, cy = state["smooth"]
+                for writer, (win_w, win_h) in zip(writers, windows):
+                    x1 = int(round(min(max(cx - win_w / 2, 0), w - win_w)))
+                    y1 = int(round(min(max(cy - win_h / 2, 0), h - win_h)))
+                    writer.write(np.ascontiguousarray(frame[y1:y1 + win_h, x1:x1 + win_w]))
+                state["written"] += 1
+            if on_progress is not None:
+                on_progress(state["written"], total)
+
+        pending = []
+        cancelled = False
+        error = None
+        try:
+            for index, frame in iter_frames(file_path):
+                if should_stop is not None and should_stop():
+                    cancelled = True
+                    break
+                if frame.shape[:2] != (h, w):
+                    frame = cv2.resize(frame, (w, h))
+                if index % self.stride == 0:
+                    center = self._subject_center(frame)
+                    if center is not None:
+                        state["found"] = True
+                    else:
+                        # ไม่เจอ subject: ค้างไว้ที่ตำแหน่งเดิม (ถ้ายังไม่เคยเจอ ใช้กลางเฟรม)
+                        center = state["center"] if state["center"] is not None else np.array([w / 2.0, h / 2.0])
+                    prev = state["center"] if state["center"] is not None else center
+                    emit(pending, prev, center)
+                    pending = []
+                    state["center"] = center
+                pending.append(frame)
+            if pending:
+                emit(pending, state["center"], state["center"])
+        except Exception as e:
+            error = e
+        finally:
+            for writer in writers:
+                writer.release()
+
+        status = None
+        if error is not None:
+            status = f"Failed: Error: {error}"
+        elif cancelled:
+            status = "Failed: Cancelled"
+        elif state["written"] == 0:
+            status = "Failed: Error: Cannot read video"
+        elif not state["found"]:
+            # ไม่มีเฟรมไหนเจอ subject: ไม่เก็บไฟล์ที่เป็นกรอบกลางเฟรมไว้ (เหมือนรูปนิ่งที่ไม่เจอ class)
+            status = f"Failed: {crop_geometry.status_message(crop_geometry.STATUS_CLASS_NOT_FOUND, self.target_class_id)}"
+        if status is not None:
+            _remove(paths)
+            return [("", status)] * len(self.specs)
+
+        written = iter(paths)
+        return [(next(written), "OK") if spec.ratio is not None else ("", FREE_RATIO_STATUS) for spec in self.specs]
@@ -0,0 +1,492 @@
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import struct
+import argparse
+import threading
+
+from batch_cli import build_specs, parse_class_ids, resolve_model
+from crop_logic import (DEFAULT_BATCH_SIZE, IMAGE_EXTS, AICropper, InstanceOptions, detect_settings,
+                        predict_settings)
+from detectors import detector_signature
+from encoder import Encoder, EncodeOptions
+from manifest import RunManifest, settings_key
+from metrics import StageMetrics
+from pipeline import CropPipeline
+
+# ==========================================
+# Watch Folder (โหมด daemon: crop รูปใหม่ที่ถูกวางลง hot folder ทันทีที่เขียนเสร็จ)
+# ==========================================
+# ตัวอย่าง:
+#   python watch_folder.py D:/hotfolder -o D:/out --model "General(yolov8n)" --ratio 4:5
+#   python watch_folder.py /srv/incoming -o /srv/crops -r --settle 2 --batch-window-ms 500
+#
+# - Linux ใช้ inotify (ผ่าน ctypes ไม่ต้องลงอะไรเพิ่ม) ระบบอื่น / share ที่ inotify ใช้ไม่ได้ -> scan ทุก --poll-interval
+# - ไฟล์จะถูกอ่านเมื่อขนาด/mtime ไม่เปลี่ยนนาน --settle วินาที (copy ผ่าน network / โปรแกรมที่เขียนทีละก้อน)
+# - ไฟล์ที่พร้อมพร้อมกันเข้า predict ครั้งเดียว (สูงสุด --max-batch รูป) ถ้ายังมีไฟล์ที่กำลังเขียนอยู่
+#   จะรอให้มันเสร็จมารวม batch ได้นานสุด --batch-window-ms
+# - โหลดโมเดล + warm-up ครั้งเดียวตอนเริ่ม แล้วค้างไว้ตลอด
+# - ผลของแต่ละไฟล์บันทึกลง manifest ใน output folder (เหมือน batch_cli): เปิดใหม่จะ list folder
+#   เทียบกับ manifest (stat อย่างเดียว) แล้วทำเฉพาะไฟล์ที่มาใหม่/เปลี่ยนระหว่างที่ปิดอยู่
+
+DEFAULT_SETTLE_S = 1.0
+DEFAULT_BATCH_WINDOW_MS = 500
+DEFAULT_POLL_S = 2.0
+DEFAULT_MAX_BATCH = 16
+
+# ทุกกี่วินาทีจะเช็คไฟล์ที่ยังรอเขียนเสร็จ / batch ที่รออยู่
+_TICK = 0.1
+# ไม่มีอะไรรอ: ตื่นมาเช็คคำสั่งหยุดทุกกี่วินาที
+_IDLE = 1.0
+
+
+def _norm(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _excluded(folder, exclude):
+    # exclude = path ที่ normalize แล้วและลงท้ายด้วย separator
+    return bool(exclude) and os.path.join(_norm(folder), "").startswith(exclude)
+
+
+def _wanted(name, exts):
+    # ไฟล์ซ่อน / ไฟล์ชั่วคราวของโปรแกรมที่เขียนแล้ว rename (".x.jpg.tmp", "~x.jpg") ไม่ใช่ input
+    return name.lower().endswith(exts) and not name.startswith(('.', '~'))
+
+
+def scan(folders, recursive, exts, exclude=None):
+    """คืนค่า dict path -> (size, mtime_ns) ของรูปทั้งหมดใน folders (ไม่รวมที่อยู่ใต้ exclude)"""
+    found = {}
+    stack = [os.path.abspath(f) for f in folders]
+    while stack:
+        folder = stack.pop()
+        if _excluded(folder, exclude):
+            continue
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                elif entry.is_file() and _wanted(entry.name, exts):
+                    st = entry.stat()
+                    found[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+    return found
+
+
+class PollingWatcher:
+    """scan folder ทุก interval วินาทีแล้วเทียบกับรอบก่อน (ใช้ได้ทุกระบบ รวมถึง network share)"""
+    name = "polling"
+
+    def __init__(self, folders, recursive, exts, exclude=None, interval=DEFAULT_POLL_S, snapshot=None):
+        self.folders = folders
+        self.recursive = recursive
+        self.exts = exts
+        self.exclude = exclude
+        self.interval = max(0.1, float(interval))
+        self._snapshot = snapshot if snapshot is not None else scan(folders, recursive, exts, exclude)
+        self._next = time.monotonic() + self.interval
+
+    def wait(self, timeout):
+        """รอได้ไม่เกิน timeout วินาที คืนค่า list ของไฟล์ที่เพิ่ม/เปลี่ยนตั้งแต่ครั้งก่อน"""
+        delay = self._next - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, delay))
+        self._next = time.monotonic() + self.interval
+        current = scan(self.folders, self.recursive, self.exts, self.exclude)
+        changed = [p for p, sig in current.items() if self._snapshot.get(p) != sig]
+        self._snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    inotify ของ Linux ผ่าน libc (ctypes) ได้ event ทันทีที่ไฟล์ถูกสร้าง / เขียนเสร็จ / ถูก move เข้ามา
+    recursive: folder ที่สร้างใหม่จะถูก watch เพิ่มให้เอง
+    สร้างไม่ได้ (ไม่ใช่ Linux / เกิน max_user_watches) -> OSError ให้คนเรียกไปใช้ PollingWatcher แทน
+    """
+    name = "inotify"
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, folders, recursive, exts, exclude=None):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._ctypes = ctypes
+        self.folders = folders
+        self.recursive = recursive
+        self.exts = exts
+        self.exclude = exclude
+        self._dirs = {}
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            for folder in folders:
+                self._add_tree(os.path.abspath(folder))
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, folder):
+        if _excluded(folder, self.exclude):
+            return False
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), self._MASK)
+        if wd < 0:
+            err = self._ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached (fs.inotify.max_user_watches)")
+            # folder หายไปก่อนจะ watch ทัน -> ข้าม
+            return False
+        self._dirs[wd] = folder
+        return True
+
+    def _add_tree(self, folder):
+        if not self._add_watch(folder) or not self.recursive:
+            return
+        for root, dirs, _ in os.walk(folder):
+            for d in list(dirs):
+                if not self._add_watch(os.path.join(root, d)):
+                    dirs.remove(d)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # event หล่นไปบางส่วน: scan ใหม่ทั้งหมด (ไฟล์ที่ทำแล้วถูก manifest กรองออก)
+                changed.update(scan(self.folders, self.recursive, self.exts, self.exclude))
+                continue
+            if mask & self.IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            folder = self._dirs.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & self.IN_ISDIR:
+                if self.recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # รูปอาจถูกเขียนลง folder ใหม่ก่อนที่จะ watch ทัน
+                    self._add_tree(path)
+                    changed.update(scan([path], True, self.exts, self.exclude))
+            elif _wanted(name, self.exts):
+                changed.add(path)
+        return list(changed)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class StabilityTracker:
+    """
+    ไฟล์ที่รอเขียนเสร็จ: พร้อมเมื่อขนาด/mtime เท่าเดิมติดกันนาน settle วินาที (และไม่ใช่ไฟล์ว่าง)
+    ทุก ready() จะ stat เฉพาะไฟล์ที่รออยู่ ไม่ scan ทั้ง folder
+    """
+
+    def __init__(self, settle_s=DEFAULT_SETTLE_S):
+        self.settle_s = max(0.0, float(settle_s))
+        # path -> [size, mtime_ns, เวลาที่เห็นค่านี้ครั้งแรก, เวลาที่เห็นไฟล์ครั้งแรก]
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, path, now=None):
+        now = time.monotonic() if now is None else now
+        entry = self._pending.get(path)
+        if entry is None:
+            self._pending[path] = [None, None, now, now]
+        else:
+            # มี event ใหม่ = ยังเขียนอยู่ นับ settle ใหม่
+            entry[2] = now
+
+    def ready(self, now=None):
+        """คืนค่า list ของ (path, เวลาที่เห็นครั้งแรก) ที่เขียนเสร็จแล้ว (เอาออกจากรายการรอ)"""
+        now = time.monotonic() if now is None else now
+        out = []
+        for path, entry in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # ถูกลบ / ถูก rename ออกไประหว่างรอ
+                del self._pending[path]
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            if sig != (entry[0], entry[1]):
+                entry[0], entry[1], entry[2] = sig[0], sig[1], now
+                continue
+            if st.st_size > 0 and now - entry[2] >= self.settle_s and self._readable(path):
+                del self._pending[path]
+                out.append((path, entry[3]))
+        return out
+
+    @staticmethod
+    def _readable(path):
+        # Windows: โปรแกรมที่ยังเขียนอยู่มักล็อกไฟล์ไว้ เปิดไม่ได้ = ยังไม่เสร็จ
+        try:
+            with open(path, 'rb'):
+                return True
+        except OSError:
+            return False
+
+
+class FolderWatcher:
+    """
+    วนรับไฟล์จาก watcher -> รอเขียนเสร็จ -> รวม batch -> CropPipeline (cropper ตัวเดิมตลอด)
+    stop() เรียกจาก thread / signal handler ได้ (batch ที่กำลังทำอยู่จะทำจนเสร็จ)
+    """
+
+    def __init__(self, cropper, folders, output_dir, specs, target_class_id, manifest, encoder=None, instances=None,
+                 recursive=False, settle_s=DEFAULT_SETTLE_S, batch_window_ms=DEFAULT_BATCH_WINDOW_MS,
+                 max_batch=DEFAULT_MAX_BATCH, poll=False, poll_interval=DEFAULT_POLL_S, metrics_file=None):
+        self.cropper = cropper
+        self.folders = [os.path.abspath(f) for f in folders]
+        self.output_dir = output_dir
+        self.specs = specs
+        self.target_class_id = target_class_id
+        self.manifest = manifest
+        self.encoder = encoder or Encoder()
+        self.instances = instances
+        self.recursive = recursive
+        self.batch_window_s = max(0.0, batch_window_ms / 1000.0)
+        self.max_batch = max(1, int(max_batch))
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.metrics_file = metrics_file
+        self.tracker = StabilityTracker(settle_s)
+        # output อยู่ใน folder ที่ watch -> ไม่ต้อง crop ไฟล์ที่ตัวเองเขียน
+        self._exclude = os.path.join(_norm(output_dir), "")
+        self._stop = threading.Event()
+        self.totals = {"ok": 0, "failed": 0, "skipped": 0, "batches": 0}
+
+    def stop(self):
+        self._stop.set()
+
+    def catch_up(self):
+        """
+        ไฟล์ที่มาระหว่างที่ปิดอยู่: list folder ครั้งเดียว ไฟล์ที่ manifest บอกว่าทำแล้วข้ามไป (stat อย่างเดียว)
+        คืนค่า snapshot ของ folder (ให้ PollingWatcher ใช้เป็นรอบแรก)
+        """
+        snapshot = scan(self.folders, self.recursive, IMAGE_EXTS, self._exclude)
+        todo, done = self.manifest.filter(sorted(snapshot))
+        self.totals["skipped"] += len(done)
+        for path in todo:
+            self.tracker.add(path)
+        print(f"Resume    : {len(done)} already done, {len(todo)} to process")
+        return snapshot
+
+    def _open_watcher(self):
+        """inotify ถ้าได้ (None = ใช้ polling หลัง catch up)"""
+        if self.poll:
+            return None
+        try:
+            return InotifyWatcher(self.folders, self.recursive, IMAGE_EXTS, self._exclude)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), polling every {self.poll_interval:g}s")
+            return None
+
+    def run(self):
+        # เริ่ม inotify ก่อน scan: ไฟล์ที่มาระหว่าง scan อาจถูกเห็น 2 ครั้ง แต่ไม่หล่น (ครั้งที่ 2 manifest กรองออก)
+        watcher = self._open_watcher()
+        snapshot = self.catch_up()
+        if watcher is None:
+            watcher = PollingWatcher(self.folders, self.recursive, IMAGE_EXTS, self._exclude, self.poll_interval,
+                                     snapshot)
+        print(f"Watching  : {', '.join(self.folders)} ({watcher.name}{', recursive' if self.recursive else ''})")
+        batch, batch_since = [], None
+        try:
+            while not self._stop.is_set():
+                busy = batch or len(self.tracker)
+                now = time.monotonic()
+                for path in watcher.wait(_TICK if busy else _IDLE):
+                    self.tracker.add(path, now)
+
+                now = time.monotonic()
+                ready = self.tracker.ready(now)
+                if ready and not batch:
+                    batch_since = now
+                batch.extend(ready)
+                if batch and (len(batch) >= self.max_batch or now - batch_since >= self.batch_window_s
+                              or not len(self.tracker)):
+                    self._process(batch[:self.max_batch])
+                    batch = batch[self.max_batch:]
+                    batch_since = now
+        finally:
+            watcher.close()
+            # ไฟล์ที่พร้อมแล้วแต่ยังไม่ได้ทำ -> ทำให้เสร็จก่อนออก (ที่ยังเขียนไม่เสร็จ รอบหน้าจะถูกหาเจอตอน catch up)
+            while batch:
+                self._process(batch[:self.max_batch])
+                batch = batch[self.max_batch:]
+
+    def _process(self, batch):
+        paths = [path for path, _ in batch]
+        start = time.perf_counter()
+        pipeline = CropPipeline(self.cropper, self.output_dir, self.specs[0].ratio, self.specs[0].padding,
+                                self.target_class_id, batch_size=self.max_batch, specs=self.specs,
+                                manifest=self.manifest, encoder=self.encoder, instances=self.instances)
+        failures = []
+
+        def on_result(file_path, outputs):
+            failures.extend(f"{os.path.basename(file_path)}: {status}" for _, status in outputs if status != "OK")
+
+        stats = pipeline.run(paths, on_result=on_result)
+        elapsed = time.perf_counter() - start
+        # เวลาตั้งแต่เห็นไฟล์ครั้งแรกจนเขียน crop เสร็จ (รวม settle + รอ batch)
+        latency = time.monotonic() - min(seen for _, seen in batch)
+        for key in ("ok", "failed", "skipped"):
+            self.totals[key] += stats[key]
+        self.totals["batches"] += 1
+
+        print(f"[{time.strftime('%H:%M:%S')}] {len(paths)} file(s): {stats['ok']} ok, {stats['failed']} failed"
+              + (f", {stats['skipped']} unchanged" if stats["skipped"] else "")
+              + f" | {elapsed:.2f}s | arrival -> crop {latency:.1f}s", flush=True)
+        for line in failures:
+            print(f"  - {line}")
+        if self.cropper.metrics is not None and self.metrics_file:
+            self.cropper.metrics.write(self.metrics_file)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AI Smart Crop - watch folder daemon")
+    parser.add_argument("folders", nargs="+", help="Folders to watch")
+    parser.add_argument("-o", "--output", required=True, help="Output folder (also holds the resume manifest)")
+    parser.add_argument("--model", default=None, help="Model name from config/models_list.json or a .pt path (default: first entry)")
+    parser.add_argument("--backend", choices=("torch", "onnx"), default=None)
+    parser.add_argument("--device", default=None, help="cpu, cuda, cuda:1 ... (default: auto)")
+    parser.add_argument("--class-id", default="0", help="Target class id, or a comma list like 0,16 (default: 0)")
+    parser.add_argument("--conf", type=float, default=None, help="Minimum detection confidence (default: model default 0.25)")
+    parser.add_argument("--max-det", type=int, default=None, help="Max detections per image (default: 300)")
+    parser.add_argument("--all-instances", action="store_true",
+                        help="Write every matching instance as <name>_<class>_<idx> instead of only the largest one")
+    parser.add_argument("--top-k", type=int, default=0, help="With --all-instances: keep only the first K (default: all)")
+    parser.add_argument("--rank", choices=("area", "conf"), default="area")
+    parser.add_argument("--ratio", default="3:4", help="Ratio name from RATIO_MAP, 'w:h', a number, or 'free' (default: 3:4)")
+    parser.add_argument("--padding", type=int, default=15, help="Padding percent (default: 15)")
+    parser.add_argument("--variant", action="append", default=None, metavar="RATIO[,PAD[,SUBFOLDER[,SUFFIX]]]",
+                        help="Extra output format, repeatable (overrides --ratio)")
+    parser.add_argument("--format", choices=("keep", "jpeg", "png", "webp"), default="keep")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG/WebP quality 1-100 (default: 95)")
+    parser.add_argument("--png-compression", type=int, default=1, help="PNG compression 0-9 (default: 1, fast)")
+    parser.add_argument("--max-dim", type=int, default=0, help="Downscale crops whose long side exceeds this (default: off)")
+    parser.add_argument("--no-copy", action="store_true", help="Always re-encode, even when the crop covers the whole image")
+    parser.add_argument("--reduced-decode", action="store_true",
+                        help="Detect on a reduced-size JPEG decode, crop from full-resolution pixels")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Watch subfolders too")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_S,
+                        help="Seconds a file's size and mtime must stay unchanged before it is read (default: 1)")
+    parser.add_argument("--batch-window-ms", type=float, default=DEFAULT_BATCH_WINDOW_MS,
+                        help="Once a file is ready, wait up to this long for files still being written to join "
+                             "its predict call (default: 500)")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help=f"Most images per predict call (default: {DEFAULT_MAX_BATCH})")
+    parser.add_argument("--poll", action="store_true", help="Scan the folders periodically instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_S,
+                        help="Seconds between scans when polling (default: 2)")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-process inputs that failed before")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Write per-stage timings and outcome counters here after every batch "
+                             "(.prom/.txt = Prometheus text format, otherwise JSON)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        model_path, backend = resolve_model(args.model)
+        backend = args.backend or backend
+        specs = build_specs(args)
+        class_id = parse_class_ids(args.class_id)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    missing = [f for f in args.folders if not os.path.isdir(f)]
+    if missing:
+        print(f"Error: not a folder: {', '.join(missing)}")
+        return 2
+    if _norm(args.output) in {_norm(f) for f in args.folders}:
+        # crop จะถูกเขียนชื่อเดียวกับต้นฉบับทับไฟล์ที่ watch อยู่
+        print("Error: the output folder cannot be a watched folder (use a subfolder or another folder)")
+        return 2
+
+    predict_args = predict_settings(class_id, args.conf, args.max_det)
+    instances = InstanceOptions(max(0, args.top_k), args.rank) if args.all_instances else None
+    encode_options = EncodeOptions(args.format, args.quality, args.png_compression, args.max_dim, not args.no_copy)
+    # key เดียวกับ batch_cli / GUI: folder ที่เคยรัน batch ไปแล้วไม่ต้องทำซ้ำ
+    key = settings_key(detector_signature(model_path, backend), detect_settings(predict_args, args.reduced_decode),
+                       specs, class_id, encode_options, instances)
+    # ไม่ hash ไฟล์ที่ mtime เปลี่ยน (rsync / copy ทับ) ตอน catch up: ถือว่าเปลี่ยนแล้ว crop ใหม่
+    manifest = RunManifest(args.output, key, retry_failed=args.retry_failed, hash_changed=False)
+
+    cropper = AICropper(model_path, batch_size=max(args.max_batch, DEFAULT_BATCH_SIZE), device=args.device,
+                        reduced_decode=args.reduced_decode, backend=backend)
+    cropper.configure(reduced_decode=args.reduced_decode, predict_args=predict_args,
+                      metrics=StageMetrics() if args.metrics_file else None)
+    # โมเดลค้างอยู่ใน memory ตลอด: warm-up ครั้งเดียวให้ไฟล์แรกไม่ต้องรอ
+    cropper.warmup()
+    print(cropper.timing_text())
+
+    watcher = FolderWatcher(cropper, args.folders, args.output, specs, class_id, manifest, Encoder(encode_options),
+                            instances, args.recursive, args.settle, args.batch_window_ms, args.max_batch,
+                            args.poll, args.poll_interval, args.metrics_file)
+
+    # Ctrl+C / kill (SIGTERM จาก systemd): ทำ batch ที่ค้างอยู่ให้เสร็จแล้วค่อยออก
+    def on_signal(signum, frame):
+        watcher.stop()
+
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_signal)
+
+    try:
+        watcher.run()
+    finally:
+        manifest.close()
+    t = watcher.totals
+    print(f"Stopped   : {t['ok']} ok, {t['failed']} failed in {t['batches']} batch(es), {t['skipped']} already done")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())